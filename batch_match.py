@@ -0,0 +1,221 @@
+"""
+Headless batch matching without the GUI stack.
+
+Rides and requests are read from JSONL or CSV files (by extension; "-" is
+stdin as JSONL) with one flat record per line:
+
+  rides:    id, driver_id, driver_name, start_point, end_point, start_lat,
+            start_lng, end_lat, end_lng, departure_time (ISO 8601),
+            max_detour_min, available_seats, trip_type, route_distance (km),
+            route_duration (min)
+  requests: id, rider_id, rider_name, start_point, end_point, start_lat,
+            start_lng, end_lat, end_lng, desired_arrival_time (ISO 8601),
+            time_flexibility_min, trip_type
+
+Timestamps with a UTC offset are converted to naive local time, the
+convention of the rest of the application. ids, names, trip_type and
+the route fields are optional; rides without a
+route are routed with the configured backend. Requests are loaded as the
+matching pool, rides are streamed in chunks and every chunk's matches are
+written as JSONL as soon as they are scored, followed by the global
+assignment:
+
+  python batch_match.py rides.jsonl requests.csv -o matches.jsonl
+"""
+import argparse
+import csv
+import json
+import sys
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from models.data_models import User, Coordinates, Ride, RideRequest, TripType
+from services.assignment import build_candidates, plan_assignment
+from services.matching import compute_matches
+from services.geometry_store import store_route
+from services.routing import calculate_route
+from utils.metrics import start_exporters
+
+def read_records(path: str) -> Iterator[Dict]:
+    """
+    Yield one dict per CSV row or non-empty JSONL line.
+    """
+    if path == "-":
+        yield from _jsonl(sys.stdin)
+        return
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            yield from csv.DictReader(f)
+        else:
+            yield from _jsonl(f)
+
+def parse_time(value: str) -> datetime:
+    """
+    Parse an ISO 8601 timestamp as naive local time.
+    """
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+def parse_trip_type(value) -> Optional[TripType]:
+    """
+    Accept enum names ("OUTBOUND") or values ("Hinfahrt"); empty means any.
+    """
+    if not value:
+        return None
+    if value in TripType.__members__:
+        return TripType[value]
+    return TripType(value)
+
+def ride_from_record(record: Dict, users: Dict[str, User]) -> Ride:
+    driver = _user(users, record.get('driver_id'), record.get('driver_name'), is_driver=True)
+    ride = Ride(
+        driver=driver,
+        start_point=record.get('start_point', ''),
+        end_point=record.get('end_point', ''),
+        start_coords=Coordinates(lat=float(record['start_lat']), lng=float(record['start_lng'])),
+        end_coords=Coordinates(lat=float(record['end_lat']), lng=float(record['end_lng'])),
+        departure_time=parse_time(record['departure_time']),
+        max_detour_min=int(record['max_detour_min']),
+        available_seats=int(record['available_seats']),
+        trip_type=parse_trip_type(record.get('trip_type')) or TripType.OUTBOUND,
+        route_distance=float(record.get('route_distance') or 0),
+        route_duration=float(record.get('route_duration') or 0)
+    )
+    if record.get('id'):
+        ride.id = record['id']
+    return ride
+
+def request_from_record(record: Dict, users: Dict[str, User]) -> RideRequest:
+    rider = _user(users, record.get('rider_id'), record.get('rider_name'), is_driver=False)
+    request = rider.request_ride(
+        start_point=record.get('start_point', ''),
+        end_point=record.get('end_point', ''),
+        start_coords=Coordinates(lat=float(record['start_lat']), lng=float(record['start_lng'])),
+        end_coords=Coordinates(lat=float(record['end_lat']), lng=float(record['end_lng'])),
+        desired_arrival_time=parse_time(record['desired_arrival_time']),
+        time_flexibility_min=int(record['time_flexibility_min']),
+        trip_type=parse_trip_type(record.get('trip_type'))
+    )
+    if record.get('id'):
+        request.id = record['id']
+    return request
+
+def ensure_route(ride: Ride) -> bool:
+    """
+    Fill in the base route of a ride that came without one, as main.py
+    does; False if no route was found.
+    """
+    if ride.route_duration > 0:
+        return True
+    route = calculate_route(ride.start_coords, ride.end_coords, ride.departure_time)
+    if not route:
+        return False
+    distance, duration, polyline = route
+    ride.route_distance = distance / 1000
+    ride.route_duration = duration / 60
+    ride.route_polyline = store_route(polyline)
+    return True
+
+def run(rides: Iterable[Ride], requests: List[RideRequest], out: TextIO,
+        chunk_size: int = 200, method: Optional[str] = "auto",
+        max_workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Match rides chunk by chunk against the request pool, streaming match
+    records to out, then solve and write the assignment unless method is
+    None. Returns summary counts.
+    """
+    summary = {'rides': 0, 'unrouted': 0, 'matches': 0, 'assignments': 0}
+    candidates = []
+    routed_rides: Dict[str, Ride] = {}
+    rides = iter(rides)
+    while True:
+        chunk = list(islice(rides, chunk_size))
+        if not chunk:
+            break
+        summary['rides'] += len(chunk)
+        routed = [ride for ride in chunk if ensure_route(ride)]
+        summary['unrouted'] += len(chunk) - len(routed)
+
+        matches = compute_matches(routed, requests, max_workers)
+        for ride in routed:
+            for entry in matches.get(ride.id, []):
+                _write(out, {
+                    'type': 'match',
+                    'ride_id': ride.id,
+                    'request_id': entry['request'].id,
+                    'score': entry['score'],
+                    'detour_min': entry['details']['detour_time'],
+                    'distance_increase_km': entry['details']['distance_increase']
+                })
+                summary['matches'] += 1
+        out.flush()
+        if method:
+            candidates.extend(build_candidates(matches))
+            routed_rides.update((ride.id, ride) for ride in routed)
+
+    if method:
+        scores = {(ride_id, request_id): score for ride_id, request_id, score in candidates}
+        requests_by_id = {request.id: request for request in requests}
+        plan = plan_assignment(candidates, routed_rides, requests_by_id, method)
+        for ride_id, assigned in plan.items():
+            for request in assigned:
+                _write(out, {
+                    'type': 'assignment',
+                    'ride_id': ride_id,
+                    'request_id': request.id,
+                    'score': scores[(ride_id, request.id)]
+                })
+                summary['assignments'] += 1
+        out.flush()
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Match rides and ride requests without the GUI.")
+    parser.add_argument('rides', help="rides as .jsonl or .csv ('-' for JSONL on stdin)")
+    parser.add_argument('requests', help="ride requests as .jsonl or .csv")
+    parser.add_argument('-o', '--output', default='-', help="JSONL output file (default: stdout)")
+    parser.add_argument('--chunk-size', type=int, default=200, help="rides matched per batch")
+    parser.add_argument('--assign', default='auto', choices=['auto', 'flow', 'auction', 'greedy', 'none'],
+                        help="global assignment method, or 'none' for matches only")
+    parser.add_argument('--workers', type=int, default=None, help="parallel routing requests")
+    args = parser.parse_args(argv)
+    start_exporters()
+
+    users: Dict[str, User] = {}
+    requests = [request_from_record(record, users) for record in read_records(args.requests)]
+    rides = (ride_from_record(record, users) for record in read_records(args.rides))
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        summary = run(rides, requests, out, args.chunk_size,
+                      None if args.assign == 'none' else args.assign, args.workers)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{summary['rides']} rides ({summary['unrouted']} without route), "
+          f"{len(requests)} requests: {summary['matches']} matches, "
+          f"{summary['assignments']} assignments", file=sys.stderr)
+    return 0
+
+def _jsonl(lines: Iterable[str]) -> Iterator[Dict]:
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+def _write(out: TextIO, record: Dict):
+    out.write(json.dumps(record) + "\n")
+
+def _user(users: Dict[str, User], user_id: Optional[str], name: Optional[str], is_driver: bool) -> User:
+    if not user_id:
+        return User(id='', name=name or '', is_driver=is_driver, is_rider=not is_driver,
+                    residential_area=('', (0.0, 0.0)))
+    if user_id not in users:
+        users[user_id] = User(id=user_id, name=name or user_id, is_driver=is_driver,
+                              is_rider=not is_driver, residential_area=('', (0.0, 0.0)))
+    return users[user_id]
+
+if __name__ == "__main__":
+    sys.exit(main())
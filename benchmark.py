@@ -0,0 +1,140 @@
+"""
+Matching benchmark on seeded synthetic scenarios.
+
+Generates the Stuttgart commute scenario at several sizes, routes it with
+a deterministic offline backend and times base routes, compute_matches and
+the global assignment. Results (wall time per stage, routing calls, pairs
+evaluated/pruned, peak memory) are written to JSON so runs of different
+versions can be compared:
+
+  python benchmark.py --sizes 50,1000,10000 -o benchmark_results.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from services.assignment import assign_all
+from services.matching import compute_matches
+from services.routing import set_routing_backend
+from utils.scenario import SyntheticRoutingBackend, compute_base_routes, generate_scenario
+
+SIZES = (50, 1_000, 10_000, 100_000)
+# 100k users is hours of pure-Python pair checks; run it explicitly
+DEFAULT_SIZES = SIZES[:3]
+
+def run_benchmark(users: int, seed: int = 0, assignment: Optional[str] = "auto",
+                  max_workers: Optional[int] = None, trace_memory: bool = True) -> Dict:
+    """
+    Run one scenario size through every matching stage and return its metrics.
+    """
+    backend = SyntheticRoutingBackend()
+    set_routing_backend(backend)
+    if trace_memory:
+        tracemalloc.start()
+    timings = {}
+    try:
+        started = time.perf_counter()
+        scenario = generate_scenario(users, seed)
+        timings['generate_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        compute_base_routes(scenario.rides, backend)
+        timings['base_routes_s'] = time.perf_counter() - started
+
+        stats: Dict[str, int] = {}
+        started = time.perf_counter()
+        matches = compute_matches(scenario.rides, scenario.requests, max_workers, stats=stats)
+        timings['matching_s'] = time.perf_counter() - started
+
+        assigned = None
+        if assignment:
+            started = time.perf_counter()
+            plan = assign_all(scenario.rides, scenario.requests, matches, assignment, apply=False)
+            timings['assignment_s'] = time.perf_counter() - started
+            assigned = sum(len(requests) for requests in plan.values())
+
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20 if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        set_routing_backend(None)
+
+    return {
+        'users': users,
+        'seed': seed,
+        'rides': len(scenario.rides),
+        'requests': len(scenario.requests),
+        'timings': timings,
+        'total_s': sum(timings.values()),
+        'routing_calls': dict(backend.calls),
+        'pairs_total': stats.get('pairs_total', 0),
+        'pairs_evaluated': stats.get('pairs_evaluated', 0),
+        'pairs_pruned': stats.get('pairs_total', 0) - stats.get('pairs_evaluated', 0),
+        'matches': sum(len(entries) for entries in matches.values()),
+        'assigned': assigned,
+        'peak_traced_mb': peak_mb,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+def run_suite(sizes: Sequence[int], seed: int = 0, **options) -> Dict:
+    results = []
+    for users in sizes:
+        result = run_benchmark(users, seed, **options)
+        print(f"{users:>7} users: {result['total_s']:8.2f} s, "
+              f"{result['pairs_evaluated']} of {result['pairs_total']} pairs evaluated, "
+              f"{sum(v for k, v in result['routing_calls'].items() if k != 'matrix_elements')} routing calls",
+              file=sys.stderr)
+        results.append(result)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'version': _git_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark matching on synthetic scenarios.")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help=f"comma-separated user counts, e.g. {','.join(str(size) for size in SIZES)}")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--assign', default='auto', choices=['auto', 'flow', 'auction', 'greedy', 'none'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-trace-memory', action='store_true',
+                        help="skip tracemalloc, which slows large runs; peak RSS is still reported")
+    parser.add_argument('-o', '--output', default='benchmark_results.json')
+    args = parser.parse_args(argv)
+
+    report = run_suite(
+        [int(size) for size in args.sizes.split(',')], args.seed,
+        assignment=None if args.assign == 'none' else args.assign,
+        max_workers=args.workers, trace_memory=not args.no_trace_memory
+    )
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return 0
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+def _git_version() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,15 +9,77 @@ load_dotenv(BASE_DIR / '.env')
 class Settings:
     def __init__(self):
         self.GMAPS_API_KEY = os.getenv("GMAPS_API_KEY")
+        self.ROUTING_BACKEND = os.getenv("ROUTING_BACKEND", "google")  # "google" or "local"
+        self.ROAD_GRAPH_PATH = Path(os.getenv("ROAD_GRAPH_PATH", BASE_DIR / 'data' / 'stuttgart_roads.json.gz'))
+        # Flat float32 file holding every ride's route (plus <path>.idx); None keeps encoded polylines on the rides
+        self.GEOMETRY_STORE_PATH = Path(os.environ["GEOMETRY_STORE_PATH"]) if os.getenv("GEOMETRY_STORE_PATH") else None
+        # Record every routing response of a run, or replay a recording offline
+        self.ROUTING_CASSETTE_MODE = os.getenv("ROUTING_CASSETTE_MODE") or None  # None, "record" or "replay"
+        self.ROUTING_CASSETTE_PATH = Path(os.getenv("ROUTING_CASSETTE_PATH", BASE_DIR / 'data' / 'routing_cassette.json.gz'))
+        self.ROUTING_CASSETTE_LATENCY = os.getenv("ROUTING_CASSETTE_LATENCY") or None  # seconds per call or "recorded"
+        # Seeds the demo scenario in main.py so a recorded run can be replayed
+        self.SCENARIO_SEED = int(os.environ["SCENARIO_SEED"]) if os.getenv("SCENARIO_SEED") else None
         self.RESIDENTIAL_AREA_RADIUS = 10_000  # in meters (10 km)
         self.DESTINATION_RADIUS = 2_000        # in meters (2 km)
         self.MAX_DETOUR_MIN = 30               # in minutes
         self.TIME_FLEXIBILITY_MIN = 30         # in minutes
 
+        # Geometric pre-filter applied before any Directions request
+        self.MAX_PICKUP_DISTANCE = 20_000      # in meters, driver start -> rider pickup
+        self.MAX_DROPOFF_DISTANCE = 20_000     # in meters, rider dropoff -> driver end
+        self.MAX_ROAD_SPEED_KMH = 130          # upper bound for straight-line travel time
+        self.SPATIAL_CELL_SIZE_M = 2_000       # in meters, grid cell of the pickup index
+        self.CORRIDOR_WIDTH_M = 8_000          # in meters, pickup/dropoff distance from the driver's route; None disables
+        self.CORRIDOR_SIMPLIFY_M = 50          # in meters, route simplification tolerance, added to the width
+
+        # Directions response cache shared by route and detour calculation
+        self.ROUTE_CACHE_PATH = BASE_DIR / 'route_cache.sqlite'
+        self.ROUTE_CACHE_MEMORY_SIZE = 1_024   # hot in-memory entries
+        self.ROUTE_CACHE_MAX_ENTRIES = 50_000  # rows kept on disk
+        self.ROUTE_CACHE_TTL_S = 7 * 24 * 3600 # in seconds (1 week)
+        self.ROUTE_CACHE_COORD_PRECISION = 4   # decimal places (~11 m)
+        self.ROUTE_CACHE_TIME_BUCKET_MIN = 15  # in minutes
+
+        # "matrix": derive detours from batched travel-time matrices,
+        # "directions": one full route request per ride/request pair
+        self.DETOUR_MODE = "matrix"
+
+        # Concurrent detour evaluation and Directions API quota
+        self.MATCHING_MAX_WORKERS = 8          # parallel detour requests
+        self.DIRECTIONS_QPS = 40               # requests per second
+        self.DIRECTIONS_BURST = 10             # token bucket capacity
+        self.DIRECTIONS_MAX_RETRIES = 3        # on transport errors / OVER_QUERY_LIMIT
+        self.DIRECTIONS_BACKOFF_S = 0.5        # in seconds, doubled per retry
+
+        # Global ride assignment
+        self.ASSIGNMENT_EXACT_MAX_EDGES = 1_000   # ~0.1 s exact; larger instances use the auction solver
+        self.ASSIGNMENT_AUCTION_EPSILON = 1e-3    # score units, bounds the optimality gap per rider
+
+        # Shared keep-alive HTTP session for the routing client
+        self.ROUTING_POOL_SIZE = 10            # pooled connections
+        self.ROUTING_CONNECT_TIMEOUT_S = 5     # in seconds
+        self.ROUTING_READ_TIMEOUT_S = 15       # in seconds
+
+        # Rendered ride maps kept for revisiting rides
+        self.MAP_CACHE_MAX_BYTES = 32 * 2 ** 20  # in bytes (32 MB)
+
+        # Routes are drawn simplified to what is visible at the zoom that
+        # fits the ride into the map, plus some levels of zooming in
+        self.MAP_VIEWPORT_PX = 800             # in pixels, map size assumed for the fitted zoom
+        self.MAP_DETAIL_ZOOMS = 2              # zoom levels beyond the fitted one without visible error
+        self.MAP_SIMPLIFY_PX = 1.0             # in pixels, simplification tolerance at that zoom
+
+        # Hot-path timings and counters (utils.metrics); off unless enabled
+        self.METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+        self.METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH") or None  # JSON written at exit
+        self.METRICS_PORT = int(os.environ["METRICS_PORT"]) if os.getenv("METRICS_PORT") else None  # Prometheus /metrics
+
         self._validate()
 
     def _validate(self):
-        if not self.GMAPS_API_KEY:
+        if self.ROUTING_CASSETTE_MODE not in (None, "record", "replay"):
+            raise ValueError("ROUTING_CASSETTE_MODE must be 'record' or 'replay'.")
+        if self.ROUTING_BACKEND == "google" and self.ROUTING_CASSETTE_MODE != "replay" and not self.GMAPS_API_KEY:
             raise ValueError("Environment variable 'GMAPS_API_KEY' is missing. Please check your .env file.")
 
 # Erstelle ein Singleton-Settings-Objekt
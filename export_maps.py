@@ -0,0 +1,218 @@
+"""
+Offline export of the day's plan as static maps.
+
+Renders every ride's map (route through its accepted riders, start, end
+and pickup markers, as in the window) plus an index page into a
+directory. Rides, requests and assignments are read in batch_match's
+formats, e.g. its JSONL output as the assignments:
+
+  python export_maps.py rides.jsonl requests.csv --assignments matches.jsonl -o maps/
+
+Routes are resolved in this process; the folium rendering runs on a
+process pool. Files are replaced atomically, and a manifest records each
+ride's state so later runs only re-render rides whose route or riders
+changed (--full renders everything). Maps drawn with the ride's own
+route because the route through its riders failed are rendered again
+on the next run.
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import batch_match
+from config.settings import settings
+from models.data_models import Ride, RideRequest, TripType
+from services.matching import calculate_assigned_route
+from ui.map_cache import ride_state_key
+from ui.map_render import render_ride_map
+
+MANIFEST = "manifest.json"
+# Bump when the map layout changes so incremental runs re-render everything
+RENDER_VERSION = 1
+
+def ride_filename(ride: Ride) -> str:
+    return "ride-" + re.sub(r"[^A-Za-z0-9_-]", "_", ride.id) + ".html"
+
+def ride_digest(ride: Ride) -> str:
+    """
+    Stable fingerprint of everything a ride's exported map shows.
+    """
+    ride_id, polyline, riders, trip_type = ride_state_key(ride)
+    state = [RENDER_VERSION, ride_id, polyline, sorted(riders), trip_type.name if trip_type else None,
+             ride.start_point, ride.end_point, ride.driver.name,
+             sorted(request.rider.name for request in ride.matched_riders)]
+    return hashlib.sha1(json.dumps(state).encode('utf-8')).hexdigest()
+
+def write_atomic(path: Path, text: str):
+    """
+    Write text next to path and move it into place, so readers never see
+    a partial file.
+    """
+    fd, partial = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".partial")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+
+def export_maps(rides: Sequence[Ride], out_dir: Path, incremental: bool = True,
+                max_workers: Optional[int] = None) -> Dict[str, int]:
+    """
+    Render the map of every ride and the index page into out_dir. With
+    incremental, rides whose digest matches the manifest of the previous
+    export are skipped. Maps of rides no longer present are deleted either
+    way. Returns counts of rendered, skipped and removed maps.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST
+    previous: Dict[str, Dict] = {}
+    if manifest_path.exists():
+        previous = json.loads(manifest_path.read_text(encoding='utf-8'))['rides']
+
+    digests = {ride.id: ride_digest(ride) for ride in rides}
+    stale = [
+        ride for ride in rides
+        if not incremental
+        or previous.get(ride.id, {}).get('digest') != digests[ride.id]
+        or not (out_dir / ride_filename(ride)).exists()
+    ]
+
+    # Routing is I/O bound and shares the backend's cache, so it stays on
+    # threads here; only the CPU-bound rendering goes to other processes
+    with ThreadPoolExecutor(max_workers=settings.MATCHING_MAX_WORKERS) as pool:
+        displayed = list(pool.map(_display_polyline, stale))
+    jobs = [
+        (ride, polyline, list(ride.matched_riders), str(out_dir / ride_filename(ride)))
+        for ride, (polyline, _) in zip(stale, displayed)
+    ]
+    # No digest for fallback maps, so the next run renders them again
+    for ride, (_, fallback) in zip(stale, displayed):
+        if fallback:
+            digests[ride.id] = None
+    if jobs:
+        if max_workers == 1 or len(jobs) == 1:
+            for job in jobs:
+                _render_to_file(job)
+        else:
+            workers = max_workers or os.cpu_count() or 1
+            # A few chunks per process balance load without pickling per ride
+            chunksize = max(1, len(jobs) // (4 * workers))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_render_to_file, jobs, chunksize=chunksize))
+
+    current = {ride.id for ride in rides}
+    removed = 0
+    for ride_id, entry in previous.items():
+        if ride_id not in current:
+            (out_dir / entry['file']).unlink(missing_ok=True)
+            removed += 1
+
+    write_atomic(out_dir / "index.html", render_index(rides))
+    write_atomic(manifest_path, json.dumps({
+        'version': RENDER_VERSION,
+        'rides': {ride.id: {'digest': digests[ride.id], 'file': ride_filename(ride)} for ride in rides},
+    }, indent=1))
+    return {'rendered': len(jobs), 'skipped': len(rides) - len(jobs), 'removed': removed}
+
+def render_index(rides: Iterable[Ride]) -> str:
+    """
+    Overview page linking every ride's map, ordered by departure.
+    """
+    rows = []
+    for ride in sorted(rides, key=lambda ride: (ride.departure_time, ride.driver.name)):
+        trip = "Hinfahrt" if ride.trip_type == TripType.OUTBOUND else "Rückfahrt"
+        riders = ", ".join(html.escape(request.rider.name) for request in ride.matched_riders) or "–"
+        rows.append(
+            f"<tr><td>{ride.departure_time.strftime('%H:%M')}</td>"
+            f"<td><a href=\"{ride_filename(ride)}\">{html.escape(ride.driver.name)}</a></td>"
+            f"<td>{trip}</td><td>{html.escape(ride.start_point)} → {html.escape(ride.end_point)}</td>"
+            f"<td>{len(ride.matched_riders)}/{ride.available_seats}</td><td>{riders}</td></tr>"
+        )
+    return f"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Fahrgemeinschaften</title>
+<style>
+  body {{ font-family: Arial; color: #333; margin: 20px; }}
+  table {{ border-collapse: collapse; }}
+  th, td {{ border-bottom: 1px solid #ddd; padding: 6px 10px; text-align: left; }}
+</style></head>
+<body>
+<h2>Tunisische Fahrgemeinschaften Stuttgart</h2>
+<p>Stand: {time.strftime('%d.%m.%Y %H:%M')}</p>
+<table>
+<tr><th>Abfahrt</th><th>Fahrer</th><th>Fahrt</th><th>Strecke</th><th>Plätze</th><th>Mitfahrer</th></tr>
+{chr(10).join(rows)}
+</table>
+</body>
+</html>
+"""
+
+def apply_assignments(records: Iterable[Dict], rides: Dict[str, Ride],
+                      requests: Dict[str, RideRequest]) -> int:
+    """
+    Accept the 'assignment' records of a batch_match output; returns how
+    many were applied.
+    """
+    applied = 0
+    for record in records:
+        if record.get('type', 'assignment') != 'assignment':
+            continue
+        ride, request = rides.get(record['ride_id']), requests.get(record['request_id'])
+        if ride and request and not request.matched_ride:
+            request.accept_match(ride)
+            applied += 1
+    return applied
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export every ride's map and an index page.")
+    parser.add_argument('rides', help="rides as .jsonl or .csv")
+    parser.add_argument('requests', help="ride requests as .jsonl or .csv")
+    parser.add_argument('--assignments', help="batch_match output or other JSONL/CSV with ride_id, request_id")
+    parser.add_argument('-o', '--output', default='maps', help="output directory")
+    parser.add_argument('--full', action='store_true', help="re-render every ride")
+    parser.add_argument('--workers', type=int, default=None, help="rendering processes")
+    args = parser.parse_args(argv)
+
+    users = {}
+    requests = {request.id: request for request in
+                (batch_match.request_from_record(record, users) for record in batch_match.read_records(args.requests))}
+    rides = [batch_match.ride_from_record(record, users) for record in batch_match.read_records(args.rides)]
+    routed = [ride for ride in rides if batch_match.ensure_route(ride)]
+    if args.assignments:
+        apply_assignments(batch_match.read_records(args.assignments), {ride.id: ride for ride in routed}, requests)
+
+    started = time.perf_counter()
+    summary = export_maps(routed, Path(args.output), incremental=not args.full, max_workers=args.workers)
+    print(f"{summary['rendered']} maps rendered, {summary['skipped']} unchanged, "
+          f"{summary['removed']} removed in {time.perf_counter() - started:.1f} s "
+          f"({len(rides) - len(routed)} rides without route)", file=sys.stderr)
+    return 0
+
+def _display_polyline(ride: Ride) -> Tuple[Optional[Sequence[Tuple[float, float]]], bool]:
+    # The window shows the route through the accepted riders if there are
+    # any; True marks the fallback to the ride's own route
+    if ride.matched_riders:
+        assigned_route = calculate_assigned_route(ride)
+        if assigned_route:
+            return assigned_route.polyline, False
+        return ride.route_polyline, True
+    return ride.route_polyline, False
+
+def _render_to_file(job: Tuple[Ride, Optional[Sequence[Tuple[float, float]]], List[RideRequest], str]):
+    ride, polyline, riders, path = job
+    write_atomic(Path(path), render_ride_map(ride, polyline, riders))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,6 @@
 import random
-import uuid
 from datetime import datetime, time, timedelta
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from models.data_models import (
     User, Coordinates, Ride, RideRequest, 
     RideTemplate, WeeklyCommute, ScheduleRule, TripType
@@ -10,71 +9,40 @@ from utils.helpers import (
     haversine_distance, generate_residential_coords,
     generate_destination_coords, get_future_departure_time
 )
+from services.geometry_store import store_route
 from services.routing import calculate_route
-from ui.main_window import CarpoolWindow
-from PyQt5.QtWidgets import QApplication
+from config.settings import settings
+from utils.scenario import (
+    FIRST_NAMES, LAST_NAMES, RESIDENTIAL_AREAS, SCENARIO_DATE, WORKPLACES, seeded_uuid
+)
+from utils.metrics import start_exporters
 import sys
 
-def test_stuttgart_roundtrip_scenario():
+def test_stuttgart_roundtrip_scenario(seed: Optional[int] = None):
     """
-    Generate a test scenario for Stuttgart carpooling.
+    Generate a test scenario for Stuttgart carpooling. With a seed, or
+    settings.SCENARIO_SEED, every id, coordinate and time comes from it
+    and the day is the fixed SCENARIO_DATE, so runs can be recorded and
+    replayed; otherwise the scenario is random and for today.
     """
     print("Stuttgart Round-Trip Scenario (50 Persons)...")
+    if seed is None:
+        seed = settings.SCENARIO_SEED
+    rng = random.Random(seed)
+    now = SCENARIO_DATE if seed is not None else datetime.now()
     
+    residential_areas = list(RESIDENTIAL_AREAS)
+    workplaces = list(WORKPLACES)
+    first_names = list(FIRST_NAMES)
+    last_names = list(LAST_NAMES)
+
     if not first_names or not last_names:
         raise ValueError("Name lists cannot be empty")
     if len(residential_areas) < 1 or len(workplaces) < 1:
         raise ValueError("At least one residential area and workplace must be defined")
-    
-    stuttgart_center = (48.7758, 9.1829)
-    mercedes_unterturkheim = (48.7833, 9.2250)
-    stihl_werk2 = (48.8316, 9.3100)
-    
-    residential_areas = [
-        ("Böblingen", (48.6833, 9.0167)),
-        ("Stuttgart West", (48.7500, 9.1500)),
-        ("Schwäbisch Gmünd", (48.8000, 9.8000)),
-        ("Ludwigsburg", (48.8973, 9.1922)),
-        ("Esslingen", (48.7400, 9.3000)),
-        ("Waiblingen", (48.8316, 9.3167)),
-        ("Sindelfingen", (48.7000, 9.0167)),
-        ("Leonberg", (48.8000, 9.0167)),
-        ("Fellbach", (48.8167, 9.2833)),
-        ("Backnang", (48.9472, 9.4306)),
-        ("Herrenberg", (48.5951, 8.8662)),
-        ("Pforzheim", (48.8913, 8.6989)),
-        ("Reutlingen", (48.4912, 9.2113)),
-        ("Tübingen", (48.5200, 9.0500)),
-        ("Aalen", (48.8378, 10.0933)),
-        ("Heidenheim", (48.6778, 10.1516)),
-        ("Göppingen", (48.7035, 9.6538)),
-        ("Nürtingen", (48.6257, 9.3420)),
-        ("Kirchheim unter Teck", (48.6468, 9.4538)),
-        ("Schorndorf", (48.8054, 9.5272))
-    ]
-    
-    workplaces = [
-        ("Mercedes Werk Untertürkheim", mercedes_unterturkheim),
-        ("Stihl Werk 2, Waiblingen", stihl_werk2)
-    ]
-
-    first_names = [
-        "Mohamed", "Fatma", "Ali", "Mariem", "Ahmed", "Amina", "Mahmoud", "Houda", "Youssef", "Samira",
-        "Hassan", "Nadia", "Omar", "Leila", "Khalil", "Salwa", "Adel", "Amira", "Tarek", "Rania",
-        "Bassem", "Sana", "Wassim", "Yosra", "Nabil", "Hajer", "Karim", "Soumaya", "Fares", "Manel"
-    ]
-
-    last_names = [
-        "Ben Ammar", "Trabelsi", "Bouzid", "Chaabane", "Gharbi", 
-        "Haddad", "Jlassi", "Karray", "Mansouri", "Nasri",
-        "Ouertani", "Saadi", "Zaoui", "Abid", "Cherif",
-        "Dridi", "Essid", "Fersi", "Ghanmi", "Hamdi",
-        "Khalifa", "Laroussi", "Maalej", "Najar", "Rebai",
-        "Sassi", "Tlili", "Zoghlami", "Baccar", "Dhieb"
-    ]
         
-    random.shuffle(first_names)
-    random.shuffle(last_names)
+    rng.shuffle(first_names)
+    rng.shuffle(last_names)
     
     users = []
     for i in range(50):
@@ -82,9 +50,9 @@ def test_stuttgart_roundtrip_scenario():
         last = last_names[i % len(last_names)]
         name = f"{first} {last}"
         is_driver = i < 25
-        residential_area = random.choice(residential_areas)
+        residential_area = rng.choice(residential_areas)
         users.append(User(
-            id=str(uuid.uuid4()),
+            id=seeded_uuid(rng),
             name=name,
             is_driver=is_driver,
             is_rider=not is_driver,
@@ -94,10 +62,10 @@ def test_stuttgart_roundtrip_scenario():
     templates = []
     for driver in users[:25]:
         area_name, area_coords = driver.residential_area
-        workplace_name, workplace_coords = random.choice(workplaces)
+        workplace_name, workplace_coords = rng.choice(workplaces)
         
-        home_coords = generate_residential_coords(area_name, area_coords)[1]
-        work_coords = generate_destination_coords(workplace_coords)
+        home_coords = generate_residential_coords(area_name, area_coords, rng)[1]
+        work_coords = generate_destination_coords(workplace_coords, rng)
         
         schedule = WeeklyCommute(
             outbound_rules=[
@@ -120,28 +88,35 @@ def test_stuttgart_roundtrip_scenario():
             outbound_end_coords=work_coords,
             return_start_coords=work_coords,
             return_end_coords=home_coords,
-            max_detour_min=random.randint(15, 30),
-            available_seats=random.randint(2, 4),
+            max_detour_min=rng.randint(15, 30),
+            available_seats=rng.randint(2, 4),
             schedule=schedule
         )
         templates.append(template)
 
     today_rides = []
     for template in templates:
-        today_rides.extend(template.generate_daily_rides())
+        today_rides.extend(template.generate_daily_rides(now.date()))
+    for ride in today_rides:
+        ride.id = seeded_uuid(rng)
     
     valid_rides = []
     for ride in today_rides:
-        if calculate_route(ride):
+        route = calculate_route(ride.start_coords, ride.end_coords, ride.departure_time)
+        if route:
+            distance, duration, polyline = route
+            ride.route_distance = distance / 1000
+            ride.route_duration = duration / 60
+            ride.route_polyline = store_route(polyline)
             valid_rides.append(ride)
 
     ride_requests = []
     for rider in users[25:]:
         area_name, area_coords = rider.residential_area
-        workplace_name, workplace_coords = random.choice(workplaces)
+        workplace_name, workplace_coords = rng.choice(workplaces)
         
-        home_coords = generate_residential_coords(area_name, area_coords)[1]
-        work_coords = generate_destination_coords(workplace_coords)
+        home_coords = generate_residential_coords(area_name, area_coords, rng)[1]
+        work_coords = generate_destination_coords(workplace_coords, rng)
         
         for trip_type in [TripType.OUTBOUND, TripType.RETURN]:
             start_point = area_name if trip_type == TripType.OUTBOUND else workplace_name
@@ -149,9 +124,9 @@ def test_stuttgart_roundtrip_scenario():
             start_coords = home_coords if trip_type == TripType.OUTBOUND else work_coords
             end_coords = work_coords if trip_type == TripType.OUTBOUND else home_coords
             
-            minutes = random.randint(0, 120)
+            minutes = rng.randint(0, 120)
             arrival_time = get_future_departure_time(
-                f"{7 if trip_type == TripType.OUTBOUND else 16 + minutes // 60}:{minutes % 60:02d}"
+                f"{7 if trip_type == TripType.OUTBOUND else 16 + minutes // 60}:{minutes % 60:02d}", now
             )
             
             request = rider.request_ride(
@@ -160,9 +135,11 @@ def test_stuttgart_roundtrip_scenario():
                 start_coords=start_coords,
                 end_coords=end_coords,
                 desired_arrival_time=arrival_time,
-                time_flexibility_min=random.randint(30, 60)
+                time_flexibility_min=rng.randint(30, 60),
+                trip_type=trip_type
             )
             if request:
+                request.id = seeded_uuid(rng)
                 ride_requests.append(request)
 
     print(f"\nGenerated {len(valid_rides)} valid rides (outbound and return)")
@@ -171,6 +148,10 @@ def test_stuttgart_roundtrip_scenario():
     return valid_rides, ride_requests
 
 if __name__ == "__main__":
+    from PyQt5.QtWidgets import QApplication
+    from ui.main_window import CarpoolWindow
+
+    start_exporters()
     app = QApplication(sys.argv)
     rides, requests = test_stuttgart_roundtrip_scenario()
     window = CarpoolWindow(rides, requests)
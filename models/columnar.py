@@ -0,0 +1,402 @@
+import uuid
+from datetime import datetime, timedelta, tzinfo
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Optional, TypeVar
+
+import numpy as np
+
+from models.data_models import Coordinates, Ride, RideRequest, TripType, User
+from utils.polyline import Polyline
+
+# Datetimes are stored as whole seconds since this instant; naive ones as
+# if they were UTC, aware ones converted to UTC
+EPOCH = datetime(1970, 1, 1)
+
+TRIP_TYPE_CODES = {None: 0, TripType.OUTBOUND: 1, TripType.RETURN: 2}
+TRIP_TYPES = {code: trip_type for trip_type, code in TRIP_TYPE_CODES.items()}
+
+V = TypeVar('V')
+
+def _uuid_bytes(item_id: str) -> Optional[bytes]:
+    """
+    The 16 raw bytes of a canonical uuid string, None for any other id.
+    """
+    try:
+        parsed = uuid.UUID(item_id)
+    except ValueError:
+        return None
+    # Only canonical strings can be rebuilt from the bytes
+    return parsed.bytes if str(parsed) == item_id else None
+
+def epoch_seconds(moment: datetime) -> float:
+    """
+    Seconds since EPOCH. Only comparable between datetimes that are all
+    naive or all offset-aware, as the datetimes themselves.
+    """
+    if moment.tzinfo is not None:
+        return moment.timestamp()
+    return (moment - EPOCH).total_seconds()
+
+def to_epoch(moment: datetime) -> int:
+    return int(epoch_seconds(moment))
+
+def from_epoch(seconds, tzinfo: Optional[tzinfo] = None) -> datetime:
+    """
+    Inverse of to_epoch: naive, or aware in tzinfo if given.
+    """
+    if tzinfo is not None:
+        return datetime.fromtimestamp(int(seconds), tzinfo)
+    return EPOCH + timedelta(seconds=int(seconds))
+
+class _ColumnStore(Generic[V]):
+    """
+    Growable set of NumPy columns, one row per record. Columns listed in
+    COLUMNS are exposed as attributes trimmed to the current size, e.g.
+    store.start_lat; object-valued fields (people, labels, polylines) are
+    kept in OBJECTS as Python references or interned label codes.
+    """
+
+    COLUMNS: Dict[str, Any] = {}
+    OBJECTS: tuple = ()
+    VIEW: type = None
+
+    def __init__(self, capacity: int = 64):
+        self._size = 0
+        self._data = {name: np.zeros(capacity, dtype) for name, dtype in self.COLUMNS.items()}
+        self._objects: Dict[str, List] = {name: [] for name in self.OBJECTS}
+        self._labels: List[str] = []
+        self._label_codes: Dict[str, int] = {}
+        self._order: Optional[np.ndarray] = None
+        # Ids that are not uuid strings, e.g. from imported files, by row
+        self._named_ids: Dict[int, str] = {}
+        self._named_rows: Dict[str, int] = {}
+        # Time zone the views return times in, taken from the first row;
+        # rows must be all naive or all aware
+        self.tzinfo: Optional[tzinfo] = None
+        self._aware: Optional[bool] = None
+
+    @classmethod
+    def from_objects(cls, items: Iterable) -> '_ColumnStore':
+        store = cls()
+        store.extend(items)
+        store.compact()
+        return store
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        data = self.__dict__.get('_data')
+        if data is not None and name in data:
+            return data[name][:self._size]
+        raise AttributeError(name)
+
+    def __getitem__(self, row: int) -> V:
+        if not -self._size <= row < self._size:
+            raise IndexError(row)
+        return self.VIEW(self, row % self._size)
+
+    def __iter__(self) -> Iterator[V]:
+        return (self.VIEW(self, row) for row in range(self._size))
+
+    def row_of(self, item_id: str) -> int:
+        """
+        Row of an id, by binary search over the sorted id column.
+        """
+        if item_id in self._named_rows:
+            return self._named_rows[item_id]
+        key = _uuid_bytes(item_id)
+        if key is None:
+            raise KeyError(item_id)
+        if self._order is None:
+            self._order = np.argsort(self.id, kind='stable')
+            self._sorted_ids = self.id[self._order]
+        ids = self._sorted_ids
+        key = np.array(key, dtype='S16')
+        pos = int(np.searchsorted(ids, key))
+        if pos == len(ids) or ids[pos] != key:
+            raise KeyError(item_id)
+        return int(self._order[pos])
+
+    def append(self, item) -> int:
+        """
+        Copy an object into a new row and return its index.
+        """
+        return self._add_row(item.id, *self._row_values(item))
+
+    def update(self, row: int, item):
+        """
+        Overwrite a row with the current values of its object, e.g. after
+        its route or match changed.
+        """
+        values, objects = self._row_values(item)
+        for name, value in values.items():
+            self._data[name][row] = value
+        for name, value in objects.items():
+            self._objects[name][row] = value
+
+    def extend(self, items: Iterable):
+        for item in items:
+            self.append(item)
+
+    def compact(self):
+        """
+        Release the spare capacity kept for appends.
+        """
+        for name, column in self._data.items():
+            self._data[name] = column[:max(self._size, 1)].copy()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the NumPy columns and reference lists.
+        """
+        return (sum(column.nbytes for column in self._data.values())
+                + sum(8 * len(refs) for refs in self._objects.values())
+                + 8 * len(self._named_ids))
+
+    def _add_row(self, item_id: str, values: Dict[str, Any], objects: Dict[str, Any]) -> int:
+        # uuid4 ids are kept as their 16 raw bytes, others by reference
+        encoded = _uuid_bytes(item_id)
+        if self._size == len(self._data['id']):
+            for name, column in self._data.items():
+                self._data[name] = np.resize(column, 2 * len(column))
+        row = self._size
+        if encoded is None:
+            self._named_ids[row] = item_id
+            self._named_rows[item_id] = row
+            encoded = b''
+        self._data['id'][row] = encoded
+        for name, value in values.items():
+            self._data[name][row] = value
+        for name, value in objects.items():
+            self._objects[name].append(value)
+        self._order = None
+        self._size += 1
+        return row
+
+    @property
+    def aware(self) -> Optional[bool]:
+        """
+        Whether the stored times are offset-aware; None while empty.
+        """
+        return self._aware
+
+    def _note_tzinfo(self, moment: datetime):
+        aware = moment.tzinfo is not None
+        if self._aware is None:
+            self._aware = aware
+            self.tzinfo = moment.tzinfo
+        elif aware != self._aware:
+            raise TypeError("can't mix offset-naive and offset-aware datetimes in one store")
+
+    def _label(self, text: str) -> int:
+        code = self._label_codes.get(text)
+        if code is None:
+            code = self._label_codes[text] = len(self._labels)
+            self._labels.append(text)
+        return code
+
+class _View:
+    """
+    Read-only proxy for one store row with the attribute names of the
+    model class it stands for. Values are decoded on access.
+    """
+
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, store: _ColumnStore, row: int):
+        self._store = store
+        self._row = row
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and other._store is self._store and other._row == self._row
+
+    def __hash__(self) -> int:
+        return hash((id(self._store), self._row))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(id={self.id!r})"
+
+    @property
+    def id(self) -> str:
+        named = self._store._named_ids.get(self._row)
+        if named is not None:
+            return named
+        # NumPy drops trailing zero bytes of fixed-size byte strings
+        return str(uuid.UUID(bytes=self._store._data['id'][self._row].ljust(16, b'\0')))
+
+    @property
+    def start_point(self) -> str:
+        return self._store._labels[self._store._data['start_point'][self._row]]
+
+    @property
+    def end_point(self) -> str:
+        return self._store._labels[self._store._data['end_point'][self._row]]
+
+    @property
+    def start_coords(self) -> Coordinates:
+        data = self._store._data
+        return Coordinates(lat=float(data['start_lat'][self._row]), lng=float(data['start_lng'][self._row]))
+
+    @property
+    def end_coords(self) -> Coordinates:
+        data = self._store._data
+        return Coordinates(lat=float(data['end_lat'][self._row]), lng=float(data['end_lng'][self._row]))
+
+    @property
+    def trip_type(self) -> Optional[TripType]:
+        return TRIP_TYPES[int(self._store._data['trip_type'][self._row])]
+
+_ENDPOINT_COLUMNS = {
+    'id': 'S16',
+    'start_point': np.int32,
+    'end_point': np.int32,
+    'start_lat': np.float64,
+    'start_lng': np.float64,
+    'end_lat': np.float64,
+    'end_lng': np.float64,
+    'trip_type': np.int8,
+}
+
+class RequestView(_View):
+    __slots__ = ()
+
+    @property
+    def rider(self) -> User:
+        return self._store._objects['rider'][self._row]
+
+    @property
+    def desired_arrival_time(self) -> datetime:
+        return from_epoch(self._store._data['desired_arrival'][self._row], self._store.tzinfo)
+
+    @property
+    def time_flexibility_min(self) -> int:
+        return int(self._store._data['time_flexibility_min'][self._row])
+
+    @property
+    def matched_ride(self):
+        return self._store._objects['matched_ride'][self._row]
+
+class RequestStore(_ColumnStore[RequestView]):
+    """
+    Columnar ride requests: ids, pickup/dropoff coordinates, arrival
+    windows as epoch seconds and trip type codes in NumPy arrays, riders
+    and matched rides as references. Indexing yields RequestView objects
+    with the RideRequest attributes.
+    """
+
+    COLUMNS = {
+        **_ENDPOINT_COLUMNS,
+        'desired_arrival': np.int64,
+        'time_flexibility_min': np.int16,
+        'matched': np.bool_,
+    }
+    OBJECTS = ('rider', 'matched_ride')
+    VIEW = RequestView
+
+    def _row_values(self, request: RideRequest):
+        self._note_tzinfo(request.desired_arrival_time)
+        return {
+            'start_point': self._label(request.start_point),
+            'end_point': self._label(request.end_point),
+            'start_lat': request.start_coords.lat,
+            'start_lng': request.start_coords.lng,
+            'end_lat': request.end_coords.lat,
+            'end_lng': request.end_coords.lng,
+            'trip_type': TRIP_TYPE_CODES[request.trip_type],
+            'desired_arrival': to_epoch(request.desired_arrival_time),
+            'time_flexibility_min': request.time_flexibility_min,
+            'matched': request.matched_ride is not None,
+        }, {'rider': request.rider, 'matched_ride': request.matched_ride}
+
+    def set_matched(self, row: int, ride):
+        self._objects['matched_ride'][row] = ride
+        self._data['matched'][row] = ride is not None
+
+    def arrival_windows(self):
+        """
+        Earliest and latest acceptable arrival per request, in epoch seconds.
+        """
+        flex = self.time_flexibility_min.astype(np.int64) * 60
+        return self.desired_arrival - flex, self.desired_arrival + flex
+
+class RideView(_View):
+    __slots__ = ()
+
+    @property
+    def driver(self) -> User:
+        return self._store._objects['driver'][self._row]
+
+    @property
+    def departure_time(self) -> datetime:
+        return from_epoch(self._store._data['departure'][self._row], self._store.tzinfo)
+
+    @property
+    def max_detour_min(self) -> int:
+        return int(self._store._data['max_detour_min'][self._row])
+
+    @property
+    def available_seats(self) -> int:
+        return int(self._store._data['available_seats'][self._row])
+
+    @property
+    def route_distance(self) -> float:
+        return float(self._store._data['route_distance'][self._row])
+
+    @property
+    def route_duration(self) -> float:
+        return float(self._store._data['route_duration'][self._row])
+
+    @property
+    def route_polyline(self) -> Polyline:
+        return self._store._objects['route_polyline'][self._row]
+
+    @property
+    def matched_riders(self) -> List:
+        return self._store._objects['matched_riders'][self._row]
+
+class RideStore(_ColumnStore[RideView]):
+    """
+    Columnar rides: ids, endpoints, departure as epoch seconds, detour
+    limit, seats and base route distance (km) and duration (min) in NumPy
+    arrays; drivers, polylines and rider lists as references. Indexing
+    yields RideView objects with the Ride attributes.
+    """
+
+    COLUMNS = {
+        **_ENDPOINT_COLUMNS,
+        'departure': np.int64,
+        'max_detour_min': np.int32,
+        'available_seats': np.int16,
+        'route_distance': np.float64,
+        'route_duration': np.float64,
+    }
+    OBJECTS = ('driver', 'route_polyline', 'matched_riders')
+    VIEW = RideView
+
+    def _row_values(self, ride: Ride):
+        # The polyline and rider list are shared with the ride, not copied
+        self._note_tzinfo(ride.departure_time)
+        return {
+            'start_point': self._label(ride.start_point),
+            'end_point': self._label(ride.end_point),
+            'start_lat': ride.start_coords.lat,
+            'start_lng': ride.start_coords.lng,
+            'end_lat': ride.end_coords.lat,
+            'end_lng': ride.end_coords.lng,
+            'trip_type': TRIP_TYPE_CODES[ride.trip_type],
+            'departure': to_epoch(ride.departure_time),
+            'max_detour_min': ride.max_detour_min,
+            'available_seats': ride.available_seats,
+            'route_distance': ride.route_distance,
+            'route_duration': ride.route_duration,
+        }, {
+            'driver': ride.driver,
+            'route_polyline': ride.route_polyline,
+            'matched_riders': ride.matched_riders,
+        }
+
+    def free_seats(self) -> np.ndarray:
+        taken = np.fromiter((len(riders) for riders in self._objects['matched_riders']),
+                            dtype=np.int16, count=self._size)
+        return self.available_seats - taken
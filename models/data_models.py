@@ -1,18 +1,43 @@
-from dataclasses import dataclass
+import uuid
+from dataclasses import dataclass, field
 from datetime import datetime, time, date
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 from enum import Enum, auto
 
+from utils.polyline import Polyline
+
 class TripType(Enum):
     OUTBOUND = "Hinfahrt"  # To work
     RETURN = "Rückfahrt"   # To home
 
-@dataclass
+# Called as listener(ride, request, matched) whenever a rider joins or leaves a ride
+MatchListener = Callable[['Ride', 'RideRequest', bool], None]
+_match_listeners: List[MatchListener] = []
+
+def add_match_listener(listener: MatchListener):
+    """
+    Register a callback for accept_match / remove_rider events.
+    """
+    if listener not in _match_listeners:
+        _match_listeners.append(listener)
+
+def remove_match_listener(listener: MatchListener):
+    """
+    Unregister a callback added with add_match_listener.
+    """
+    if listener in _match_listeners:
+        _match_listeners.remove(listener)
+
+def _notify_match_changed(ride: 'Ride', request: 'RideRequest', matched: bool):
+    for listener in list(_match_listeners):
+        listener(ride, request, matched)
+
+@dataclass(frozen=True, slots=True)
 class Coordinates:
     lat: float
     lng: float
 
-@dataclass
+@dataclass(slots=True)
 class User:
     id: str
     name: str
@@ -22,7 +47,8 @@ class User:
 
     def request_ride(self, start_point: str, end_point: str, start_coords: Coordinates,
                     end_coords: Coordinates, desired_arrival_time: datetime,
-                    time_flexibility_min: int) -> Optional['RideRequest']:
+                    time_flexibility_min: int,
+                    trip_type: Optional[TripType] = None) -> Optional['RideRequest']:
         """
         Create a ride request for this user.
         """
@@ -33,7 +59,8 @@ class User:
             start_coords=start_coords,
             end_coords=end_coords,
             desired_arrival_time=desired_arrival_time,
-            time_flexibility_min=time_flexibility_min
+            time_flexibility_min=time_flexibility_min,
+            trip_type=trip_type
         )
 
 @dataclass
@@ -48,12 +75,12 @@ class WeeklyCommute:
     outbound_rules: List[ScheduleRule]
     return_rules: List[ScheduleRule]
     
-    def get_todays_rides(self, template: 'RideTemplate') -> List['Ride']:
+    def get_todays_rides(self, template: 'RideTemplate', day: Optional[date] = None) -> List['Ride']:
         """
-        Generate rides for today based on the schedule.
+        Generate rides for today, or for day, based on the schedule.
         """
-        today_weekday = datetime.now().weekday()
-        today_date = datetime.now().date()
+        today_date = day or datetime.now().date()
+        today_weekday = today_date.weekday()
         
         rides = []
         for rule in self.outbound_rules:
@@ -116,13 +143,13 @@ class RideTemplate:
                 trip_type=trip_type
             )
     
-    def generate_daily_rides(self) -> List['Ride']:
+    def generate_daily_rides(self, day: Optional[date] = None) -> List['Ride']:
         """
-        Generate all rides for today based on the schedule.
+        Generate all rides for today, or for day, based on the schedule.
         """
-        return self.schedule.get_todays_rides(self)
+        return self.schedule.get_todays_rides(self, day)
 
-@dataclass
+@dataclass(slots=True)
 class Ride:
     driver: User
     start_point: str
@@ -135,12 +162,14 @@ class Ride:
     trip_type: TripType = TripType.OUTBOUND
     route_distance: float = 0.0
     route_duration: float = 0.0
-    route_polyline: List[Tuple[float, float]] = None
+    # A Polyline or a services.geometry_store reference; (lat, lng)
+    # sequences are encoded on construction
+    route_polyline: Polyline = None
     matched_riders: List['RideRequest'] = None
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
     
     def __post_init__(self):
-        if self.route_polyline is None:
-            self.route_polyline = []
+        self.route_polyline = Polyline.coerce(self.route_polyline)
         if self.matched_riders is None:
             self.matched_riders = []
 
@@ -150,8 +179,11 @@ class Ride:
         """
         if request in self.matched_riders:
             self.matched_riders.remove(request)
+            if request.matched_ride is self:
+                request.matched_ride = None
+            _notify_match_changed(self, request, False)
 
-@dataclass
+@dataclass(slots=True)
 class RideRequest:
     rider: User
     start_point: str
@@ -161,10 +193,13 @@ class RideRequest:
     desired_arrival_time: datetime
     time_flexibility_min: int
     matched_ride: Optional[Ride] = None
+    trip_type: Optional[TripType] = None
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
     
     def accept_match(self, ride: Ride):
         """
         Accept a match with a ride.
         """
         self.matched_ride = ride
-        ride.matched_riders.append(self)
\ No newline at end of file
+        ride.matched_riders.append(self)
+        _notify_match_changed(ride, self, True)
\ No newline at end of file
@@ -0,0 +1,275 @@
+import heapq
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config.settings import settings
+from models.data_models import Ride, RideRequest
+from services.travel_matrix import LegTable
+from services.vehicle_routing import fill_ride_legs, plan_ride
+
+# (ride id, request id, score)
+Candidate = Tuple[str, str, float]
+
+# Integer cost scale for min-cost flow; +1 per match prefers more riders on ties
+SCORE_SCALE = 1_000_000
+
+def build_candidates(matches: Dict[str, List[Dict]]) -> List[Candidate]:
+    """
+    Flatten a compute_matches / MatchIndex matrix into candidate edges.
+    """
+    return [
+        (ride_id, entry['request'].id, entry['score'])
+        for ride_id, entries in matches.items()
+        for entry in entries
+    ]
+
+def free_seats(rides: Sequence[Ride]) -> Dict[str, int]:
+    return {
+        ride.id: max(0, ride.available_seats - len(ride.matched_riders))
+        for ride in rides
+    }
+
+def solve_assignment(candidates: Sequence[Candidate], capacities: Dict[str, int],
+                     method: str = "auto") -> Dict[str, str]:
+    """
+    Assign each request to at most one ride without exceeding ride
+    capacities, maximizing the total score. Returns request id -> ride id.
+
+    method is "flow" (exact min-cost flow), "auction" (epsilon-optimal,
+    fast on large sparse instances), "greedy" (best score first) or "auto",
+    which uses the exact solver up to settings.ASSIGNMENT_EXACT_MAX_EDGES.
+    """
+    candidates = [c for c in candidates if capacities.get(c[0], 0) > 0]
+    if method == "auto":
+        method = "flow" if len(candidates) <= settings.ASSIGNMENT_EXACT_MAX_EDGES else "auction"
+    if method == "flow":
+        return _solve_min_cost_flow(candidates, capacities)
+    if method == "auction":
+        return _solve_auction(candidates, capacities, settings.ASSIGNMENT_AUCTION_EPSILON)
+    if method == "greedy":
+        return _solve_greedy(candidates, capacities)
+    raise ValueError(f"Unknown assignment method: {method}")
+
+def assign_all(rides: Sequence[Ride], requests: Sequence[RideRequest],
+               matches: Dict[str, List[Dict]], method: str = "auto",
+               apply: bool = True) -> Dict[str, List[RideRequest]]:
+    """
+    Solve the assignment over a match matrix and return the plan as
+    ride id -> newly assigned requests, checked by plan_assignment. With
+    apply=True every assignment is committed through
+    RideRequest.accept_match.
+    """
+    rides_by_id = {ride.id: ride for ride in rides}
+    requests_by_id = {request.id: request for request in requests if not request.matched_ride}
+    candidates = [
+        c for c in build_candidates(matches)
+        if c[0] in rides_by_id and c[1] in requests_by_id
+    ]
+    plan = plan_assignment(candidates, rides_by_id, requests_by_id, method)
+    if apply:
+        for ride_id, assigned in plan.items():
+            for request in assigned:
+                request.accept_match(rides_by_id[ride_id])
+    return plan
+
+def plan_assignment(candidates: Sequence[Candidate], rides: Dict[str, Ride],
+                    requests: Dict[str, RideRequest], method: str = "auto") -> Dict[str, List[RideRequest]]:
+    """
+    Solve the assignment and keep only what the ride can actually drive.
+    Candidate scores are per rider against the ride as it is, so the riders
+    given to one ride are added one at a time, best score first, through
+    plan_ride with every rider's window and the detour limit enforced. A
+    rider that breaks the plan loses that edge, and the solver runs again,
+    but only for what a rejection changed: the seats left free on the rides
+    that rejected someone and the rejected riders. Returns ride id ->
+    requests.
+    """
+    plan: Dict[str, List[RideRequest]] = {}
+    scores = {(c[0], c[1]): c[2] for c in candidates}
+    assigned = set()
+    rejected = set()
+    # None in the first round, which solves everything
+    focus_rides: Optional[set] = None
+    focus_requests: Optional[set] = None
+    while True:
+        open_candidates = [
+            c for c in candidates
+            if c[1] not in assigned and (c[0], c[1]) not in rejected
+            and (focus_rides is None or c[0] in focus_rides or c[1] in focus_requests)
+        ]
+        capacities = {
+            ride_id: seats - len(plan.get(ride_id, []))
+            for ride_id, seats in free_seats(rides.values()).items()
+        }
+        solution = solve_assignment(open_candidates, capacities, method)
+        if not solution:
+            return plan
+
+        by_ride: Dict[str, List[str]] = {}
+        for request_id, ride_id in solution.items():
+            by_ride.setdefault(ride_id, []).append(request_id)
+        focus_rides, focus_requests = set(), set()
+        for ride_id, request_ids in by_ride.items():
+            ride = rides[ride_id]
+            accepted = plan.setdefault(ride_id, [])
+            table = LegTable()
+            fill_ride_legs(ride, [*ride.matched_riders, *accepted, *(requests[r] for r in request_ids)], table)
+            for request_id in sorted(request_ids, key=lambda r: -scores[(ride_id, r)]):
+                request = requests[request_id]
+                if plan_ride(ride, request, table, riders=[*ride.matched_riders, *accepted]) is None:
+                    rejected.add((ride_id, request_id))
+                    focus_rides.add(ride_id)
+                    focus_requests.add(request_id)
+                else:
+                    accepted.append(request)
+                    assigned.add(request_id)
+            if not accepted:
+                del plan[ride_id]
+        if not focus_requests:
+            return plan
+
+def _solve_greedy(candidates: Sequence[Candidate], capacities: Dict[str, int]) -> Dict[str, str]:
+    remaining = dict(capacities)
+    solution: Dict[str, str] = {}
+    for ride_id, request_id, _ in sorted(candidates, key=lambda c: -c[2]):
+        if request_id in solution or remaining.get(ride_id, 0) <= 0:
+            continue
+        solution[request_id] = ride_id
+        remaining[ride_id] -= 1
+    return solution
+
+def _solve_auction(candidates: Sequence[Candidate], capacities: Dict[str, int],
+                   epsilon: float) -> Dict[str, str]:
+    """
+    Forward auction with seat replication: every free seat is an object,
+    requests bid for seats and may stay unassigned (value 0).
+    """
+    options: Dict[str, List[Tuple[str, float]]] = {}
+    for ride_id, request_id, score in candidates:
+        options.setdefault(request_id, []).append((ride_id, score + 1 / SCORE_SCALE))
+
+    # Per ride: seat prices and their current holders
+    prices = {ride_id: [0.0] * capacities[ride_id] for ride_id in {c[0] for c in candidates}}
+    holders: Dict[str, List[Optional[str]]] = {ride_id: [None] * len(p) for ride_id, p in prices.items()}
+    solution: Dict[str, Tuple[str, int]] = {}
+
+    queue = list(options)
+    while queue:
+        request_id = queue.pop()
+        # Best and runner-up offer over all seats; staying unassigned is worth 0
+        best = second = 0.0
+        best_seat = None
+        for ride_id, value in options[request_id]:
+            seat_prices = prices[ride_id]
+            for seat in _two_cheapest(seat_prices):
+                net = value - seat_prices[seat]
+                if net > best:
+                    second = best
+                    best, best_seat = net, (ride_id, seat)
+                elif net > second:
+                    second = net
+        if best_seat is None:
+            continue
+
+        ride_id, seat = best_seat
+        prices[ride_id][seat] += best - second + epsilon
+        previous = holders[ride_id][seat]
+        holders[ride_id][seat] = request_id
+        solution[request_id] = best_seat
+        if previous is not None:
+            del solution[previous]
+            queue.append(previous)
+
+    return {request_id: seat[0] for request_id, seat in solution.items()}
+
+def _two_cheapest(seat_prices: List[float]) -> List[int]:
+    first = second = -1
+    for seat, price in enumerate(seat_prices):
+        if first < 0 or price < seat_prices[first]:
+            first, second = seat, first
+        elif second < 0 or price < seat_prices[second]:
+            second = seat
+    return [seat for seat in (first, second) if seat >= 0]
+
+def _solve_min_cost_flow(candidates: Sequence[Candidate], capacities: Dict[str, int]) -> Dict[str, str]:
+    """
+    Successive shortest paths with Dijkstra and node potentials on
+    source -> ride (free seats) -> request (1) -> sink (1). Augmentation
+    stops once no path lowers the total cost any further.
+    """
+    ride_ids = sorted({c[0] for c in candidates})
+    request_ids = sorted({c[1] for c in candidates})
+    source, sink = 0, 1 + len(ride_ids) + len(request_ids)
+    ride_node = {ride_id: 1 + i for i, ride_id in enumerate(ride_ids)}
+    request_node = {request_id: 1 + len(ride_ids) + i for i, request_id in enumerate(request_ids)}
+
+    # Edge arrays: to, capacity, cost; edge e ^ 1 is its reverse
+    to: List[int] = []
+    cap: List[int] = []
+    cost: List[int] = []
+    graph: List[List[int]] = [[] for _ in range(sink + 1)]
+
+    def add_edge(u: int, v: int, capacity: int, c: int) -> int:
+        graph[u].append(len(to))
+        to.append(v); cap.append(capacity); cost.append(c)
+        graph[v].append(len(to))
+        to.append(u); cap.append(0); cost.append(-c)
+        return len(to) - 2
+
+    for ride_id in ride_ids:
+        add_edge(source, ride_node[ride_id], capacities[ride_id], 0)
+    assignment_edges = []
+    for ride_id, request_id, score in candidates:
+        edge = add_edge(ride_node[ride_id], request_node[request_id], 1,
+                        -int(round(score * SCORE_SCALE)) - 1)
+        assignment_edges.append((edge, ride_id, request_id))
+    for request_id in request_ids:
+        add_edge(request_node[request_id], sink, 1, 0)
+
+    # Initial potentials from the DAG structure (costs may be negative)
+    potential = [0] * (sink + 1)
+    for edge, _, request_id in assignment_edges:
+        node = request_node[request_id]
+        potential[node] = min(potential[node], cost[edge])
+    potential[sink] = min([potential[request_node[r]] for r in request_ids] or [0])
+
+    while True:
+        dist = [math.inf] * (sink + 1)
+        prev_edge = [-1] * (sink + 1)
+        dist[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if u == sink:
+                break
+            for e in graph[u]:
+                if cap[e] <= 0:
+                    continue
+                v = to[e]
+                nd = d + cost[e] + potential[u] - potential[v]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    prev_edge[v] = e
+                    heapq.heappush(heap, (nd, v))
+        if math.isinf(dist[sink]):
+            break
+        # Capping at dist[sink] keeps every reduced cost non-negative
+        for node in range(sink + 1):
+            potential[node] += min(dist[node], dist[sink])
+        # Real path cost; a non-negative path would only make things worse
+        if potential[sink] - potential[source] >= 0:
+            break
+        node = sink
+        while node != source:
+            e = prev_edge[node]
+            cap[e] -= 1
+            cap[e ^ 1] += 1
+            node = to[e ^ 1]
+
+    return {
+        request_id: ride_id
+        for edge, ride_id, request_id in assignment_edges
+        if cap[edge] == 0
+    }
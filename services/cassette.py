@@ -0,0 +1,221 @@
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+from services.routing import LatLng, RouteResult, RoutingBackend, TravelMatrix
+from utils.polyline import Polyline
+
+CASSETTE_VERSION = 1
+
+# Coordinates are keyed at ~1 cm, well below any real difference in queries
+KEY_PRECISION = 7
+
+class CassetteMiss(LookupError):
+    """
+    A replayed query that was never recorded.
+    """
+
+class Cassette:
+    """
+    Recorded routing responses, stored as gzipped JSON. Routes and detours
+    are keyed by their stop sequence, matrices element by element, so a
+    replay may batch queries differently from the recording. Departure
+    times are not part of the key: a scenario is replayed on other days
+    than it was recorded, and the first response recorded for a query is
+    the one kept. Polylines are stored encoded at Google's precision
+    (1e-5 degrees). Each entry also holds the time the live call took.
+    """
+
+    def __init__(self):
+        # key -> [distance_m, duration_s, encoded polyline, elapsed_s] or [elapsed_s] if no route
+        self.routes: Dict[str, list] = {}
+        # key -> [duration_s, distance_m, elapsed_s] or [elapsed_s] if unreachable
+        self.elements: Dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self.routes) + len(self.elements)
+
+    @classmethod
+    def load(cls, path: Path) -> 'Cassette':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version {data.get('version')!r} in {path}")
+        cassette = cls()
+        cassette.routes = data['routes']
+        cassette.elements = data['elements']
+        return cassette
+
+    def save(self, path: Path):
+        """
+        Write the cassette, replacing any previous file only once complete.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + '.partial')
+        with gzip.open(partial, 'wt', encoding='utf-8') as f:
+            json.dump({'version': CASSETTE_VERSION, 'routes': self.routes,
+                       'elements': self.elements}, f, separators=(',', ':'))
+        os.replace(partial, path)
+
+def route_key(stops: Sequence[LatLng]) -> str:
+    return ";".join(_point_key(point) for point in stops)
+
+def element_key(origin: LatLng, destination: LatLng) -> str:
+    return f"{_point_key(origin)}>{_point_key(destination)}"
+
+class RecordingBackend(RoutingBackend):
+    """
+    Pass-through to a live backend that records every response into a
+    cassette. Call save() (or close()) at the end of the run.
+    """
+
+    def __init__(self, backend: RoutingBackend, path: Optional[Path] = None,
+                 cassette: Optional[Cassette] = None):
+        self.backend = backend
+        self.path = path
+        self.cassette = cassette or Cassette()
+        self._lock = threading.Lock()
+
+    def route(self, origin: LatLng, destination: LatLng,
+              departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        started = time.perf_counter()
+        result = self.backend.route(origin, destination, departure_time)
+        self._record_route([origin, destination], result, time.perf_counter() - started)
+        return result
+
+    def detour(self, origin: LatLng, destination: LatLng, waypoints: Sequence[LatLng],
+               departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        started = time.perf_counter()
+        result = self.backend.detour(origin, destination, waypoints, departure_time)
+        self._record_route([origin, *waypoints, destination], result, time.perf_counter() - started)
+        return result
+
+    def travel_times(self, origins: Sequence[LatLng], destinations: Sequence[LatLng],
+                     departure_time: Optional[datetime] = None) -> TravelMatrix:
+        started = time.perf_counter()
+        matrix = self.backend.travel_times(origins, destinations, departure_time)
+        # The call's time is spread over its elements
+        elapsed = (time.perf_counter() - started) / max(len(origins) * len(destinations), 1)
+        with self._lock:
+            for i, origin in enumerate(origins):
+                for j, destination in enumerate(destinations):
+                    seconds, meters = matrix.durations_s[i][j], matrix.distances_m[i][j]
+                    self.cassette.elements.setdefault(
+                        element_key(origin, destination),
+                        [elapsed] if seconds is None or meters is None else [seconds, meters, elapsed]
+                    )
+        return matrix
+
+    def save(self, path: Optional[Path] = None):
+        with self._lock:
+            self.cassette.save(path or self.path)
+
+    def close(self):
+        if self.path is not None:
+            self.save()
+
+    def _record_route(self, stops: List[LatLng], result: Optional[RouteResult], elapsed: float):
+        entry = [elapsed] if result is None else [
+            result.distance_m, result.duration_s, Polyline.coerce(result.polyline).encoded, elapsed
+        ]
+        with self._lock:
+            self.cassette.routes.setdefault(route_key(stops), entry)
+
+class ReplayBackend(RoutingBackend):
+    """
+    Serves recorded responses without any network access. A query missing
+    from the cassette is reported in misses and answered as unroutable, or
+    raises CassetteMiss if strict. latency is None for instant answers,
+    seconds to add per call, or "recorded" to take as long as the live call
+    did.
+    """
+
+    def __init__(self, cassette: Cassette, latency: Union[None, float, str] = None,
+                 strict: bool = False):
+        if isinstance(latency, str) and latency != "recorded":
+            raise ValueError(f"latency must be seconds or 'recorded', not {latency!r}")
+        self.cassette = cassette
+        self.latency = latency
+        self.strict = strict
+        self.hits = 0
+        self.misses: List[str] = []
+        self._lock = threading.Lock()
+
+    def route(self, origin: LatLng, destination: LatLng,
+              departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        return self._replay_route([origin, destination])
+
+    def detour(self, origin: LatLng, destination: LatLng, waypoints: Sequence[LatLng],
+               departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        return self._replay_route([origin, *waypoints, destination])
+
+    def travel_times(self, origins: Sequence[LatLng], destinations: Sequence[LatLng],
+                     departure_time: Optional[datetime] = None) -> TravelMatrix:
+        durations: List[List[Optional[float]]] = []
+        distances: List[List[Optional[float]]] = []
+        elapsed = 0.0
+        for origin in origins:
+            durations.append([])
+            distances.append([])
+            for destination in destinations:
+                entry = self._lookup(self.cassette.elements, element_key(origin, destination))
+                seconds = meters = None
+                if entry is not None:
+                    elapsed += entry[-1]
+                    if len(entry) > 1:
+                        seconds, meters = entry[0], entry[1]
+                durations[-1].append(seconds)
+                distances[-1].append(meters)
+        self._wait(elapsed)
+        return TravelMatrix(durations_s=durations, distances_m=distances)
+
+    def report(self) -> str:
+        """
+        One-line summary of hits and misses, listing a few missed keys.
+        """
+        with self._lock:
+            text = f"Routing cassette: {self.hits} hits, {len(self.misses)} misses"
+            if self.misses:
+                text += " (" + ", ".join(self.misses[:5]) + (", ..." if len(self.misses) > 5 else "") + ")"
+            return text
+
+    def close(self):
+        if self.misses:
+            print(self.report(), file=sys.stderr)
+
+    def _replay_route(self, stops: List[LatLng]) -> Optional[RouteResult]:
+        entry = self._lookup(self.cassette.routes, route_key(stops))
+        if entry is None:
+            return None
+        self._wait(entry[-1])
+        if len(entry) == 1:
+            return None
+        distance_m, duration_s, encoded, _ = entry
+        return RouteResult(distance_m=distance_m, duration_s=duration_s, polyline=Polyline(encoded))
+
+    def _lookup(self, entries: Dict[str, list], key: str) -> Optional[list]:
+        entry = entries.get(key)
+        with self._lock:
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses.append(key)
+        if self.strict:
+            raise CassetteMiss(key)
+        return None
+
+    def _wait(self, recorded_s: float):
+        if self.latency == "recorded":
+            time.sleep(recorded_s)
+        elif self.latency:
+            time.sleep(self.latency)
+
+def _point_key(point: LatLng) -> str:
+    return f"{point[0]:.{KEY_PRECISION}f},{point[1]:.{KEY_PRECISION}f}"
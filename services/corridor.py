@@ -0,0 +1,162 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from models.data_models import Ride, RideRequest
+from utils.helpers import EARTH_RADIUS_M
+from utils.polyline import as_points, simplify
+from utils.spatial_index import BoxIndex
+
+SEGMENTS_PER_BOX = 16
+POINT_CHUNK = 256
+
+@dataclass
+class RouteGeometry:
+    """
+    A ride's polyline projected to local equirectangular meters around its
+    mean latitude, split into segments with their offset along the route.
+    Built from a simplified polyline, every distance may be off by up to
+    tolerance_m, which along() adds to the corridor width.
+    """
+    ref_lat: float
+    points: np.ndarray    # (n + 1, 2) lat/lng of the (simplified) route
+    starts: np.ndarray    # (n, 2) segment start points, x/y in meters
+    vectors: np.ndarray   # (n, 2) segment end minus start
+    lengths: np.ndarray   # (n,) segment lengths in meters
+    offsets: np.ndarray   # (n,) distance along the route at each segment start
+    tolerance_m: float = 0.0
+
+    @classmethod
+    def from_polyline(cls, polyline: Sequence[Tuple[float, float]],
+                      tolerance_m: float = 0.0) -> Optional['RouteGeometry']:
+        points = simplify(as_points(polyline), tolerance_m)
+        if len(points) < 2:
+            return None
+        ref_lat = float(points[:, 0].mean())
+        xy = _project(points[:, 0], points[:, 1], ref_lat)
+        vectors = np.diff(xy, axis=0)
+        lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+        offsets = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+        return cls(ref_lat=ref_lat, points=points, starts=xy[:-1], vectors=vectors,
+                   lengths=lengths, offsets=offsets, tolerance_m=tolerance_m)
+
+    def locate(self, lats, lngs) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distance in meters from each point to the route and the offset in
+        meters along the route of its closest point.
+        """
+        xy = _project(np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float), self.ref_lat)
+        distances = np.empty(len(xy))
+        offsets = np.empty(len(xy))
+        lengths_sq = np.maximum(self.lengths ** 2, 1e-12)
+        for lo in range(0, len(xy), POINT_CHUNK):
+            chunk = xy[lo:lo + POINT_CHUNK]
+            # (points, segments, 2) displacement from every segment start
+            rel = chunk[:, None, :] - self.starts[None, :, :]
+            t = np.clip((rel * self.vectors[None]).sum(axis=2) / lengths_sq, 0.0, 1.0)
+            gap = rel - t[:, :, None] * self.vectors[None]
+            dist_sq = (gap ** 2).sum(axis=2)
+            best = dist_sq.argmin(axis=1)
+            rows = np.arange(len(chunk))
+            distances[lo:lo + POINT_CHUNK] = np.sqrt(dist_sq[rows, best])
+            offsets[lo:lo + POINT_CHUNK] = self.offsets[best] + t[rows, best] * self.lengths[best]
+        return distances, offsets
+
+    def along(self, requests: Sequence[RideRequest], width_m: float) -> np.ndarray:
+        """
+        Boolean mask of requests whose pickup and dropoff both lie within
+        width_m of the route, with the pickup not after the dropoff.
+        """
+        if not requests:
+            return np.zeros(0, dtype=bool)
+        coords = [c for r in requests for c in (r.start_coords, r.end_coords)]
+        distances, offsets = self.locate([c.lat for c in coords], [c.lng for c in coords])
+        pickup_dist, dropoff_dist = distances[0::2], distances[1::2]
+        pickup_at, dropoff_at = offsets[0::2], offsets[1::2]
+        width_m += self.tolerance_m
+        return (pickup_dist <= width_m) & (dropoff_dist <= width_m) & (pickup_at <= dropoff_at)
+
+class CorridorIndex:
+    """
+    Rides indexed by the corridor around their route polyline.
+
+    Bounding boxes of runs of SEGMENTS_PER_BOX segments go into a BoxIndex,
+    so a request only meets rides whose route passes near its pickup; exact
+    point-to-segment distances and the pickup/dropoff order along the route
+    are then checked with NumPy. Rides without a polyline are not indexed,
+    nor is anything while the corridor width is unset.
+    """
+
+    def __init__(self, width_m: Optional[float] = None, cell_size_m: Optional[float] = None):
+        self.width_m = settings.CORRIDOR_WIDTH_M if width_m is None else width_m
+        self._boxes = BoxIndex(cell_size_m or settings.SPATIAL_CELL_SIZE_M)
+        self._geometry: Dict[str, RouteGeometry] = {}
+
+    def __contains__(self, ride_id: str) -> bool:
+        return ride_id in self._geometry
+
+    def add_ride(self, ride: Ride) -> bool:
+        """
+        Index a ride's route, replacing an earlier one; False without a polyline.
+        """
+        self.remove_ride(ride)
+        if not self.width_m:
+            return False
+        geometry = route_geometry(ride)
+        if geometry is None:
+            return False
+        self._geometry[ride.id] = geometry
+        points = geometry.points
+        for lo in range(0, len(points) - 1, SEGMENTS_PER_BOX):
+            run = points[lo:lo + SEGMENTS_PER_BOX + 1]
+            self._boxes.insert(ride.id, run[:, 0].min(), run[:, 0].max(),
+                               run[:, 1].min(), run[:, 1].max())
+        return True
+
+    def remove_ride(self, ride: Ride):
+        self._geometry.pop(ride.id, None)
+        self._boxes.remove(ride.id)
+
+    def rides_along(self, request: RideRequest) -> List[str]:
+        """
+        Ids of indexed rides whose corridor holds the request in order.
+        """
+        return [
+            ride_id for ride_id in self._boxes.near(request.start_coords, self.width_m + settings.CORRIDOR_SIMPLIFY_M)
+            if self._geometry[ride_id].along([request], self.width_m)[0]
+        ]
+
+    def requests_along(self, ride: Ride, requests: Sequence[RideRequest]) -> List[RideRequest]:
+        """
+        Filter requests to those in the ride's corridor. Rides that are not
+        indexed keep every request.
+        """
+        geometry = self._geometry.get(ride.id)
+        if geometry is None:
+            return list(requests)
+        mask = geometry.along(requests, self.width_m)
+        return [request for request, keep in zip(requests, mask) if keep]
+
+def route_geometry(ride: Ride) -> Optional[RouteGeometry]:
+    return RouteGeometry.from_polyline(ride.route_polyline, settings.CORRIDOR_SIMPLIFY_M)
+
+def requests_along_route(ride: Ride, requests: Sequence[RideRequest],
+                         width_m: Optional[float] = None) -> List[RideRequest]:
+    """
+    Keep the requests whose pickup and dropoff lie within width_m
+    (settings.CORRIDOR_WIDTH_M by default) of the ride's route, in driving
+    order. Without a polyline or a width every request is kept.
+    """
+    width_m = settings.CORRIDOR_WIDTH_M if width_m is None else width_m
+    geometry = route_geometry(ride) if width_m else None
+    if geometry is None:
+        return list(requests)
+    mask = geometry.along(requests, width_m)
+    return [request for request, keep in zip(requests, mask) if keep]
+
+def _project(lats: np.ndarray, lngs: np.ndarray, ref_lat: float) -> np.ndarray:
+    scale = EARTH_RADIUS_M * math.pi / 180
+    return np.column_stack((lngs * scale * math.cos(math.radians(ref_lat)), lats * scale))
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+from config.settings import settings
+from utils.polyline import LatLng, Polyline, as_points, encode, simplify
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+class GeometryStore:
+    """
+    Route geometry of many rides in one flat file of float32 lat/lng pairs,
+    with an offset index next to it (<path>.idx, the int64 end of every
+    entry in points). Entries are only ever appended, so the data is mapped
+    read-only and handed out as zero-copy NumPy views; processes opening
+    the same file share its pages through the OS cache. Writers, also in
+    different processes, append under an exclusive lock on the index file
+    and place each entry after the last one in the index, not after their
+    own last write.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self._ends = np.zeros(0, dtype=np.int64)
+        self._coords: Optional[np.ndarray] = None
+        self._data_file = None
+        self._index_file = None
+        # Content digest -> slot of the first _hashed entries, so a route
+        # already in the file, from this run or an earlier one, is not written again
+        self._slots: Dict[bytes, int] = {}
+        self._hashed = 0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def add(self, polyline: Union[Polyline, Sequence[LatLng]]) -> 'StoredPolyline':
+        """
+        Append a polyline and return the reference to keep in its place.
+        """
+        return StoredPolyline(self, self.append(as_points(polyline)))
+
+    def append(self, points: np.ndarray) -> int:
+        """
+        Append (n, 2) lat/lng points and return their slot.
+        """
+        data = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 2).tobytes()
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        with self._lock:
+            slot = self._slots.get(digest)
+            if slot is not None:
+                return slot
+            if self._data_file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                for path in (self.path, self.index_path):
+                    open(path, 'ab').close()
+                self._data_file = open(self.path, 'r+b')
+                self._index_file = open(self.index_path, 'r+b')
+            with _exclusive(self._index_file):
+                # Other writers, or earlier runs, may have appended since
+                self._refresh()
+                self._hash_entries()
+                slot = self._slots.get(digest)
+                if slot is not None:
+                    return slot
+                start = int(self._ends[-1]) if len(self._ends) else 0
+                end = start + len(data) // 8
+                # Data before index, so a reader never sees an entry it cannot
+                # map; anything past the last indexed entry is an aborted write
+                self._data_file.seek(start * 8)
+                self._data_file.write(data)
+                self._data_file.flush()
+                self._index_file.seek(len(self._ends) * 8)
+                self._index_file.write(np.int64(end).tobytes())
+                self._index_file.flush()
+            self._ends = np.append(self._ends, end)
+            slot = self._slots[digest] = len(self._ends) - 1
+            self._hashed = len(self._ends)
+            return slot
+
+    def points(self, slot: int) -> np.ndarray:
+        """
+        Read-only float32 (n, 2) view of an entry, without copying.
+        """
+        if slot >= len(self._ends):
+            with self._lock:
+                self._refresh()
+        start, end = (int(self._ends[slot - 1]) if slot else 0), int(self._ends[slot])
+        if start == end:
+            return np.empty((0, 2), dtype=np.float32)
+        if self._coords is None or end > len(self._coords):
+            with self._lock:
+                self._refresh()
+        return self._coords[start:end]
+
+    def ref(self, slot: int) -> 'StoredPolyline':
+        return StoredPolyline(self, slot)
+
+    def close(self):
+        with self._lock:
+            for f in (self._data_file, self._index_file):
+                if f is not None:
+                    f.close()
+            self._data_file = self._index_file = None
+
+    def _hash_entries(self):
+        for slot in range(self._hashed, len(self._ends)):
+            start, end = (int(self._ends[slot - 1]) if slot else 0), int(self._ends[slot])
+            data = self._coords[start:end].tobytes() if end > start else b""
+            self._slots.setdefault(hashlib.blake2b(data, digest_size=16).digest(), slot)
+        self._hashed = len(self._ends)
+
+    def _refresh(self):
+        """
+        Re-read the index and map the data again after other writes.
+        """
+        if not self.index_path.exists():
+            return
+        self._ends = _read_index(self.index_path)
+        total = int(self._ends[-1]) if len(self._ends) else 0
+        if total:
+            self._coords = np.memmap(self.path, dtype=np.float32, mode='r', shape=(total, 2)).view(np.ndarray)
+
+class StoredPolyline:
+    """
+    A ride's route as a slot of a GeometryStore. Has the Polyline
+    interface; points() is a view into the mapped file. Pickles as path
+    and slot, so worker processes map the same file instead of copying.
+    """
+
+    __slots__ = ('store', 'slot')
+
+    def __init__(self, store: GeometryStore, slot: int):
+        self.store = store
+        self.slot = slot
+
+    @property
+    def encoded(self) -> str:
+        return encode(self.points())
+
+    def points(self) -> np.ndarray:
+        return self.store.points(self.slot)
+
+    def simplified(self, tolerance_m: float) -> np.ndarray:
+        return simplify(self.points(), tolerance_m)
+
+    def __len__(self) -> int:
+        return len(self.points())
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[LatLng]:
+        return iter(map(tuple, self.points().tolist()))
+
+    def __getitem__(self, index) -> LatLng:
+        return tuple(self.points()[index].tolist())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, StoredPolyline) and (self.store.path, self.slot) == (other.store.path, other.slot)
+
+    def __hash__(self) -> int:
+        return hash((self.store.path, self.slot))
+
+    def __reduce__(self):
+        return _stored_polyline, (str(self.store.path), self.slot)
+
+    def __repr__(self) -> str:
+        return f"StoredPolyline({str(self.store.path)!r}, {self.slot})"
+
+def _read_index(path: Path) -> np.ndarray:
+    raw = path.read_bytes()
+    # A torn last entry of an aborted write is not part of the index
+    return np.frombuffer(raw[:len(raw) // 8 * 8], dtype=np.int64).copy()
+
+@contextmanager
+def _exclusive(f):
+    """
+    Hold an exclusive lock on an open file, across processes.
+    """
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+_stores: Dict[str, GeometryStore] = {}
+_stores_lock = threading.Lock()
+
+def open_geometry_store(path: Path) -> GeometryStore:
+    """
+    The process-wide store for path, opened on first use.
+    """
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = GeometryStore(Path(key))
+        return store
+
+def store_route(polyline: Union[Polyline, Sequence[LatLng]]) -> Union[Polyline, StoredPolyline]:
+    """
+    What a ride should hold as its route_polyline: a reference into the
+    store at settings.GEOMETRY_STORE_PATH, or the encoded polyline if no
+    store is configured.
+    """
+    if settings.GEOMETRY_STORE_PATH is None:
+        return Polyline.coerce(polyline)
+    return open_geometry_store(settings.GEOMETRY_STORE_PATH).add(polyline)
+
+def _stored_polyline(path: str, slot: int) -> StoredPolyline:
+    return StoredPolyline(open_geometry_store(Path(path)), slot)
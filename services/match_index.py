@@ -0,0 +1,275 @@
+from typing import Dict, List, Optional, Set, Tuple
+from models.columnar import RequestStore, RideStore
+from models.data_models import Ride, RideRequest
+from services.corridor import CorridorIndex
+from services.matching import (
+    build_dropoff_index, build_pickup_index, build_request_time_index, build_ride_time_index,
+    is_candidate_pair, nearby_dropoffs, nearby_pickups, request_window, ride_arrival_range,
+    score_pairs, sort_matches
+)
+
+class MatchIndex:
+    """
+    Incrementally maintained matching matrix.
+
+    Scored entries are kept per ride (keyed by ride id) together with a
+    reverse index from request id to the rides it fits. Accepting or removing
+    a rider only invalidates the entries of the rides involved instead of
+    rerunning compute_matches over every pair. New pairs are drawn from time
+    indexes over ride arrival ranges and request windows and from grid
+    indexes over ride and request starts and ends, and requests are checked against
+    the corridor around each ride's route, so only pairs whose times can
+    meet and whose stops are within reach are ever scored. Rides and
+    requests are mirrored into columnar stores that scoring reads from.
+    Register on_match_changed with models.data_models.add_match_listener to
+    follow accept_match/remove_rider and keep the stores current.
+
+    With evaluate=False only the indexes are built; rides are then scored
+    one at a time with evaluate_ride, e.g. by a background worker that
+    reports each ride's matches as soon as they are known.
+    """
+
+    def __init__(self, rides: List[Ride], requests: List[RideRequest],
+                 max_workers: Optional[int] = None, evaluate: bool = True):
+        self.max_workers = max_workers
+        self.rides: Dict[str, Ride] = {}
+        self.requests: Dict[str, RideRequest] = {}
+
+        self._entries: Dict[str, Dict[str, Dict]] = {}
+        self._rides_by_request: Dict[str, Set[str]] = {}
+        self._evaluated: Dict[str, Set[str]] = {}
+        self._sorted: Dict[str, List[Dict]] = {}
+        # Rows stay allocated after a removal and are reused on re-adding
+        self._ride_store = RideStore()
+        self._request_store = RequestStore()
+        self._ride_rows: Dict[str, int] = {}
+        self._request_rows: Dict[str, int] = {}
+
+        for ride in rides:
+            self.rides[ride.id] = ride
+            self._entries[ride.id] = {}
+            self._store_ride(ride)
+        for request in requests:
+            self.requests[request.id] = request
+            self._rides_by_request[request.id] = set()
+            self._store_request(request)
+
+        self._ride_times = build_ride_time_index(self.rides.values())
+        self._ride_starts: Dict[str, object] = {
+            ride.id: ride_arrival_range(ride)[0] for ride in self.rides.values()
+        }
+        self._request_times = build_request_time_index(self.requests.values())
+        self._ride_locations = build_pickup_index(self.rides.values())
+        self._request_locations = build_pickup_index(self.requests.values())
+        self._ride_dropoffs = build_dropoff_index(self.rides.values())
+        self._request_dropoffs = build_dropoff_index(self.requests.values())
+        self._corridors = CorridorIndex()
+        for ride in self.rides.values():
+            self._corridors.add_ride(ride)
+
+        if evaluate:
+            self._evaluate([
+                pair for ride in self.rides.values() for pair in self._ride_pairs(ride)
+            ])
+
+    def evaluate_ride(self, ride: Ride) -> List[Dict]:
+        """
+        Score every not yet evaluated pair of a ride and return its matches.
+        """
+        self._ensure_ride(ride)
+        return self.matches_for(ride)
+
+    def matches_for(self, ride: Ride) -> List[Dict]:
+        """
+        Return the score-sorted match entries for a ride with free seats.
+        """
+        if ride.id not in self.rides or not self._is_open(ride):
+            return []
+        if ride.id not in self._sorted:
+            self._sorted[ride.id] = sort_matches([
+                entry for entry in self._entries[ride.id].values()
+                if not entry['request'].matched_ride
+            ])
+        return self._sorted[ride.id]
+
+    def rides_for(self, request: RideRequest) -> List[Ride]:
+        """
+        Return the rides a request currently fits.
+        """
+        return [self.rides[ride_id] for ride_id in self._rides_by_request.get(request.id, ())]
+
+    def as_dict(self) -> Dict[str, List[Dict]]:
+        """
+        Return the matrix in the same shape as compute_matches.
+        """
+        matches = {}
+        for ride in self.rides.values():
+            entries = self.matches_for(ride)
+            if entries:
+                matches[ride.id] = entries
+        return matches
+
+    def add_ride(self, ride: Ride):
+        """
+        Add a new ride and score it against all unmatched requests.
+        """
+        if ride.id in self.rides:
+            self._unindex_ride(ride)
+        self.rides[ride.id] = ride
+        self._index_ride(ride)
+        self._entries.setdefault(ride.id, {})
+        self._sorted.pop(ride.id, None)
+        self._ensure_ride(ride)
+
+    def add_request(self, request: RideRequest):
+        """
+        Add a new request and score it against all open rides.
+        """
+        if request.id not in self.requests:
+            self._request_times.insert(*request_window(request), request)
+        self._request_locations.insert(request.id, request.start_coords)
+        self._request_dropoffs.insert(request.id, request.end_coords)
+        self.requests[request.id] = request
+        self._store_request(request)
+        self._rides_by_request.setdefault(request.id, set())
+        self._ensure_request(request)
+
+    def remove_ride(self, ride: Ride):
+        """
+        Drop a ride and all of its entries.
+        """
+        if ride.id in self.rides:
+            self._unindex_ride(self.rides.pop(ride.id))
+        self._sorted.pop(ride.id, None)
+        self._evaluated.pop(ride.id, None)
+        for request_id in self._entries.pop(ride.id, {}):
+            self._rides_by_request[request_id].discard(ride.id)
+
+    def remove_request(self, request: RideRequest):
+        """
+        Drop a request and all of its entries.
+        """
+        if request.id in self.requests:
+            self._request_times.remove(request_window(request)[0], self.requests.pop(request.id))
+            self._request_locations.remove(request.id)
+            self._request_dropoffs.remove(request.id)
+        for ride_id in self._rides_by_request.pop(request.id, set()):
+            self._entries[ride_id].pop(request.id, None)
+            self._sorted.pop(ride_id, None)
+
+    def on_match_changed(self, ride: Ride, request: RideRequest, matched: bool):
+        """
+        Listener for accept_match (matched=True) and remove_rider (matched=False).
+        Only the ride itself is rescored; the rides the request fits just
+        drop their cached ordering.
+        """
+        if ride.id not in self.rides or request.id not in self.requests:
+            return
+        self._request_store.set_matched(self._request_rows[request.id], ride if matched else None)
+        for ride_id in self._rides_by_request[request.id]:
+            self._sorted.pop(ride_id, None)
+        # The ride's stop sequence changed, so its detours must be rescored
+        self.rescore_ride(ride)
+        if not matched:
+            # Pairs skipped while the request was matched
+            self._ensure_request(request)
+
+    def invalidate_ride(self, ride: Ride):
+        """
+        Forget the sorted view of a ride so it is rebuilt on next access.
+        """
+        self._sorted.pop(ride.id, None)
+
+    def rescore_ride(self, ride: Ride):
+        """
+        Re-evaluate every pair of a ride, e.g. after its route changed.
+        """
+        if ride.id in self.rides:
+            # The arrival range follows route_duration
+            self._unindex_ride(self.rides[ride.id])
+            self._index_ride(ride)
+        for request_id in self._entries.get(ride.id, {}):
+            self._rides_by_request[request_id].discard(ride.id)
+        self._entries[ride.id] = {}
+        self._evaluated.pop(ride.id, None)
+        self._sorted.pop(ride.id, None)
+        self._ensure_ride(ride)
+
+    def _is_open(self, ride: Ride) -> bool:
+        return len(ride.matched_riders) < ride.available_seats
+
+    def _store_ride(self, ride: Ride):
+        row = self._ride_rows.get(ride.id)
+        if row is None:
+            self._ride_rows[ride.id] = self._ride_store.append(ride)
+        else:
+            self._ride_store.update(row, ride)
+
+    def _store_request(self, request: RideRequest):
+        row = self._request_rows.get(request.id)
+        if row is None:
+            self._request_rows[request.id] = self._request_store.append(request)
+        else:
+            self._request_store.update(row, request)
+
+    def _index_ride(self, ride: Ride):
+        self._store_ride(ride)
+        start, end = ride_arrival_range(ride)
+        self._ride_starts[ride.id] = start
+        self._ride_times.insert(start, end, ride)
+        self._ride_locations.insert(ride.id, ride.start_coords)
+        self._ride_dropoffs.insert(ride.id, ride.end_coords)
+        self._corridors.add_ride(ride)
+
+    def _unindex_ride(self, ride: Ride):
+        self._ride_times.remove(self._ride_starts.pop(ride.id), ride)
+        self._ride_locations.remove(ride.id)
+        self._ride_dropoffs.remove(ride.id)
+        self._corridors.remove_ride(ride)
+
+    def _ride_pairs(self, ride: Ride) -> List[Tuple[Ride, RideRequest]]:
+        if not self._is_open(ride):
+            return []
+        nearby = nearby_pickups(self._request_locations, ride.start_coords)
+        if nearby:
+            nearby &= nearby_dropoffs(self._request_dropoffs, ride.end_coords)
+        candidates = [
+            request for request in self._request_times.overlapping(*ride_arrival_range(ride))
+            if request.id in nearby and not request.matched_ride
+        ]
+        return [(ride, request) for request in self._corridors.requests_along(ride, candidates)]
+
+    def _ensure_ride(self, ride: Ride):
+        self._evaluate(self._ride_pairs(ride))
+
+    def _ensure_request(self, request: RideRequest):
+        if request.matched_ride:
+            return
+        nearby = nearby_pickups(self._ride_locations, request.start_coords)
+        if nearby:
+            nearby &= nearby_dropoffs(self._ride_dropoffs, request.end_coords)
+        along = set(self._corridors.rides_along(request))
+        self._evaluate([
+            (ride, request)
+            for ride in self._ride_times.overlapping(*request_window(request))
+            if ride.id in nearby and self._is_open(ride)
+            and (ride.id in along or ride.id not in self._corridors)
+        ])
+
+    def _evaluate(self, pairs: List[Tuple[Ride, RideRequest]]):
+        pairs = [
+            (ride, request) for ride, request in pairs
+            if request.id not in self._evaluated.get(ride.id, ())
+        ]
+        for ride, request in pairs:
+            self._evaluated.setdefault(ride.id, set()).add(request.id)
+
+        candidates = [pair for pair in pairs if is_candidate_pair(*pair)]
+        rows = [(self._ride_rows[ride.id], self._request_rows[request.id]) for ride, request in candidates]
+        matches = score_pairs(candidates, self._ride_store, self._request_store, rows, self.max_workers)
+        for (ride, request), match in zip(candidates, matches):
+            if not match:
+                continue
+            self._entries[ride.id][request.id] = match
+            self._rides_by_request[request.id].add(ride.id)
+            self._sorted.pop(ride.id, None)
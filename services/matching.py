@@ -1,57 +1,323 @@
-from typing import List, Dict, Optional, Tuple
+import logging
+from typing import Iterable, List, Dict, Optional, Sequence, Set, Tuple, Union
+from config.settings import settings
 from models.data_models import Ride, RideRequest, Coordinates
 from utils.helpers import haversine_distance
-from services.routing import gmaps
-from googlemaps.directions import directions
-from datetime import timedelta
+from utils.spatial_index import GridIndex
+from utils.metrics import metrics
+from utils.time_index import IntervalIndex
+from services.corridor import requests_along_route
+from services.routing import RouteResult, get_routing_backend
+from services.travel_matrix import matrix_detours
+from services.vehicle_routing import insertion_detours, plan_ride
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from models.columnar import RequestStore, RideStore
 
-def compute_matches(rides: List[Ride], requests: List[RideRequest]) -> Dict:
+logger = logging.getLogger(__name__)
+
+@metrics.timed("compute_matches")
+def compute_matches(rides: List[Ride], requests: List[RideRequest],
+                    max_workers: Optional[int] = None, stats: Optional[Dict] = None) -> Dict:
     """
-    Generate matching matrix between rides and requests.
+    Generate matching matrix between rides and requests, keyed by ride id.
+    Detours for all candidate pairs are fetched concurrently on up to
+    max_workers threads (settings.MATCHING_MAX_WORKERS by default);
+    max_workers=1 evaluates them sequentially. The result does not
+    depend on the order in which requests complete. If a stats dict is
+    given, the number of possible and evaluated pairs is added to it.
     """
-    matches = {}
-    
-    for ride in rides:
-        if len(ride.matched_riders) >= ride.available_seats:
+    open_rides = [
+        ride for ride in rides
+        if len(ride.matched_riders) < ride.available_seats
+    ]
+
+    # Only requests near the driver's start and destination whose time
+    # windows can meet and that lie along the driver's route reach the
+    # geometric pre-filter, and only its survivors an API call
+    unmatched = [request for request in requests if not request.matched_ride]
+    time_index = build_request_time_index(unmatched)
+    pickup_index = build_pickup_index(unmatched)
+    dropoff_index = build_dropoff_index(unmatched)
+    request_rows = {request.id: row for row, request in enumerate(unmatched)}
+    pairs, rows = [], []
+    for ride_row, ride in enumerate(open_rides):
+        nearby = nearby_pickups(pickup_index, ride.start_coords)
+        if nearby:
+            nearby &= nearby_dropoffs(dropoff_index, ride.end_coords)
+        if not nearby:
             continue
-            
-        rider_matches = []
-        for request in requests:
-            if request.matched_ride:
-                continue
-                
-            # Calculate detour impact
-            new_polyline, new_distance, new_duration = calculate_detour(ride, request)
-            if not new_polyline:
-                continue
-                
-            # Check time constraints
-            if not check_time_constraints(ride, request, new_duration):
-                continue
-                
-            # Calculate match score
-            score = calculate_match_score(ride, request, new_distance, new_duration)
-            rider_matches.append({
-                'request': request,
-                'score': score,
-                'details': {
-                    'detour_time': new_duration - ride.route_duration,
-                    'distance_increase': new_distance - ride.route_distance
-                }
-            })
-            
-        if rider_matches:
-            matches[ride.driver.name] = sorted(
-                rider_matches, 
-                key=lambda x: x['score'], 
-                reverse=True
-            )
+        candidates = [
+            request for request in time_index.overlapping(*ride_arrival_range(ride))
+            if request.id in nearby
+        ]
+        for request in requests_along_route(ride, candidates):
+            if is_candidate_pair(ride, request):
+                pairs.append((ride, request))
+                rows.append((ride_row, request_rows[request.id]))
+
+    pairs_total = len(open_rides) * len(unmatched)
+    if stats is not None:
+        stats['pairs_total'] = stats.get('pairs_total', 0) + pairs_total
+        stats['pairs_evaluated'] = stats.get('pairs_evaluated', 0) + len(pairs)
+    metrics.count("pairs.evaluated", len(pairs))
+    metrics.count("pairs.pruned", pairs_total - len(pairs))
+
+    # Base routes and time windows are read from columnar copies
+    ride_store = RideStore.from_objects(open_rides)
+    request_store = RequestStore.from_objects(unmatched)
+    rider_matches = {ride.id: [] for ride in open_rides}
+    for (ride, request), match in zip(pairs, score_pairs(pairs, ride_store, request_store, rows, max_workers)):
+        if match:
+            rider_matches[ride.id].append(match)
+
+    matches = {}
+    for ride in open_rides:
+        if rider_matches[ride.id]:
+            matches[ride.id] = sort_matches(rider_matches[ride.id])
     
     return matches
 
-def calculate_detour(ride: Ride, request: RideRequest) -> Tuple[Optional[List[Tuple[float, float]]], float, float]:
+def sort_matches(rider_matches: List[Dict]) -> List[Dict]:
+    """
+    Order match entries by descending score.
+    """
+    return sorted(rider_matches, key=lambda x: x['score'], reverse=True)
+
+def score_pairs(pairs: List[Tuple[Ride, RideRequest]], ride_store: RideStore,
+                request_store: RequestStore, rows: Sequence[Tuple[int, int]],
+                max_workers: Optional[int] = None) -> List[Optional[Dict]]:
+    """
+    Evaluate detour, time constraints and score for every pair. rows holds
+    the ride and request row of each pair in the stores, whose columns
+    supply base routes and arrival windows.
+    Returns one match entry per pair, or None where the pair does not fit.
+    """
+    # Calculate detour impact
+    detours = evaluate_detours(pairs, max_workers)
+    routed = [i for i, (new_polyline, _, _) in enumerate(detours) if new_polyline is not None]
+
+    results = [None] * len(pairs)
+    if not routed:
+        return results
+
+    # Time constraints and scores for all routed pairs in one array pass
+    ride_rows = np.array([rows[i][0] for i in routed], dtype=np.intp)
+    request_rows = np.array([rows[i][1] for i in routed], dtype=np.intp)
+    new_distance = np.array([detours[i][1] for i in routed], dtype=float)
+    new_duration = np.array([detours[i][2] for i in routed], dtype=float)
+    feasible, scores = score_store_pairs(ride_store, request_store, ride_rows, request_rows,
+                                         new_distance, new_duration)
+    detour_time = new_duration - ride_store.route_duration[ride_rows]
+    distance_increase = new_distance - ride_store.route_distance[ride_rows]
+
+    for k in np.flatnonzero(feasible):
+        results[routed[k]] = {
+            'request': pairs[routed[k]][1],
+            'score': float(scores[k]),
+            'details': {
+                'detour_time': float(detour_time[k]),
+                'distance_increase': float(distance_increase[k])
+            }
+        }
+
+    return results
+
+def score_batch(base_distance: np.ndarray, base_duration: np.ndarray,
+                new_distance: np.ndarray, new_duration: np.ndarray,
+                departure_s: np.ndarray, desired_arrival_s: np.ndarray,
+                flexibility_min: np.ndarray, max_detour_min: np.ndarray
+                ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Array form of check_time_constraints and calculate_match_score over
+    candidate pairs. Distances are in km, durations and flexibility in
+    minutes, times in seconds on a common epoch. Returns the feasibility
+    mask and the score vector.
+    """
+    return (
+        time_constraints_batch(departure_s, new_duration, desired_arrival_s, flexibility_min),
+        match_scores_batch(base_distance, base_duration, new_distance, new_duration, max_detour_min)
+    )
+
+def time_constraints_batch(departure_s: np.ndarray, new_duration: np.ndarray,
+                           desired_arrival_s: np.ndarray, flexibility_min: np.ndarray) -> np.ndarray:
+    """
+    Mask of pairs whose driver arrival lies within the rider's window.
+    """
+    driver_arrival = departure_s + new_duration * 60
+    flex = flexibility_min * 60
+    return (desired_arrival_s - flex <= driver_arrival) & (driver_arrival <= desired_arrival_s + flex)
+
+def match_scores_batch(base_distance: np.ndarray, base_duration: np.ndarray,
+                       new_distance: np.ndarray, new_duration: np.ndarray,
+                       max_detour_min: np.ndarray) -> np.ndarray:
+    """
+    Scores between 0 and 1, as calculate_match_score for each pair.
+    """
+    detour_time = new_duration - base_duration
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance_ratio = np.where(base_distance > 0, new_distance / base_distance - 1, 0.0)
+        # A ride without detour allowance scores 0 for any detour
+        time_ratio = np.where(max_detour_min > 0, detour_time / max_detour_min,
+                              np.where(detour_time > 0, np.inf, 0.0))
+    return np.maximum(0, 1 - time_ratio * 0.4 - distance_ratio * 0.4)
+
+def score_store_pairs(ride_store: RideStore, request_store: RequestStore,
+                      ride_rows: np.ndarray, request_rows: np.ndarray,
+                      new_distance: np.ndarray, new_duration: np.ndarray
+                      ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    score_batch for pairs given as row indices into columnar stores, read
+    straight from their columns. Both stores must hold naive or both
+    offset-aware times.
+    """
+    if len(ride_rows) and ride_store.aware != request_store.aware:
+        raise TypeError("can't compare offset-naive and offset-aware datetimes")
+    return score_batch(
+        ride_store.route_distance[ride_rows], ride_store.route_duration[ride_rows],
+        new_distance, new_duration,
+        departure_s=ride_store.departure[ride_rows],
+        desired_arrival_s=request_store.desired_arrival[request_rows],
+        # Stored as int16; in seconds the window would overflow it
+        flexibility_min=request_store.time_flexibility_min[request_rows].astype(float),
+        max_detour_min=ride_store.max_detour_min[ride_rows]
+    )
+
+def evaluate_detours(pairs: List[Tuple[Ride, RideRequest]],
+                     max_workers: Optional[int] = None) -> List[Tuple[Optional[List[Tuple[float, float]]], float, float]]:
+    """
+    Compute the detour of every pair, returning results in pair order.
+    Rides that already carry riders are scored by inserting the request
+    into their current stop sequence. For the others, with
+    settings.DETOUR_MODE == "matrix" detours are derived from a few
+    many-to-many travel-time queries; otherwise calculate_detour runs
+    for every pair.
+    """
+    shared = [i for i, (ride, _) in enumerate(pairs) if ride.matched_riders]
+    single = [i for i, (ride, _) in enumerate(pairs) if not ride.matched_riders]
+
+    results = [None] * len(pairs)
+    if shared:
+        for i, detour in zip(shared, insertion_detours([pairs[i] for i in shared])):
+            results[i] = detour
+    for i, detour in zip(single, _single_detours([pairs[i] for i in single], max_workers)):
+        results[i] = detour
+    return results
+
+def _single_detours(pairs: List[Tuple[Ride, RideRequest]],
+                    max_workers: Optional[int] = None) -> List[Tuple[Optional[List[Tuple[float, float]]], float, float]]:
+    if settings.DETOUR_MODE == "matrix":
+        return matrix_detours(pairs)
+
+    if max_workers is None:
+        max_workers = settings.MATCHING_MAX_WORKERS
+    if max_workers <= 1 or len(pairs) <= 1:
+        return [calculate_detour(ride, request) for ride, request in pairs]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs))) as pool:
+        return list(pool.map(lambda pair: calculate_detour(*pair), pairs))
+
+def ride_arrival_range(ride: Ride) -> Tuple[datetime, Optional[datetime]]:
+    """
+    Earliest and latest time the driver can reach the destination: the
+    direct route at the earliest, plus max_detour_min at the latest.
+    Without a base route the range is open-ended.
+    """
+    if ride.route_duration <= 0:
+        return ride.departure_time, None
+    earliest = ride.departure_time + timedelta(minutes=ride.route_duration)
+    return earliest, earliest + timedelta(minutes=ride.max_detour_min)
+
+def request_window(request: RideRequest) -> Tuple[datetime, datetime]:
+    """
+    Arrival window of a request: desired arrival time +/- its flexibility.
+    """
+    flex = timedelta(minutes=request.time_flexibility_min)
+    return request.desired_arrival_time - flex, request.desired_arrival_time + flex
+
+def build_request_time_index(requests: Iterable[RideRequest]) -> IntervalIndex[RideRequest]:
+    """
+    Index requests by arrival window for ride_arrival_range queries.
+    """
+    index = IntervalIndex()
+    for request in requests:
+        index.insert(*request_window(request), request)
+    return index
+
+def build_ride_time_index(rides: Iterable[Ride]) -> IntervalIndex[Ride]:
+    """
+    Index rides by feasible arrival range for request_window queries.
+    Rides without a base route are open-ended and overlap every later window.
+    """
+    index = IntervalIndex()
+    for ride in rides:
+        index.insert(*ride_arrival_range(ride), ride)
+    return index
+
+def build_pickup_index(items: Iterable[Union[Ride, RideRequest]]) -> GridIndex[str]:
+    """
+    Index rides or requests by id at their start coordinates.
+    """
+    index = GridIndex(settings.SPATIAL_CELL_SIZE_M)
+    for item in items:
+        index.insert(item.id, item.start_coords)
+    return index
+
+def build_dropoff_index(items: Iterable[Union[Ride, RideRequest]]) -> GridIndex[str]:
+    """
+    Index rides or requests by id at their end coordinates.
+    """
+    index = GridIndex(settings.SPATIAL_CELL_SIZE_M)
+    for item in items:
+        index.insert(item.id, item.end_coords)
+    return index
+
+def nearby_pickups(index: GridIndex[str], coords: Coordinates) -> Set[str]:
+    """
+    Ids in the index whose start lies within settings.MAX_PICKUP_DISTANCE.
+    """
+    return {key for _, key in index.within(coords, settings.MAX_PICKUP_DISTANCE)}
+
+def nearby_dropoffs(index: GridIndex[str], coords: Coordinates) -> Set[str]:
+    """
+    Ids in a dropoff index whose end lies within settings.MAX_DROPOFF_DISTANCE.
+    """
+    return {key for _, key in index.within(coords, settings.MAX_DROPOFF_DISTANCE)}
+
+def is_candidate_pair(ride: Ride, request: RideRequest) -> bool:
+    """
+    Cheap straight-line check whether a request could possibly fit a ride.
+    Only pairs passing this check are worth a Directions request.
+    """
+    if request.trip_type is not None and request.trip_type != ride.trip_type:
+        return False
+
+    pickup_distance = haversine_distance(ride.start_coords, request.start_coords)
+    if pickup_distance > settings.MAX_PICKUP_DISTANCE:
+        return False
+
+    dropoff_distance = haversine_distance(request.end_coords, ride.end_coords)
+    if dropoff_distance > settings.MAX_DROPOFF_DISTANCE:
+        return False
+
+    # Without a base route the detour cannot be bounded yet
+    if ride.route_duration <= 0:
+        return True
+
+    # No road path through both stops can be shorter than the straight legs
+    min_distance = (
+        pickup_distance
+        + haversine_distance(request.start_coords, request.end_coords)
+        + dropoff_distance
+    )
+    min_duration = min_distance / 1000 / settings.MAX_ROAD_SPEED_KMH * 60
+    return min_duration - ride.route_duration <= ride.max_detour_min
+
+def calculate_detour(ride: Ride, request: RideRequest) -> Tuple[Optional[Sequence[Tuple[float, float]]], float, float]:
     """
     Calculate route with rider pickup and dropoff added.
+    Returns the polyline, distance in km and duration in minutes.
     """
     try:
         waypoints = [
@@ -59,35 +325,49 @@ def calculate_detour(ride: Ride, request: RideRequest) -> Tuple[Optional[List[Tu
             (request.end_coords.lat, request.end_coords.lng)
         ]
         
-        result = directions(
-            client=gmaps,
-            origin=(ride.start_coords.lat, ride.start_coords.lng),
-            destination=(ride.end_coords.lat, ride.end_coords.lng),
-            waypoints=waypoints,
-            optimize_waypoints=True,
-            departure_time=ride.departure_time,
-            mode="driving"
-        )
+        with metrics.span("calculate_detour"):
+            result = get_routing_backend().detour(
+                (ride.start_coords.lat, ride.start_coords.lng),
+                (ride.end_coords.lat, ride.end_coords.lng),
+                waypoints,
+                ride.departure_time
+            )
         
         if not result:
             return None, 0, 0
             
-        leg = result[0]['legs'][0]
-        new_distance = leg['distance']['value'] / 1000
-        new_duration = leg['duration']['value'] / 60
-        
-        polyline_points = []
-        for step in leg['steps']:
-            polyline_points.extend(
-                googlemaps.convert.decode_polyline(step['polyline']['points'])
-            )
-        
-        return [(point['lat'], point['lng']) for point in polyline_points], new_distance, new_duration
+        return result.polyline, result.distance_m / 1000, result.duration_s / 60
         
-    except Exception as e:
-        print(f"Detour calculation error: {e}")
+    except Exception:
+        logger.exception("Detour calculation error")
         return None, 0, 0
 
+def calculate_assigned_route(ride: Ride,
+                             riders: Optional[Sequence[RideRequest]] = None) -> Optional[RouteResult]:
+    """
+    Calculate the full route of a ride through all matched riders' pickups
+    and dropoffs (or those of riders, e.g. a snapshot taken on another
+    thread), in the stop order of its vehicle routing plan. Only accepted
+    assignments need this geometry.
+    """
+    riders = list(ride.matched_riders if riders is None else riders)
+    if not riders:
+        return None
+    try:
+        with metrics.span("calculate_assigned_route"):
+            plan = plan_ride(ride, riders=riders)
+            if plan is None:
+                return None
+            return get_routing_backend().detour(
+                (ride.start_coords.lat, ride.start_coords.lng),
+                (ride.end_coords.lat, ride.end_coords.lng),
+                [(stop.coords.lat, stop.coords.lng) for stop in plan.stops],
+                ride.departure_time
+            )
+    except Exception:
+        logger.exception("Route calculation error")
+        return None
+
 def check_time_constraints(ride: Ride, request: RideRequest, new_duration: float) -> bool:
     """
     Verify if the new route duration fits within time constraints.
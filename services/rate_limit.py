@@ -0,0 +1,72 @@
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+from googlemaps.exceptions import ApiError, Timeout, TransportError
+
+from config.settings import settings
+from utils.metrics import metrics
+
+T = TypeVar('T')
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting calls to `rate` per second with bursts
+    of up to `capacity` calls.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and consume it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Transport failures and quota rejections are worth another attempt.
+    """
+    if isinstance(error, (TransportError, Timeout)):
+        return True
+    return isinstance(error, ApiError) and error.status == "OVER_QUERY_LIMIT"
+
+def call_with_retry(func: Callable[[], T], limiter: TokenBucket = None,
+                    max_retries: int = None, backoff_s: float = None) -> T:
+    """
+    Call func under the rate limiter, retrying retryable errors with
+    exponential backoff and jitter. The last error is re-raised.
+    """
+    limiter = limiter or directions_limiter
+    max_retries = settings.DIRECTIONS_MAX_RETRIES if max_retries is None else max_retries
+    backoff_s = settings.DIRECTIONS_BACKOFF_S if backoff_s is None else backoff_s
+
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            metrics.count("api.retries")
+            time.sleep(backoff_s * (2 ** attempt) * (1 + random.random() * 0.5))
+            attempt += 1
+
+# Shared by all Directions requests so the quota holds across worker threads
+directions_limiter = TokenBucket(settings.DIRECTIONS_QPS, settings.DIRECTIONS_BURST)
@@ -0,0 +1,505 @@
+import gzip
+import heapq
+import json
+import math
+import sys
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from models.data_models import Coordinates
+from services.routing import RouteResult, RoutingBackend, TravelMatrix
+from utils.helpers import haversine_distance
+
+LatLng = Tuple[float, float]
+# (travel time in seconds, length in meters)
+Weight = Tuple[float, float]
+
+# Free-flow speeds in km/h for OSM highway classes without a usable maxspeed
+HIGHWAY_SPEEDS_KMH = {
+    'motorway': 120, 'motorway_link': 60,
+    'trunk': 100, 'trunk_link': 50,
+    'primary': 80, 'primary_link': 40,
+    'secondary': 70, 'secondary_link': 35,
+    'tertiary': 60, 'tertiary_link': 30,
+    'unclassified': 50, 'residential': 30,
+    'living_street': 10, 'service': 20,
+}
+
+# Speed assumed between a query coordinate and its nearest graph node
+ACCESS_SPEED_KMH = 30
+
+GRID_CELL_DEG = 0.01
+MAX_SNAP_RINGS = 500
+
+class RoadGraph:
+    """
+    Directed road graph weighted by free-flow travel time.
+
+    Queries use bidirectional Dijkstra; after contract() they run on the
+    contraction hierarchy instead, which settles only a few hundred nodes
+    per query even on a region-sized graph.
+    """
+
+    def __init__(self, lats: List[float], lngs: List[float],
+                 edges: Sequence[Tuple[int, int, float, float]]):
+        self.lats = lats
+        self.lngs = lngs
+        self.out_edges: List[Dict[int, Weight]] = [{} for _ in lats]
+        self.in_edges: List[Dict[int, Weight]] = [{} for _ in lats]
+        for u, v, seconds, meters in edges:
+            self._add_edge(u, v, (seconds, meters))
+
+        self.rank: Optional[List[int]] = None
+        self.shortcuts: Dict[Tuple[int, int], int] = {}
+        self._up: List[Dict[int, Weight]] = []
+        self._down: List[Dict[int, Weight]] = []
+
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for node, (lat, lng) in enumerate(zip(lats, lngs)):
+            self._grid.setdefault(self._cell(lat, lng), []).append(node)
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @classmethod
+    def from_osm(cls, path: Path) -> 'RoadGraph':
+        """
+        Build a graph from an OSM XML extract (.osm or .osm.gz).
+        Only ways tagged with a drivable highway class are used.
+        """
+        opener = gzip.open if str(path).endswith('.gz') else open
+        node_coords: Dict[str, LatLng] = {}
+        ways: List[Tuple[List[str], float, int]] = []
+
+        with opener(path, 'rb') as f:
+            for _, elem in ET.iterparse(f, events=('end',)):
+                if elem.tag == 'node':
+                    node_coords[elem.get('id')] = (float(elem.get('lat')), float(elem.get('lon')))
+                    elem.clear()
+                elif elem.tag == 'way':
+                    tags = {tag.get('k'): tag.get('v') for tag in elem.findall('tag')}
+                    highway = tags.get('highway')
+                    if highway in HIGHWAY_SPEEDS_KMH:
+                        refs = [nd.get('ref') for nd in elem.findall('nd')]
+                        ways.append((refs, _way_speed(tags, highway), _way_direction(tags, highway)))
+                    elem.clear()
+
+        index: Dict[str, int] = {}
+        lats: List[float] = []
+        lngs: List[float] = []
+        edges: List[Tuple[int, int, float, float]] = []
+
+        def node_index(ref: str) -> int:
+            if ref not in index:
+                index[ref] = len(lats)
+                lats.append(node_coords[ref][0])
+                lngs.append(node_coords[ref][1])
+            return index[ref]
+
+        for refs, speed_kmh, direction in ways:
+            refs = [ref for ref in refs if ref in node_coords]
+            for a, b in zip(refs, refs[1:]):
+                u, v = node_index(a), node_index(b)
+                meters = _distance(lats[u], lngs[u], lats[v], lngs[v])
+                seconds = meters / (speed_kmh / 3.6)
+                if direction >= 0:
+                    edges.append((u, v, seconds, meters))
+                if direction <= 0:
+                    edges.append((v, u, seconds, meters))
+
+        return cls(lats, lngs, edges)
+
+    @classmethod
+    def load(cls, path: Path) -> 'RoadGraph':
+        """
+        Load a graph written by save(), including its hierarchy if present.
+        """
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        graph = cls(data['lats'], data['lngs'], data['edges'])
+        if data.get('rank'):
+            graph._apply_hierarchy(data['rank'], data['shortcuts'])
+        return graph
+
+    def save(self, path: Path):
+        """
+        Write the graph (and hierarchy, if contracted) as gzipped JSON.
+        """
+        edges = [
+            (u, v, seconds, meters)
+            for u, out in enumerate(self.out_edges)
+            for v, (seconds, meters) in out.items()
+            if (u, v) not in self.shortcuts
+        ]
+        shortcuts = [
+            (u, v, middle, *self.out_edges[u][v])
+            for (u, v), middle in self.shortcuts.items()
+        ]
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump({
+                'lats': self.lats,
+                'lngs': self.lngs,
+                'edges': edges,
+                'rank': self.rank,
+                'shortcuts': shortcuts,
+            }, f)
+
+    def nearest_node(self, lat: float, lng: float) -> Optional[int]:
+        """
+        Return the graph node closest to a coordinate.
+        """
+        if not self.lats:
+            return None
+        ci, cj = self._cell(lat, lng)
+        best, best_dist = None, math.inf
+        for ring in range(MAX_SNAP_RINGS):
+            for cell in _ring_cells(ci, cj, ring):
+                for node in self._grid.get(cell, ()):
+                    dist = _distance(lat, lng, self.lats[node], self.lngs[node])
+                    if dist < best_dist:
+                        best, best_dist = node, dist
+            # Cells beyond this ring are at least ring * cell size away
+            if best is not None and ring * GRID_CELL_DEG * 111_000 * 0.5 > best_dist:
+                break
+        return best
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[float, float, List[int]]]:
+        """
+        Return (seconds, meters, node path) of the fastest path, or None.
+        """
+        if source == target:
+            return 0.0, 0.0, [source]
+        if self.rank is not None:
+            forward, backward = self._up, self._down
+            stop_at_best = False
+        else:
+            forward, backward = self.out_edges, self.in_edges
+            stop_at_best = True
+
+        dist = [{source: (0.0, 0.0)}, {target: (0.0, 0.0)}]
+        parent: List[Dict[int, int]] = [{}, {}]
+        heaps = [[(0.0, source)], [(0.0, target)]]
+        settled: List[set] = [set(), set()]
+        graphs = [forward, backward]
+        best, meeting = math.inf, None
+
+        while heaps[0] or heaps[1]:
+            tops = [heap[0][0] if heap else math.inf for heap in heaps]
+            if stop_at_best:
+                if tops[0] + tops[1] >= best:
+                    break
+            elif min(tops) >= best:
+                break
+            side = 0 if tops[0] <= tops[1] else 1
+            d, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+
+            other = dist[1 - side].get(node)
+            if other is not None and d + other[0] < best:
+                best, meeting = d + other[0], node
+
+            seconds, meters = dist[side][node]
+            for nxt, (w_s, w_m) in graphs[side][node].items():
+                nd = seconds + w_s
+                if nd < dist[side].get(nxt, (math.inf, 0))[0]:
+                    dist[side][nxt] = (nd, meters + w_m)
+                    parent[side][nxt] = node
+                    heapq.heappush(heaps[side], (nd, nxt))
+                    other = dist[1 - side].get(nxt)
+                    if other is not None and nd + other[0] < best:
+                        best, meeting = nd + other[0], nxt
+
+        if meeting is None:
+            return None
+        best = dist[0][meeting][0] + dist[1][meeting][0]
+
+        path = [meeting]
+        while path[-1] != source:
+            path.append(parent[0][path[-1]])
+        path.reverse()
+        node = meeting
+        while node != target:
+            node = parent[1][node]
+            path.append(node)
+
+        meters = dist[0][meeting][1] + dist[1][meeting][1]
+        return best, meters, self._unpack(path)
+
+    def many_to_many(self, sources: Sequence[int], targets: Sequence[int]
+                     ) -> Tuple[List[List[float]], List[List[float]]]:
+        """
+        Return (seconds, meters) matrices from every source to every target.
+        Unreachable pairs are math.inf.
+        """
+        seconds = [[math.inf] * len(targets) for _ in sources]
+        meters = [[math.inf] * len(targets) for _ in sources]
+
+        if self.rank is None:
+            target_cols: Dict[int, List[int]] = {}
+            for j, target in enumerate(targets):
+                target_cols.setdefault(target, []).append(j)
+            for i, source in enumerate(sources):
+                dist = self._dijkstra(source, self.out_edges, set(target_cols))
+                for target, cols in target_cols.items():
+                    if target in dist:
+                        for j in cols:
+                            seconds[i][j], meters[i][j] = dist[target]
+            return seconds, meters
+
+        # Bucket-based many-to-many on the hierarchy
+        buckets: Dict[int, List[Tuple[int, float, float]]] = {}
+        for j, target in enumerate(targets):
+            for node, (s, m) in self._dijkstra(target, self._down).items():
+                buckets.setdefault(node, []).append((j, s, m))
+        for i, source in enumerate(sources):
+            row_s, row_m = seconds[i], meters[i]
+            for node, (s, m) in self._dijkstra(source, self._up).items():
+                for j, bs, bm in buckets.get(node, ()):
+                    if s + bs < row_s[j]:
+                        row_s[j], row_m[j] = s + bs, m + bm
+        return seconds, meters
+
+    def contract(self, witness_limit: int = 200):
+        """
+        Preprocess the graph into a contraction hierarchy.
+        Nodes are contracted in order of edge difference, adding a shortcut
+        u->w around v only when no witness path of equal cost exists.
+        """
+        out_edges = [dict(edges) for edges in self.out_edges]
+        in_edges = [dict(edges) for edges in self.in_edges]
+        contracted = [False] * len(self)
+        deleted_neighbours = [0] * len(self)
+        shortcuts: Dict[Tuple[int, int], Tuple[int, float, float]] = {}
+
+        def needed_shortcuts(v: int) -> List[Tuple[int, int, float, float]]:
+            result = []
+            for u, (us, um) in in_edges[v].items():
+                if contracted[u] or u == v:
+                    continue
+                targets = {
+                    w: (us + ws, um + wm)
+                    for w, (ws, wm) in out_edges[v].items()
+                    if not contracted[w] and w != u and w != v
+                }
+                if not targets:
+                    continue
+                limit = max(s for s, _ in targets.values())
+                witness = self._witness_search(u, v, out_edges, contracted, limit, witness_limit)
+                for w, (s, m) in targets.items():
+                    if witness.get(w, math.inf) > s:
+                        result.append((u, w, s, m))
+            return result
+
+        def priority(v: int) -> int:
+            degree = sum(not contracted[n] for n in in_edges[v]) + sum(not contracted[n] for n in out_edges[v])
+            return len(needed_shortcuts(v)) - degree + deleted_neighbours[v]
+
+        heap = [(priority(v), v) for v in range(len(self))]
+        heapq.heapify(heap)
+        rank = [0] * len(self)
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # Lazy update: re-queue if the priority got worse
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            for u, w, s, m in needed_shortcuts(v):
+                if s < out_edges[u].get(w, (math.inf, 0))[0]:
+                    out_edges[u][w] = (s, m)
+                    in_edges[w][u] = (s, m)
+                    shortcuts[(u, w)] = (v, s, m)
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+            for n in set(in_edges[v]) | set(out_edges[v]):
+                deleted_neighbours[n] += 1
+
+        self._apply_hierarchy(rank, [(u, w, mid, s, m) for (u, w), (mid, s, m) in shortcuts.items()])
+
+    def _apply_hierarchy(self, rank: List[int], shortcuts: Sequence[Tuple[int, int, int, float, float]]):
+        for u, w, middle, s, m in shortcuts:
+            if s < self.out_edges[u].get(w, (math.inf, 0))[0]:
+                self._add_edge(u, w, (s, m))
+                self.shortcuts[(u, w)] = middle
+        self.rank = rank
+        self._up = [{} for _ in self.lats]
+        self._down = [{} for _ in self.lats]
+        for u, out in enumerate(self.out_edges):
+            for w, weight in out.items():
+                if rank[w] > rank[u]:
+                    self._up[u][w] = weight
+                else:
+                    # Reversed so the backward search also climbs the hierarchy
+                    self._down[w][u] = weight
+
+    def _witness_search(self, source: int, skip: int, out_edges: List[Dict[int, Weight]],
+                        contracted: List[bool], limit: float, max_settled: int) -> Dict[int, float]:
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        while heap and settled < max_settled:
+            d, node = heapq.heappop(heap)
+            if d > dist.get(node, math.inf):
+                continue
+            if d > limit:
+                break
+            settled += 1
+            for nxt, (s, _) in out_edges[node].items():
+                if nxt == skip or contracted[nxt]:
+                    continue
+                nd = d + s
+                if nd < dist.get(nxt, math.inf):
+                    dist[nxt] = nd
+                    heapq.heappush(heap, (nd, nxt))
+        return dist
+
+    def _dijkstra(self, source: int, graph: List[Dict[int, Weight]],
+                  targets: Optional[set] = None) -> Dict[int, Weight]:
+        dist = {source: (0.0, 0.0)}
+        heap = [(0.0, source)]
+        done = set()
+        remaining = set(targets) if targets is not None else None
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            if remaining is not None:
+                remaining.discard(node)
+                if not remaining:
+                    break
+            meters = dist[node][1]
+            for nxt, (s, m) in graph[node].items():
+                nd = d + s
+                if nd < dist.get(nxt, (math.inf, 0))[0]:
+                    dist[nxt] = (nd, meters + m)
+                    heapq.heappush(heap, (nd, nxt))
+        return {node: dist[node] for node in done}
+
+    def _unpack(self, path: List[int]) -> List[int]:
+        if not self.shortcuts:
+            return path
+        result = [path[0]]
+        stack = list(zip(path, path[1:]))[::-1]
+        while stack:
+            u, w = stack.pop()
+            middle = self.shortcuts.get((u, w))
+            if middle is None:
+                result.append(w)
+            else:
+                stack.append((middle, w))
+                stack.append((u, middle))
+        return result
+
+    def _add_edge(self, u: int, v: int, weight: Weight):
+        if u == v:
+            return
+        if weight[0] < self.out_edges[u].get(v, (math.inf, 0))[0]:
+            self.out_edges[u][v] = weight
+            self.in_edges[v][u] = weight
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / GRID_CELL_DEG)), int(math.floor(lng / GRID_CELL_DEG))
+
+class LocalRoutingBackend(RoutingBackend):
+    """
+    Offline routing on a RoadGraph. Needs no network access and has no
+    quota; durations are free-flow, so departure_time is ignored.
+    """
+
+    def __init__(self, graph: RoadGraph):
+        self.graph = graph
+
+    def route(self, origin: LatLng, destination: LatLng,
+              departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        return self.detour(origin, destination, [], departure_time)
+
+    def detour(self, origin: LatLng, destination: LatLng, waypoints: Sequence[LatLng],
+               departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        stops = [origin, *waypoints, destination]
+        nodes = [self.graph.nearest_node(*stop) for stop in stops]
+        if None in nodes:
+            return None
+
+        total_s = total_m = 0.0
+        polyline: List[LatLng] = []
+        for (a, b), (u, v) in zip(zip(stops, stops[1:]), zip(nodes, nodes[1:])):
+            path = self.graph.shortest_path(u, v)
+            if path is None:
+                return None
+            seconds, meters, node_path = path
+            access_m = self._access(a, u) + self._access(b, v)
+            total_s += seconds + access_m / (ACCESS_SPEED_KMH / 3.6)
+            total_m += meters + access_m
+            polyline.append(a)
+            polyline.extend((self.graph.lats[n], self.graph.lngs[n]) for n in node_path)
+        polyline.append(destination)
+        return RouteResult(distance_m=total_m, duration_s=total_s, polyline=polyline)
+
+    def travel_times(self, origins: Sequence[LatLng], destinations: Sequence[LatLng],
+                     departure_time: Optional[datetime] = None) -> TravelMatrix:
+        sources = [self.graph.nearest_node(*point) for point in origins]
+        targets = [self.graph.nearest_node(*point) for point in destinations]
+        seconds, meters = self.graph.many_to_many(sources, targets)
+        for i, (origin, u) in enumerate(zip(origins, sources)):
+            for j, (destination, v) in enumerate(zip(destinations, targets)):
+                if math.isinf(seconds[i][j]):
+                    seconds[i][j] = meters[i][j] = None
+                    continue
+                access_m = self._access(origin, u) + self._access(destination, v)
+                seconds[i][j] += access_m / (ACCESS_SPEED_KMH / 3.6)
+                meters[i][j] += access_m
+        return TravelMatrix(durations_s=seconds, distances_m=meters)
+
+    def _access(self, point: LatLng, node: int) -> float:
+        return _distance(point[0], point[1], self.graph.lats[node], self.graph.lngs[node])
+
+def _distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    return haversine_distance(Coordinates(lat=lat1, lng=lng1), Coordinates(lat=lat2, lng=lng2))
+
+def _ring_cells(ci: int, cj: int, ring: int):
+    if ring == 0:
+        yield ci, cj
+        return
+    for j in range(cj - ring, cj + ring + 1):
+        yield ci - ring, j
+        yield ci + ring, j
+    for i in range(ci - ring + 1, ci + ring):
+        yield i, cj - ring
+        yield i, cj + ring
+
+def _way_speed(tags: Dict[str, str], highway: str) -> float:
+    maxspeed = tags.get('maxspeed', '')
+    if maxspeed.isdigit():
+        return float(maxspeed)
+    return HIGHWAY_SPEEDS_KMH[highway]
+
+def _way_direction(tags: Dict[str, str], highway: str) -> int:
+    """
+    1 = forward only, -1 = backward only, 0 = both directions.
+    """
+    oneway = tags.get('oneway')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if oneway is None and (highway in ('motorway', 'motorway_link') or tags.get('junction') == 'roundabout'):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    # python -m services.road_graph stuttgart.osm.gz stuttgart_roads.json.gz
+    graph = RoadGraph.from_osm(Path(sys.argv[1]))
+    print(f"Loaded {len(graph)} nodes, contracting...")
+    graph.contract()
+    graph.save(Path(sys.argv[2]))
+    print(f"Saved road graph with {len(graph.shortcuts)} shortcuts to {sys.argv[2]}")
@@ -0,0 +1,256 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from config.settings import settings
+from utils.metrics import metrics
+
+LatLng = Tuple[float, float]
+
+# Share of max_entries freed when the disk store is trimmed, so that the
+# trim, and the row count before it, run every few thousand writes
+PRUNE_FRACTION = 0.1
+
+# Disk hits whose access times are buffered before they are written in
+# one transaction; puts, trims and close write them earlier
+ACCESS_FLUSH_SIZE = 256
+
+class RouteCache:
+    """
+    Two-level cache for Directions responses: a small in-memory LRU in front
+    of a SQLite file. Entries expire after `ttl_s` seconds and the disk store
+    is kept at most `max_entries` rows, least recently used first. Rows are
+    counted as they are written, not with a query per write; with several
+    processes writing one file the store can briefly grow past the limit
+    until one of them trims it. Access times of disk hits are buffered and
+    written with the next put, trim or close rather than one commit per hit.
+    """
+
+    def __init__(self, path: Optional[Path], memory_size: int = 1024,
+                 max_entries: int = 50_000, ttl_s: float = 7 * 24 * 3600,
+                 coord_precision: int = 4, time_bucket_min: int = 15):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.coord_precision = coord_precision
+        self.time_bucket_min = time_bucket_min
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Rows on disk as far as this instance knows; recounted before trimming
+        self._rows = 0
+        # Access times of disk hits not yet written, by key
+        self._accessed: Dict[str, float] = {}
+
+    def make_key(self, origin: LatLng, destination: LatLng,
+                 waypoints: Optional[Sequence[LatLng]] = None,
+                 departure_time: Optional[datetime] = None, **options) -> str:
+        """
+        Build a cache key from quantized coordinates, the waypoint order and
+        the departure time bucket. Weekdays share one bucket set, so the same
+        commute on Monday and Tuesday hits the same entry.
+        """
+        points = [origin, *(waypoints or []), destination]
+        coords = ";".join(
+            f"{lat:.{self.coord_precision}f},{lng:.{self.coord_precision}f}"
+            for lat, lng in points
+        )
+        if departure_time is None:
+            bucket = "now"
+        else:
+            day_kind = "wd" if departure_time.weekday() < 5 else "we"
+            minute = departure_time.hour * 60 + departure_time.minute
+            bucket = f"{day_kind}{minute // self.time_bucket_min}"
+        opts = ",".join(f"{k}={options[k]}" for k in sorted(options))
+        return f"{coords}|{bucket}|{opts}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Return the cached value for key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl_s:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    metrics.count("route_cache.hits")
+                    return value
+                del self._memory[key]
+
+            conn = self._connect()
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT created, value FROM routes WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    created, raw = row
+                    if now - created <= self.ttl_s:
+                        self._accessed[key] = now
+                        if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                            self._flush_accessed(conn)
+                            conn.commit()
+                        value = json.loads(raw)
+                        self._remember(key, created, value)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        metrics.count("route_cache.hits")
+                        return value
+                    self._rows -= conn.execute("DELETE FROM routes WHERE key = ?", (key,)).rowcount
+                    conn.commit()
+
+            self.misses += 1
+            metrics.count("route_cache.misses")
+            return None
+
+    def put(self, key: str, value: Any):
+        """
+        Store a JSON-serializable value under key.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            conn = self._connect()
+            if conn is None:
+                return
+            self._flush_accessed(conn)
+            raw = json.dumps(value)
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO routes (key, created, accessed, value) VALUES (?, ?, ?, ?)",
+                (key, now, now, raw)
+            ).rowcount
+            if inserted:
+                self._rows += 1
+            else:
+                conn.execute(
+                    "UPDATE routes SET created = ?, accessed = ?, value = ? WHERE key = ?",
+                    (now, now, raw, key)
+                )
+            if self._rows > self.max_entries:
+                # Other processes may share the file
+                self._rows = conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+                if self._rows > self.max_entries:
+                    target = int(self.max_entries * (1 - PRUNE_FRACTION))
+                    self._rows -= conn.execute(
+                        "DELETE FROM routes WHERE key IN "
+                        "(SELECT key FROM routes ORDER BY accessed ASC, rowid ASC LIMIT ?)",
+                        (self._rows - target,)
+                    ).rowcount
+            conn.commit()
+
+    def get_or_fetch(self, key: str, fetch) -> Any:
+        """
+        Return the cached value for key, calling fetch() and storing its
+        result on a miss. Exceptions from fetch are not cached.
+        """
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def purge_expired(self):
+        """
+        Drop all expired entries from memory and disk.
+        """
+        cutoff = time.time() - self.ttl_s
+        with self._lock:
+            for key in [k for k, (created, _) in self._memory.items() if created < cutoff]:
+                del self._memory[key]
+            conn = self._connect()
+            if conn is not None:
+                self._flush_accessed(conn)
+                self._rows -= conn.execute("DELETE FROM routes WHERE created < ?", (cutoff,)).rowcount
+                conn.commit()
+
+    def clear(self):
+        """
+        Remove every entry and reset the counters.
+        """
+        with self._lock:
+            self._memory.clear()
+            self._accessed.clear()
+            conn = self._connect()
+            if conn is not None:
+                conn.execute("DELETE FROM routes")
+                conn.commit()
+                self._rows = 0
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return hit/miss counters and the current hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush_accessed(self._conn)
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def _flush_accessed(self, conn: sqlite3.Connection):
+        # Committed by the caller
+        if self._accessed:
+            conn.executemany(
+                "UPDATE routes SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()]
+            )
+            self._accessed.clear()
+
+    def _remember(self, key: str, created: float, value: Any):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                "key TEXT PRIMARY KEY, created REAL, accessed REAL, value TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS routes_accessed ON routes (accessed)"
+            )
+            self._conn.commit()
+            self._rows = self._conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+        return self._conn
+
+# Shared by calculate_route and calculate_detour
+route_cache = RouteCache(
+    path=settings.ROUTE_CACHE_PATH,
+    memory_size=settings.ROUTE_CACHE_MEMORY_SIZE,
+    max_entries=settings.ROUTE_CACHE_MAX_ENTRIES,
+    ttl_s=settings.ROUTE_CACHE_TTL_S,
+    coord_precision=settings.ROUTE_CACHE_COORD_PRECISION,
+    time_bucket_min=settings.ROUTE_CACHE_TIME_BUCKET_MIN
+)
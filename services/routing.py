@@ -1,57 +1,305 @@
-from typing import Optional, Tuple, List
+import atexit
+import logging
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional, Tuple, List, Sequence
 from datetime import datetime
 import googlemaps
+import requests
+from requests.adapters import HTTPAdapter
 from googlemaps.exceptions import ApiError, TransportError
 from googlemaps.directions import directions
+from googlemaps.distance_matrix import distance_matrix
 
 from config.settings import settings
 from models.data_models import Coordinates
+from services.route_cache import RouteCache, route_cache
+from services.rate_limit import call_with_retry
+from utils.metrics import metrics
+from utils.polyline import Polyline
+
+LatLng = Tuple[float, float]
+
+# Distance Matrix API limit is 100 elements per request
+MATRIX_CHUNK = 10
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RouteResult:
+    distance_m: float
+    duration_s: float
+    # A Polyline, decoded only on use, or a plain list of (lat, lng)
+    polyline: Sequence[LatLng]
+
+@dataclass
+class TravelMatrix:
+    # durations_s[i][j] / distances_m[i][j] from origin i to destination j, None if unreachable
+    durations_s: List[List[Optional[float]]]
+    distances_m: List[List[Optional[float]]]
+
+class RoutingBackend(ABC):
+    """
+    Interface for everything that answers driving route queries.
+    """
+
+    @abstractmethod
+    def route(self, origin: LatLng, destination: LatLng,
+              departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        """
+        Fastest route from origin to destination.
+        """
+
+    @abstractmethod
+    def detour(self, origin: LatLng, destination: LatLng, waypoints: Sequence[LatLng],
+               departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        """
+        Fastest route visiting the waypoints in the given order.
+        """
+
+    @abstractmethod
+    def travel_times(self, origins: Sequence[LatLng], destinations: Sequence[LatLng],
+                     departure_time: Optional[datetime] = None) -> TravelMatrix:
+        """
+        Many-to-many travel durations and distances.
+        """
+
+class RoutingClient:
+    """
+    Google Maps client owning one pooled keep-alive HTTP session.
+    A single instance is shared by route and detour calculation and may be
+    used from worker threads; requests go through the route cache, the
+    Directions rate limiter and retry.
+    """
+
+    def __init__(self, api_key: str, pool_size: int = 10,
+                 connect_timeout: float = 5, read_timeout: float = 15,
+                 cache: RouteCache = route_cache):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.gmaps = googlemaps.Client(
+            key=api_key,
+            requests_session=self.session,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            queries_per_second=settings.DIRECTIONS_QPS,
+            # OVER_QUERY_LIMIT is retried by call_with_retry instead
+            retry_over_query_limit=False
+        )
+        self.cache = cache
+
+    def directions(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        waypoints: Optional[List[Tuple[float, float]]] = None,
+        departure_time: Optional[datetime] = None,
+        **options
+    ) -> List[dict]:
+        """
+        Request driving directions. Only a cache miss reaches the
+        Directions API, rate limited and retried.
+        """
+        key = self.cache.make_key(origin, destination, waypoints, departure_time, **options)
+        return self.cache.get_or_fetch(key, lambda: self._fetch_directions(
+            origin, destination, waypoints, departure_time, **options
+        ))
+
+    def _fetch_directions(self, origin, destination, waypoints, departure_time, **options) -> List[dict]:
+        metrics.count("api.directions")
+        with metrics.span("api.directions"):
+            return call_with_retry(lambda: directions(
+                client=self.gmaps,
+                origin=origin,
+                destination=destination,
+                waypoints=waypoints,
+                departure_time=departure_time,
+                mode="driving",
+                **options
+            ))
+
+    def distance_matrix(
+        self,
+        origins: Sequence[LatLng],
+        destinations: Sequence[LatLng],
+        departure_time: Optional[datetime] = None
+    ) -> List[List[Optional[Tuple[float, float]]]]:
+        """
+        Return (seconds, meters) for every origin/destination pair, or None
+        where no route exists. Elements are cached individually; only
+        blocks containing uncached pairs reach the Distance Matrix API.
+        """
+        result: List[List[Optional[Tuple[float, float]]]] = [[None] * len(destinations) for _ in origins]
+        missing_rows, missing_cols = set(), set()
+        for i, origin in enumerate(origins):
+            for j, destination in enumerate(destinations):
+                cached = self.cache.get(self._matrix_key(origin, destination, departure_time))
+                if cached is None:
+                    missing_rows.add(i)
+                    missing_cols.add(j)
+                elif cached:
+                    result[i][j] = tuple(cached)
+
+        rows, cols = sorted(missing_rows), sorted(missing_cols)
+        for r in range(0, len(rows), MATRIX_CHUNK):
+            for c in range(0, len(cols), MATRIX_CHUNK):
+                block_rows, block_cols = rows[r:r + MATRIX_CHUNK], cols[c:c + MATRIX_CHUNK]
+                metrics.count("api.distance_matrix")
+                metrics.count("api.matrix_elements", len(block_rows) * len(block_cols))
+                with metrics.span("api.distance_matrix"):
+                    response = call_with_retry(lambda: distance_matrix(
+                        client=self.gmaps,
+                        origins=[origins[i] for i in block_rows],
+                        destinations=[destinations[j] for j in block_cols],
+                        mode="driving",
+                        departure_time=departure_time
+                    ))
+                for i, row in zip(block_rows, response['rows']):
+                    for j, element in zip(block_cols, row['elements']):
+                        value = []
+                        if element.get('status') == 'OK':
+                            value = [element['duration']['value'], element['distance']['value']]
+                            result[i][j] = tuple(value)
+                        self.cache.put(self._matrix_key(origins[i], destinations[j], departure_time), value)
+        return result
+
+    def _matrix_key(self, origin: LatLng, destination: LatLng,
+                    departure_time: Optional[datetime]) -> str:
+        return self.cache.make_key(origin, destination, None, departure_time, matrix=True)
+
+    def close(self):
+        self.session.close()
+
+_client: Optional[RoutingClient] = None
+_client_lock = threading.Lock()
+
+def get_routing_client() -> RoutingClient:
+    """
+    Return the shared routing client, creating it on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RoutingClient(
+                api_key=settings.GMAPS_API_KEY,
+                pool_size=settings.ROUTING_POOL_SIZE,
+                connect_timeout=settings.ROUTING_CONNECT_TIMEOUT_S,
+                read_timeout=settings.ROUTING_READ_TIMEOUT_S
+            )
+        return _client
+
+class GoogleRoutingBackend(RoutingBackend):
+    """
+    Routing through the Google Directions and Distance Matrix APIs.
+    """
+
+    def __init__(self, client: RoutingClient):
+        self.client = client
+
+    def route(self, origin: LatLng, destination: LatLng,
+              departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        return self.detour(origin, destination, [], departure_time)
+
+    def detour(self, origin: LatLng, destination: LatLng, waypoints: Sequence[LatLng],
+               departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        result = self.client.directions(
+            origin=origin,
+            destination=destination,
+            waypoints=list(waypoints) or None,
+            departure_time=departure_time
+        )
+        if not result or "legs" not in result[0]:
+            return None
+
+        legs = result[0]["legs"]
+        # Detours mostly need only distance and duration, so the step
+        # polylines stay encoded until something reads the geometry
+        return RouteResult(
+            distance_m=sum(leg["distance"]["value"] for leg in legs),
+            duration_s=sum(leg["duration"]["value"] for leg in legs),
+            polyline=Polyline.concat([step["polyline"]["points"] for leg in legs for step in leg["steps"]])
+        )
+
+    def travel_times(self, origins: Sequence[LatLng], destinations: Sequence[LatLng],
+                     departure_time: Optional[datetime] = None) -> TravelMatrix:
+        elements = self.client.distance_matrix(origins, destinations, departure_time)
+        return TravelMatrix(
+            durations_s=[[e[0] if e else None for e in row] for row in elements],
+            distances_m=[[e[1] if e else None for e in row] for row in elements]
+        )
+
+_backend: Optional[RoutingBackend] = None
+_backend_lock = threading.Lock()
+
+def get_routing_backend() -> RoutingBackend:
+    """
+    Return the routing backend selected by settings.ROUTING_BACKEND,
+    recorded to or replayed from the routing cassette if
+    settings.ROUTING_CASSETTE_MODE is set.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if settings.ROUTING_CASSETTE_MODE == "replay":
+                from services.cassette import Cassette, ReplayBackend
+                latency = settings.ROUTING_CASSETTE_LATENCY
+                _backend = ReplayBackend(
+                    Cassette.load(settings.ROUTING_CASSETTE_PATH),
+                    latency if latency in (None, "recorded") else float(latency)
+                )
+                atexit.register(_backend.close)
+                return _backend
+
+            if settings.ROUTING_BACKEND == "local":
+                from services.road_graph import LocalRoutingBackend, RoadGraph
+                _backend = LocalRoutingBackend(RoadGraph.load(settings.ROAD_GRAPH_PATH))
+            else:
+                _backend = GoogleRoutingBackend(get_routing_client())
+            if settings.ROUTING_CASSETTE_MODE == "record":
+                from services.cassette import RecordingBackend
+                _backend = RecordingBackend(_backend, settings.ROUTING_CASSETTE_PATH)
+                atexit.register(_backend.close)
+        return _backend
+
+def set_routing_backend(backend: Optional[RoutingBackend]):
+    """
+    Replace the shared backend, e.g. with a local or recorded one.
+    Passing None restores the configured default on next use.
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
 
 def calculate_route(
     origin: Coordinates,
     destination: Coordinates,
     departure_time: datetime
-) -> Optional[Tuple[float, float, List[Coordinates]]]:
+) -> Optional[Tuple[float, float, Polyline]]:
     """
-    Calculate the driving route between two coordinates using Google Maps Directions API.
+    Calculate the driving route between two coordinates using the configured routing backend.
     Returns a tuple containing:
         - Distance in meters
         - Duration in seconds
-        - List of Coordinates along the route (from polyline steps)
+        - Polyline of the route
     """
     try:
-        # Initialize the Google Maps client
-        gmaps = googlemaps.Client(key=settings.GMAPS_API_KEY)
-
-        # Request directions
-        route = directions(
-            client=gmaps,
-            origin=(origin.lat, origin.lng),
-            destination=(destination.lat, destination.lng),
-            mode="driving",
-            departure_time=departure_time
-        )
-
-        if not route or "legs" not in route[0]:
+        with metrics.span("calculate_route"):
+            route = get_routing_backend().route(
+                (origin.lat, origin.lng),
+                (destination.lat, destination.lng),
+                departure_time
+            )
+        if not route:
             return None
 
-        leg = route[0]["legs"][0]
-        distance = leg["distance"]["value"]  # in meters
-        duration = leg["duration"]["value"]  # in seconds
-
-        # Extract polyline coordinates from each step
-        polyline: List[Coordinates] = [
-            Coordinates(lat=step["start_location"]["lat"], lng=step["start_location"]["lng"])
-            for step in leg["steps"]
-        ]
-        polyline.append(Coordinates(lat=leg["end_location"]["lat"], lng=leg["end_location"]["lng"]))
-
-        return distance, duration, polyline
+        return route.distance_m, route.duration_s, Polyline.coerce(route.polyline)
 
     except (ApiError, TransportError) as e:
-        print(f"Google Maps error: {e}")
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+        logger.warning("Google Maps error: %s", e)
+    except Exception:
+        logger.exception("Unexpected routing error")
 
     return None
  
\ No newline at end of file
@@ -0,0 +1,152 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from googlemaps.exceptions import ApiError, TransportError
+
+from models.data_models import Coordinates, Ride, RideRequest
+from services.routing import RoutingBackend, get_routing_backend
+from utils.metrics import metrics
+
+LatLng = Tuple[float, float]
+# (seconds, meters) or None if unreachable
+Leg = Optional[Tuple[float, float]]
+# Rides whose legs are fetched and held together; bounds both the matrix
+# size per query and the memory of the leg table
+MATRIX_BLOCK_RIDES = 10
+
+logger = logging.getLogger(__name__)
+
+class LegTable:
+    """
+    Travel times and distances between indexed points, filled from a few
+    many-to-many matrix queries instead of one route request per pair.
+    """
+
+    def __init__(self):
+        self._legs: Dict[Tuple[Optional[datetime], LatLng, LatLng], Leg] = {}
+
+    def get(self, origin: Coordinates, destination: Coordinates,
+            departure_time: Optional[datetime] = None) -> Leg:
+        return self._legs.get((departure_time, _point(origin), _point(destination)))
+
+    def fill(self, backend: RoutingBackend, origins: Sequence[Coordinates],
+             destinations: Sequence[Coordinates], departure_time: Optional[datetime] = None):
+        """
+        Query the matrix for every origin/destination pair not yet known.
+        """
+        origin_points = list(dict.fromkeys(_point(c) for c in origins))
+        destination_points = list(dict.fromkeys(_point(c) for c in destinations))
+        origin_points = [
+            o for o in origin_points
+            if any((departure_time, o, d) not in self._legs for d in destination_points)
+        ]
+        if not origin_points or not destination_points:
+            return
+
+        matrix = backend.travel_times(origin_points, destination_points, departure_time)
+        for i, origin in enumerate(origin_points):
+            for j, destination in enumerate(destination_points):
+                seconds = matrix.durations_s[i][j]
+                meters = matrix.distances_m[i][j]
+                self._legs[(departure_time, origin, destination)] = (
+                    None if seconds is None or meters is None else (seconds, meters)
+                )
+
+def build_leg_table(pairs: Sequence[Tuple[Ride, RideRequest]],
+                    backend: Optional[RoutingBackend] = None,
+                    trips: Optional[LegTable] = None) -> LegTable:
+    """
+    Fetch every leg the insertion detour of the given pairs needs:
+    driver start -> pickup, pickup -> dropoff and dropoff -> driver end.
+    Pairs are grouped by departure time so each group costs a handful of
+    matrix queries. Riders' own trips go to trips if given, so they can
+    be shared between tables.
+    """
+    backend = backend or get_routing_backend()
+    table = LegTable()
+    trips = table if trips is None else trips
+
+    groups: Dict[datetime, List[Tuple[Ride, RideRequest]]] = {}
+    for ride, request in pairs:
+        groups.setdefault(ride.departure_time, []).append((ride, request))
+
+    for departure_time, group in groups.items():
+        starts = [ride.start_coords for ride, _ in group]
+        ends = [ride.end_coords for ride, _ in group]
+        pickups = [request.start_coords for _, request in group]
+        dropoffs = [request.end_coords for _, request in group]
+
+        table.fill(backend, starts, pickups, departure_time)
+        table.fill(backend, dropoffs, ends, departure_time)
+        # Each rider's own trip is a single element, not a full matrix
+        for request in {request.id: request for _, request in group}.values():
+            trips.fill(backend, [request.start_coords], [request.end_coords], departure_time)
+
+    return table
+
+@metrics.timed("matrix_detours")
+def matrix_detours(pairs: Sequence[Tuple[Ride, RideRequest]],
+                   backend: Optional[RoutingBackend] = None
+                   ) -> List[Tuple[Optional[List[LatLng]], float, float]]:
+    """
+    Derive each pair's detour arithmetically as
+    start -> pickup -> dropoff -> end from the leg table.
+    Returns the same (polyline, km, minutes) tuples as calculate_detour,
+    with an empty polyline; only accepted assignments need full geometry.
+
+    Rides are taken in blocks of MATRIX_BLOCK_RIDES with neighbouring
+    starts, so the matrices stay close to the legs actually needed instead
+    of crossing every ride with every candidate of its departure time.
+    A block whose matrix query fails keeps (None, 0, 0) for its pairs, so
+    one failed query does not drop the matches of every other block.
+    """
+    backend = backend or get_routing_backend()
+    trips = LegTable()
+    results: List[Tuple[Optional[List[LatLng]], float, float]] = [(None, 0, 0)] * len(pairs)
+    for block in _ride_blocks(pairs):
+        try:
+            table = build_leg_table([pairs[i] for i in block], backend, trips)
+        except (ApiError, TransportError) as e:
+            metrics.count("errors.matrix_detours")
+            logger.warning("Distance matrix error: %s", e)
+            continue
+        for i in block:
+            ride, request = pairs[i]
+            legs = [
+                table.get(ride.start_coords, request.start_coords, ride.departure_time),
+                trips.get(request.start_coords, request.end_coords, ride.departure_time),
+                table.get(request.end_coords, ride.end_coords, ride.departure_time),
+            ]
+            if any(leg is None for leg in legs):
+                continue
+            seconds = sum(leg[0] for leg in legs)
+            meters = sum(leg[1] for leg in legs)
+            results[i] = ([], meters / 1000, seconds / 60)
+    return results
+
+def _ride_blocks(pairs: Sequence[Tuple[Ride, RideRequest]]) -> List[List[int]]:
+    # Pair indices per block of rides sharing a departure time, ordered by start
+    by_ride: Dict[str, List[int]] = {}
+    rides: Dict[str, Ride] = {}
+    for i, (ride, _) in enumerate(pairs):
+        by_ride.setdefault(ride.id, []).append(i)
+        rides[ride.id] = ride
+    ordered = sorted(rides.values(), key=lambda ride: (
+        ride.departure_time, ride.start_coords.lat, ride.start_coords.lng))
+
+    blocks = []
+    block: List[int] = []
+    count = 0
+    for ride in ordered:
+        if count == MATRIX_BLOCK_RIDES or (block and pairs[block[0]][0].departure_time != ride.departure_time):
+            blocks.append(block)
+            block, count = [], 0
+        block.extend(by_ride[ride.id])
+        count += 1
+    if block:
+        blocks.append(block)
+    return blocks
+
+def _point(coords: Coordinates) -> LatLng:
+    return coords.lat, coords.lng
@@ -0,0 +1,242 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+from models.data_models import Coordinates, Ride, RideRequest
+from services.routing import RoutingBackend, get_routing_backend
+from services.travel_matrix import LegTable
+
+MAX_LOCAL_SEARCH_ROUNDS = 50
+
+@dataclass
+class Stop:
+    request: RideRequest
+    is_pickup: bool
+
+    @property
+    def coords(self) -> Coordinates:
+        return self.request.start_coords if self.is_pickup else self.request.end_coords
+
+@dataclass
+class RidePlan:
+    ride: Ride
+    stops: List[Stop]
+    duration_min: float
+    distance_km: float
+    arrivals: List[datetime]  # one per stop, then the driver's arrival at the end
+
+    @property
+    def detour_min(self) -> float:
+        return self.duration_min - self.ride.route_duration
+
+def fill_ride_legs(ride: Ride, requests: Sequence[RideRequest], table: LegTable,
+                   backend: Optional[RoutingBackend] = None):
+    """
+    Make sure the table holds every leg between the ride's endpoints and
+    the pickups/dropoffs of the given requests.
+    """
+    backend = backend or get_routing_backend()
+    stops = [c for r in requests for c in (r.start_coords, r.end_coords)]
+    table.fill(backend, [ride.start_coords, *stops], [*stops, ride.end_coords], ride.departure_time)
+
+def fill_insertion_legs(ride: Ride, requests: Sequence[RideRequest], table: LegTable,
+                        backend: Optional[RoutingBackend] = None):
+    """
+    Legs to insert each request on its own into the ride's current stops:
+    between the ride's fixed points and every candidate stop, plus each
+    candidate's pickup -> dropoff. Candidates never meet each other, so
+    the element count grows linearly with their number.
+    """
+    backend = backend or get_routing_backend()
+    fill_ride_legs(ride, ride.matched_riders, table, backend)
+    fixed = [c for r in ride.matched_riders for c in (r.start_coords, r.end_coords)]
+    stops = [c for r in requests for c in (r.start_coords, r.end_coords)]
+    table.fill(backend, [ride.start_coords, *fixed], stops, ride.departure_time)
+    table.fill(backend, stops, [*fixed, ride.end_coords], ride.departure_time)
+    for request in requests:
+        table.fill(backend, [request.start_coords], [request.end_coords], ride.departure_time)
+
+def evaluate(ride: Ride, stops: Sequence[Stop], table: LegTable) -> Optional[RidePlan]:
+    """
+    Time the stop sequence; None if a leg is missing or unreachable.
+    """
+    points = [ride.start_coords, *(stop.coords for stop in stops), ride.end_coords]
+    seconds = meters = 0.0
+    arrivals = []
+    for a, b in zip(points, points[1:]):
+        if a == b:
+            leg = (0.0, 0.0)
+        else:
+            leg = table.get(a, b, ride.departure_time)
+        if leg is None:
+            return None
+        seconds += leg[0]
+        meters += leg[1]
+        arrivals.append(ride.departure_time + timedelta(seconds=seconds))
+    return RidePlan(ride=ride, stops=list(stops), duration_min=seconds / 60,
+                    distance_km=meters / 1000, arrivals=arrivals)
+
+def is_feasible(plan: RidePlan, enforce_windows: bool = True) -> bool:
+    """
+    Check pickup-before-dropoff, seat capacity and, optionally, the ride's
+    max_detour_min and every rider's arrival window.
+    """
+    ride = plan.ride
+    onboard = 0
+    picked_up = set()
+    for stop, arrival in zip(plan.stops, plan.arrivals):
+        if stop.is_pickup:
+            picked_up.add(stop.request.id)
+            onboard += 1
+            if onboard > ride.available_seats:
+                return False
+        else:
+            if stop.request.id not in picked_up:
+                return False
+            onboard -= 1
+            if enforce_windows:
+                flex = timedelta(minutes=stop.request.time_flexibility_min)
+                if not (stop.request.desired_arrival_time - flex
+                        <= arrival <= stop.request.desired_arrival_time + flex):
+                    return False
+    if enforce_windows and ride.route_duration > 0 and plan.detour_min > ride.max_detour_min:
+        return False
+    return True
+
+def insert_request(plan: RidePlan, request: RideRequest, table: LegTable,
+                   enforce_windows: bool = True) -> Optional[RidePlan]:
+    """
+    Cheapest feasible insertion of a request's pickup and dropoff into an
+    existing stop sequence.
+    """
+    best: Optional[RidePlan] = None
+    stops = plan.stops
+    for i in range(len(stops) + 1):
+        for j in range(i, len(stops) + 1):
+            candidate = (
+                stops[:i] + [Stop(request, True)]
+                + stops[i:j] + [Stop(request, False)] + stops[j:]
+            )
+            timed = evaluate(plan.ride, candidate, table)
+            if timed is None or not is_feasible(timed, enforce_windows):
+                continue
+            if best is None or timed.duration_min < best.duration_min:
+                best = timed
+    return best
+
+def improve(plan: RidePlan, table: LegTable, enforce_windows: bool = True) -> RidePlan:
+    """
+    Local search with relocate and 2-opt moves until no move shortens
+    the ride.
+    """
+    for _ in range(MAX_LOCAL_SEARCH_ROUNDS):
+        improved = False
+        for candidate in _neighbours(plan.stops):
+            timed = evaluate(plan.ride, candidate, table)
+            if (timed is not None and timed.duration_min < plan.duration_min - 1e-9
+                    and is_feasible(timed, enforce_windows)):
+                plan, improved = timed, True
+                break
+        if not improved:
+            break
+    return plan
+
+def plan_ride(ride: Ride, extra: Optional[RideRequest] = None,
+              table: Optional[LegTable] = None, enforce_windows: bool = True,
+              backend: Optional[RoutingBackend] = None,
+              riders: Optional[Sequence[RideRequest]] = None) -> Optional[RidePlan]:
+    """
+    Build a stop sequence for the ride's matched riders plus an optional
+    extra request. The riders already on the ride are placed without any
+    checks; once the extra request is inserted, every rider's arrival
+    window and the ride's detour limit must hold (with enforce_windows),
+    or None is returned. riders replaces the matched riders, e.g. to plan
+    assignments that are not committed yet.
+    """
+    riders = list(ride.matched_riders if riders is None else riders)
+    requests = riders + ([extra] if extra else [])
+    if table is None:
+        table = LegTable()
+        fill_ride_legs(ride, requests, table, backend)
+
+    plan = base_plan(ride, table, riders)
+    if plan is None or extra is None:
+        return plan
+    return _add_request(plan, extra, table, enforce_windows)
+
+def base_plan(ride: Ride, table: LegTable,
+              riders: Optional[Sequence[RideRequest]] = None) -> Optional[RidePlan]:
+    """
+    Stop sequence of the riders already on the ride (or of riders),
+    placed without any window checks.
+    """
+    plan = evaluate(ride, [], table)
+    if plan is None:
+        return None
+    for request in (ride.matched_riders if riders is None else riders):
+        plan = insert_request(plan, request, table, enforce_windows=False)
+        if plan is None:
+            return None
+    return improve(plan, table, enforce_windows=False)
+
+def insertion_detours(pairs: Sequence[Tuple[Ride, RideRequest]],
+                      backend: Optional[RoutingBackend] = None
+                      ) -> List[Tuple[Optional[List[Tuple[float, float]]], float, float]]:
+    """
+    Score requests against rides that already carry riders by inserting
+    them into the ride's current stop sequence, planned once per ride.
+    Returns the same (polyline, km, minutes) tuples as calculate_detour,
+    for the whole ride.
+    """
+    backend = backend or get_routing_backend()
+    table = LegTable()
+    by_ride = {}
+    for ride, request in pairs:
+        by_ride.setdefault(ride.id, (ride, []))[1].append(request)
+    bases = {}
+    for ride, requests in by_ride.values():
+        fill_insertion_legs(ride, requests, table, backend)
+        bases[ride.id] = base_plan(ride, table)
+
+    results = []
+    for ride, request in pairs:
+        base = bases[ride.id]
+        plan = None if base is None else _add_request(base, request, table, enforce_windows=True)
+        if plan is None:
+            results.append((None, 0, 0))
+        else:
+            results.append(([], plan.distance_km, plan.duration_min))
+    return results
+
+def _add_request(plan: RidePlan, request: RideRequest, table: LegTable,
+                 enforce_windows: bool) -> Optional[RidePlan]:
+    plan = insert_request(plan, request, table, enforce_windows)
+    if plan is None:
+        return None
+    return improve(plan, table, enforce_windows)
+
+def _neighbours(stops: List[Stop]):
+    n = len(stops)
+    # Relocate one stop
+    for a in range(n):
+        rest = stops[:a] + stops[a + 1:]
+        for b in range(n):
+            if b != a:
+                candidate = rest[:b] + [stops[a]] + rest[b:]
+                if _precedence_ok(candidate):
+                    yield candidate
+    # 2-opt segment reversal
+    for i in range(n - 1):
+        for j in range(i + 1, n):
+            candidate = stops[:i] + stops[i:j + 1][::-1] + stops[j + 1:]
+            if _precedence_ok(candidate):
+                yield candidate
+
+def _precedence_ok(stops: Sequence[Stop]) -> bool:
+    picked_up = set()
+    for stop in stops:
+        if stop.is_pickup:
+            picked_up.add(stop.request.id)
+        elif stop.request.id not in picked_up:
+            return False
+    return True
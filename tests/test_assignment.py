@@ -0,0 +1,107 @@
+import itertools
+import random
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from services import assignment
+from services.assignment import plan_assignment, solve_assignment
+
+def random_instance(rng, rides=4, requests=6, density=0.6):
+    capacities = {f"ride{i}": rng.randint(0, 2) for i in range(rides)}
+    candidates = [
+        (f"ride{i}", f"req{j}", round(rng.random(), 3))
+        for i in range(rides) for j in range(requests)
+        if rng.random() < density
+    ]
+    return candidates, capacities
+
+def total_score(candidates, solution):
+    scores = {(ride, req): score for ride, req, score in candidates}
+    return sum(scores[(ride, req)] for req, ride in solution.items())
+
+def brute_force(candidates, capacities):
+    """
+    Best total score over every capacity-feasible assignment.
+    """
+    requests = sorted({c[1] for c in candidates})
+    options = {req: [None] + [c[0] for c in candidates if c[1] == req] for req in requests}
+    best = 0.0
+    for choice in itertools.product(*(options[req] for req in requests)):
+        used = {}
+        for ride in choice:
+            if ride is not None:
+                used[ride] = used.get(ride, 0) + 1
+        if all(count <= capacities[ride] for ride, count in used.items()):
+            solution = {req: ride for req, ride in zip(requests, choice) if ride is not None}
+            best = max(best, total_score(candidates, solution))
+    return best
+
+def is_feasible(candidates, capacities, solution):
+    edges = {(ride, req) for ride, req, _ in candidates}
+    used = {}
+    for req, ride in solution.items():
+        if (ride, req) not in edges:
+            return False
+        used[ride] = used.get(ride, 0) + 1
+    return all(count <= capacities[ride] for ride, count in used.items())
+
+class TestAssignment(unittest.TestCase):
+    def test_flow_is_optimal_and_auction_close(self):
+        """
+        Min-cost flow matches brute force; auction stays within epsilon.
+        """
+        rng = random.Random(3)
+        for _ in range(30):
+            candidates, capacities = random_instance(rng)
+            optimum = brute_force(candidates, capacities)
+            for method in ("flow", "auction", "greedy"):
+                solution = solve_assignment(candidates, capacities, method)
+                self.assertTrue(is_feasible(candidates, capacities, solution), method)
+            flow = solve_assignment(candidates, capacities, "flow")
+            auction = solve_assignment(candidates, capacities, "auction")
+            self.assertAlmostEqual(total_score(candidates, flow), optimum, places=6)
+            self.assertGreaterEqual(total_score(candidates, auction), optimum - 6 * 1e-3 - 1e-9)
+
+    def test_contested_rider_goes_to_one_driver(self):
+        """
+        A rider preferred by every driver is assigned once; others still ride.
+        """
+        candidates = [
+            ("a", "star", 0.9), ("b", "star", 0.95),
+            ("a", "x", 0.5), ("b", "y", 0.4),
+        ]
+        solution = solve_assignment(candidates, {"a": 1, "b": 1}, "flow")
+        self.assertEqual(solution, {"star": "b", "x": "a"})
+
+    def test_rejection_resolves_only_affected_rides(self):
+        """
+        After a ride rejects a rider, only its free seats and the rejected
+        rider go back to the solver.
+        """
+        rides = {
+            "a": SimpleNamespace(id="a", available_seats=2, matched_riders=[]),
+            "b": SimpleNamespace(id="b", available_seats=2, matched_riders=[]),
+        }
+        requests = {r: SimpleNamespace(id=r) for r in ("x", "y", "v", "z", "w")}
+        candidates = [
+            ("a", "x", 0.9), ("a", "y", 0.8), ("a", "v", 0.1),
+            ("b", "z", 0.7), ("b", "y", 0.5), ("b", "w", 0.1), ("b", "v", 0.05),
+        ]
+        rounds = []
+
+        def spy(open_candidates, capacities, method="auto"):
+            rounds.append(sorted(open_candidates))
+            return solve_assignment(open_candidates, capacities, method)
+
+        with patch.object(assignment, 'solve_assignment', side_effect=spy), \
+                patch.object(assignment, 'fill_ride_legs'), \
+                patch.object(assignment, 'plan_ride',
+                             side_effect=lambda ride, request, table, riders: None if request.id == "y" and ride.id == "a" else True):
+            plan = plan_assignment(candidates, rides, requests, "flow")
+
+        self.assertEqual({ride_id: [r.id for r in riders] for ride_id, riders in plan.items()},
+                         {"a": ["x", "v"], "b": ["z", "w"]})
+        self.assertEqual(rounds[1], [("a", "v", 0.1), ("b", "y", 0.5)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+import batch_match
+from services.routing import set_routing_backend
+from tests.test_matching import StraightLineBackend
+
+DEPARTURE = datetime(2024, 3, 4, 7, 30)
+WORK = (48.7833, 9.2250)
+
+class TestBatchMatch(unittest.TestCase):
+    def setUp(self):
+        set_routing_backend(StraightLineBackend())
+        self.addCleanup(set_routing_backend, None)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        self.rides_path = os.path.join(self.dir.name, "rides.jsonl")
+        with open(self.rides_path, "w", encoding="utf-8") as f:
+            for i, (lat, lng) in enumerate([(48.6833, 9.0167), (48.7500, 9.1500), (48.8973, 9.1922)]):
+                f.write(json.dumps({
+                    "id": f"ride-{i}", "driver_id": f"driver-{i}", "driver_name": f"Driver {i}",
+                    "start_point": "Home", "end_point": "Work",
+                    "start_lat": lat, "start_lng": lng, "end_lat": WORK[0], "end_lng": WORK[1],
+                    "departure_time": DEPARTURE.isoformat(), "max_detour_min": 20,
+                    "available_seats": 1, "trip_type": "OUTBOUND"
+                }) + "\n")
+
+        self.requests_path = os.path.join(self.dir.name, "requests.csv")
+        with open(self.requests_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=[
+                "id", "rider_id", "start_lat", "start_lng", "end_lat", "end_lng",
+                "desired_arrival_time", "time_flexibility_min", "trip_type"
+            ])
+            writer.writeheader()
+            for i, (lat, lng) in enumerate([(48.6900, 9.0200), (48.7450, 9.1400), (48.8378, 10.0933)]):
+                writer.writerow({
+                    "id": f"request-{i}", "rider_id": f"rider-{i}", "start_lat": lat, "start_lng": lng,
+                    "end_lat": WORK[0], "end_lng": WORK[1],
+                    "desired_arrival_time": (DEPARTURE + timedelta(minutes=30)).isoformat(),
+                    "time_flexibility_min": 30, "trip_type": "Hinfahrt"
+                })
+
+    def test_streams_matches_then_assignments(self):
+        """
+        Matches of every chunk come before the assignment, which respects seats.
+        """
+        out = io.StringIO()
+        users = {}
+        requests = [batch_match.request_from_record(r, users) for r in batch_match.read_records(self.requests_path)]
+        rides = (batch_match.ride_from_record(r, users) for r in batch_match.read_records(self.rides_path))
+        summary = batch_match.run(rides, requests, out, chunk_size=1)
+
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        types = [record["type"] for record in records]
+        self.assertEqual(types, sorted(types, key=lambda t: t == "assignment"))
+        matched = {(r["ride_id"], r["request_id"]) for r in records if r["type"] == "match"}
+        self.assertIn(("ride-0", "request-0"), matched)
+        self.assertNotIn("request-2", {request_id for _, request_id in matched})
+
+        assignments = [r for r in records if r["type"] == "assignment"]
+        self.assertEqual(summary["assignments"], len(assignments))
+        self.assertEqual(len({r["ride_id"] for r in assignments}), len(assignments))
+        self.assertTrue(all((r["ride_id"], r["request_id"]) in matched for r in assignments))
+
+    def test_offset_timestamps(self):
+        """
+        The command line accepts timestamps with offsets, here rides in
+        +01:00 and requests at the same instants in UTC, and assigns as
+        for naive input.
+        """
+        def rewrite(path, field, convert):
+            rows = list(batch_match.read_records(path))
+            for row in rows:
+                row[field] = convert(datetime.fromisoformat(row[field])).isoformat()
+            target = os.path.join(self.dir.name, "offset-" + os.path.basename(path) + ".jsonl")
+            with open(target, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(row) + "\n" for row in rows)
+            return target
+
+        def assignments(*args):
+            out = os.path.join(self.dir.name, "out.jsonl")
+            self.assertEqual(batch_match.main([*args, "-o", out]), 0)
+            with open(out, encoding="utf-8") as f:
+                return sorted((r["ride_id"], r["request_id"]) for r in map(json.loads, f)
+                              if r["type"] == "assignment")
+
+        cet = timezone(timedelta(hours=1))
+        rides_path = rewrite(self.rides_path, "departure_time", lambda t: t.replace(tzinfo=cet))
+        requests_path = rewrite(self.requests_path, "desired_arrival_time",
+                                lambda t: t.replace(tzinfo=cet).astimezone(timezone.utc))
+        naive = assignments(self.rides_path, self.requests_path)
+        self.assertTrue(naive)
+        self.assertEqual(assignments(rides_path, requests_path), naive)
+        self.assertIsNone(batch_match.parse_time("2024-03-04T07:30:00+01:00").tzinfo)
+
+    def test_runs_without_gui_modules(self):
+        """
+        The command line entry point never imports Qt or Folium.
+        """
+        code = ("import sys, batch_match; "
+                "print(sorted(m for m in sys.modules if m.split('.')[0] in ('PyQt5', 'folium')))")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True,
+                                env={**os.environ, "GMAPS_API_KEY": os.environ.get("GMAPS_API_KEY", "AIza")})
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+if __name__ == '__main__':
+    unittest.main()
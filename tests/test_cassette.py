@@ -0,0 +1,83 @@
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from services.cassette import Cassette, CassetteMiss, RecordingBackend, ReplayBackend
+from utils.scenario import SyntheticRoutingBackend
+
+HOME = (48.6833, 9.0167)
+WORK = (48.7833, 9.2250)
+PICKUP = (48.7000, 9.0300)
+DEPARTURE = datetime(2024, 3, 4, 7, 30)
+
+class TestCassette(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'cassette.json.gz'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _record(self):
+        live = SyntheticRoutingBackend()
+        recorder = RecordingBackend(live, self.path)
+        recorded = (
+            recorder.route(HOME, WORK, DEPARTURE),
+            recorder.detour(HOME, WORK, [PICKUP], DEPARTURE),
+            recorder.travel_times([HOME, PICKUP], [WORK], DEPARTURE),
+        )
+        recorder.close()
+        return recorded
+
+    def test_replay_serves_recorded_responses_offline(self):
+        """
+        A saved cassette answers the same queries without the live backend,
+        on any departure date, and matrix elements can be batched differently.
+        """
+        route, detour, matrix = self._record()
+        replay = ReplayBackend(Cassette.load(self.path))
+
+        replayed = replay.route(HOME, WORK, datetime(2025, 1, 7, 7, 30))
+        self.assertEqual((replayed.distance_m, replayed.duration_s), (route.distance_m, route.duration_s))
+        for (lat, lng), (rlat, rlng) in zip(route.polyline, replayed.polyline):
+            self.assertAlmostEqual(lat, rlat, places=5)
+            self.assertAlmostEqual(lng, rlng, places=5)
+        self.assertEqual(replay.detour(HOME, WORK, [PICKUP]).duration_s, detour.duration_s)
+
+        single = replay.travel_times([PICKUP], [WORK], DEPARTURE)
+        self.assertEqual(single.durations_s[0][0], matrix.durations_s[1][0])
+        self.assertEqual(single.distances_m[0][0], matrix.distances_m[1][0])
+        self.assertEqual((replay.hits, replay.misses), (3, []))
+
+    def test_misses_are_reported_not_fetched(self):
+        self._record()
+        replay = ReplayBackend(Cassette.load(self.path))
+        self.assertIsNone(replay.route(WORK, HOME))
+        matrix = replay.travel_times([WORK], [HOME, PICKUP])
+        self.assertEqual(matrix.durations_s, [[None, None]])
+        self.assertEqual(len(replay.misses), 3)
+        self.assertIn("3 misses", replay.report())
+
+        with self.assertRaises(CassetteMiss):
+            ReplayBackend(Cassette.load(self.path), strict=True).route(WORK, HOME)
+
+    def test_simulated_latency(self):
+        self._record()
+        cassette = Cassette.load(self.path)
+        started = time.perf_counter()
+        ReplayBackend(cassette, latency=0.05).route(HOME, WORK)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+
+        key = next(iter(cassette.routes))
+        cassette.routes[key][-1] = 0.05
+        started = time.perf_counter()
+        ReplayBackend(cassette, latency="recorded").route(HOME, WORK)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+
+        with self.assertRaises(ValueError):
+            ReplayBackend(cassette, latency="slow")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import random
+import tracemalloc
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+import numpy as np
+from config.settings import settings
+from models.columnar import RequestStore, RideStore
+from models.data_models import User, Coordinates, Ride, TripType, add_match_listener, remove_match_listener
+from services.match_index import MatchIndex
+from services.matching import compute_matches, score_store_pairs
+from services.routing import set_routing_backend
+from tests.test_matching import StraightLineBackend, fake_detour
+
+DEPARTURE = datetime(2024, 3, 4, 7, 30)
+
+def make_requests(count, seed=2):
+    rng = random.Random(seed)
+    riders = [User(id=f"u{i}", name=f"Rider {i}", is_driver=False, is_rider=True,
+                   residential_area=("Area", (48.7, 9.1))) for i in range(max(count // 2, 1))]
+    return [
+        riders[i // 2].request_ride(
+            start_point="Böblingen", end_point="Mercedes Werk Untertürkheim",
+            start_coords=Coordinates(lat=rng.uniform(48.6, 48.8), lng=rng.uniform(9.0, 9.2)),
+            end_coords=Coordinates(lat=48.7833, lng=9.2250),
+            desired_arrival_time=DEPARTURE + timedelta(minutes=rng.randint(10, 60)),
+            time_flexibility_min=rng.randint(15, 45),
+            trip_type=rng.choice([None, TripType.OUTBOUND, TripType.RETURN])
+        )
+        for i in range(count)
+    ]
+
+def make_ride():
+    driver = User(id="d", name="Driver", is_driver=True, is_rider=False, residential_area=("A", (0, 0)))
+    return Ride(driver=driver, start_point="Home", end_point="Work",
+                start_coords=Coordinates(lat=48.68, lng=9.02), end_coords=Coordinates(lat=48.7833, lng=9.2250),
+                departure_time=DEPARTURE, max_detour_min=20, available_seats=2,
+                route_distance=15.0, route_duration=20.0)
+
+class TestColumnarStores(unittest.TestCase):
+    def test_offset_aware_times(self):
+        """
+        Aware datetimes are stored at their UTC instant and read back equal.
+        """
+        requests = make_requests(2)
+        requests[0].desired_arrival_time = datetime(2024, 3, 4, 8, 0, tzinfo=timezone(timedelta(hours=1)))
+        requests[1].desired_arrival_time = datetime(2024, 3, 4, 7, 0, tzinfo=timezone.utc)
+        store = RequestStore.from_objects(requests)
+        self.assertEqual(store.desired_arrival[0], store.desired_arrival[1])
+        self.assertEqual(store[0].desired_arrival_time, requests[0].desired_arrival_time)
+        self.assertEqual(store[1].desired_arrival_time, requests[1].desired_arrival_time)
+
+    def test_mixed_naive_and_aware_times(self):
+        """
+        A store refuses naive times next to aware ones, and so does scoring
+        naive rides against aware requests.
+        """
+        requests = make_requests(2)
+        requests[0].desired_arrival_time = datetime(2024, 3, 4, 7, 0, tzinfo=timezone.utc)
+        requests[1].desired_arrival_time = datetime(2024, 3, 4, 7, 0)
+        with self.assertRaises(TypeError):
+            RequestStore.from_objects(requests)
+
+        rides = RideStore.from_objects([make_ride()])
+        aware = RequestStore.from_objects(requests[:1])
+        with self.assertRaises(TypeError):
+            score_store_pairs(rides, aware, np.array([0]), np.array([0]),
+                              np.array([16.0]), np.array([25.0]))
+
+    def test_views_mirror_objects(self):
+        """
+        Views expose the same attribute values as the objects they were built from.
+        """
+        requests = make_requests(200)
+        store = RequestStore.from_objects(requests)
+        self.assertEqual(len(store), 200)
+        for request, view in zip(requests, store):
+            for name in ("id", "rider", "start_point", "end_point", "start_coords", "end_coords",
+                         "desired_arrival_time", "time_flexibility_min", "trip_type", "matched_ride"):
+                self.assertEqual(getattr(view, name), getattr(request, name), name)
+        self.assertEqual(store[store.row_of(requests[7].id)].id, requests[7].id)
+        lo, hi = store.arrival_windows()
+        self.assertEqual(int(hi[3] - lo[3]), 2 * 60 * requests[3].time_flexibility_min)
+
+    def test_matching_accepts_views(self):
+        """
+        compute_matches gives the same pairs for views as for the objects.
+        """
+        rides = [make_ride()]
+        requests = make_requests(40)
+        with patch.object(settings, 'DETOUR_MODE', 'directions'), \
+                patch('services.matching.calculate_detour', side_effect=fake_detour):
+            expected = compute_matches(rides, requests, max_workers=1)
+            actual = compute_matches(list(RideStore.from_objects(rides)),
+                                     list(RequestStore.from_objects(requests)), max_workers=1)
+        self.assertEqual(
+            [m['request'].id for m in expected[rides[0].id]],
+            [m['request'].id for m in actual[rides[0].id]]
+        )
+
+    def test_named_ids(self):
+        """
+        Ids that are not uuid strings, as in imported files, are kept as is.
+        """
+        requests = make_requests(4)
+        requests[1].id = "request-1"
+        store = RequestStore.from_objects(requests)
+        self.assertEqual([view.id for view in store], [request.id for request in requests])
+        self.assertEqual(store.row_of("request-1"), 1)
+        self.assertEqual(store.row_of(requests[2].id), 2)
+        with self.assertRaises(KeyError):
+            store.row_of("request-2")
+
+    def test_match_index_keeps_stores_current(self):
+        """
+        The index's stores follow match events and route changes.
+        """
+        set_routing_backend(StraightLineBackend())
+        self.addCleanup(set_routing_backend, None)
+        ride = make_ride()
+        requests = make_requests(4)
+        with patch.object(settings, 'DETOUR_MODE', 'directions'), \
+                patch('services.matching.calculate_detour', side_effect=fake_detour):
+            index = MatchIndex([ride], requests, max_workers=1)
+            add_match_listener(index.on_match_changed)
+            try:
+                requests[0].accept_match(ride)
+                self.assertIs(index._request_store[0].matched_ride, ride)
+                self.assertTrue(index._request_store.matched[0])
+
+                ride.route_duration = 25.0
+                index.rescore_ride(ride)
+                self.assertEqual(index._ride_store[0].route_duration, 25.0)
+
+                ride.remove_rider(requests[0])
+                self.assertFalse(index._request_store.matched[0])
+            finally:
+                remove_match_listener(index.on_match_changed)
+
+    def test_memory_per_request(self):
+        """
+        The columnar store needs several times less memory than the objects.
+        """
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        requests = make_requests(5000)
+        object_bytes = sum(stat.size_diff for stat in
+                           tracemalloc.take_snapshot().compare_to(before, 'filename'))
+        tracemalloc.stop()
+        store = RequestStore.from_objects(requests)
+        self.assertLess(store.nbytes * 5, object_bytes)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import random
+import unittest
+from datetime import datetime
+from models.data_models import User, Coordinates, Ride, RideRequest
+from services.corridor import CorridorIndex, RouteGeometry, requests_along_route
+
+def make_request(name, start, end):
+    rider = User(id=name, name=name, is_driver=False, is_rider=True, residential_area=("A", start))
+    return RideRequest(rider=rider, start_point="S", end_point="E",
+                       start_coords=Coordinates(*start), end_coords=Coordinates(*end),
+                       desired_arrival_time=datetime(2024, 3, 4, 8, 0), time_flexibility_min=30)
+
+class TestCorridor(unittest.TestCase):
+    def setUp(self):
+        driver = User(id="d", name="Driver", is_driver=True, is_rider=False, residential_area=("A", (0, 0)))
+        # An L-shaped route: east along 48.70, then north along 9.20
+        polyline = [(48.70, 9.00 + i * 0.01) for i in range(21)] + \
+                   [(48.70 + i * 0.01, 9.20) for i in range(1, 11)]
+        self.ride = Ride(driver=driver, start_point="Home", end_point="Work",
+                         start_coords=Coordinates(48.70, 9.00), end_coords=Coordinates(48.80, 9.20),
+                         departure_time=datetime(2024, 3, 4, 7, 0), max_detour_min=15,
+                         available_seats=2, route_polyline=polyline)
+
+    def test_point_to_route_distance(self):
+        """
+        Distances and offsets follow the polyline, including its corner.
+        """
+        geometry = RouteGeometry.from_polyline(self.ride.route_polyline)
+        distances, offsets = geometry.locate([48.71, 48.70, 48.75], [9.10, 9.20, 9.21])
+        self.assertAlmostEqual(distances[0], 1112, delta=5)
+        self.assertAlmostEqual(distances[1], 0, delta=1)
+        self.assertAlmostEqual(distances[2], 734, delta=5)
+        self.assertLess(offsets[0], offsets[1])
+        self.assertLess(offsets[1], offsets[2])
+
+    def test_corridor_order_and_width(self):
+        """
+        Requests must lie within the corridor and point in driving direction.
+        """
+        on_route = make_request("on route", (48.705, 9.05), (48.76, 9.205))
+        backwards = make_request("backwards", (48.76, 9.205), (48.705, 9.05))
+        far = make_request("far", (48.60, 9.05), (48.76, 9.205))
+        self.assertEqual(requests_along_route(self.ride, [on_route, backwards, far], 2000), [on_route])
+        self.assertEqual(requests_along_route(self.ride, [far], 20000), [far])
+
+    def test_index_agrees_with_direct_filter(self):
+        """
+        Box-grid lookups find exactly the rides the exact check accepts.
+        """
+        rng = random.Random(5)
+        index = CorridorIndex(width_m=1500, cell_size_m=1000)
+        self.assertTrue(index.add_ride(self.ride))
+        for _ in range(300):
+            request = make_request("r", (rng.uniform(48.65, 48.85), rng.uniform(8.95, 9.25)),
+                                   (rng.uniform(48.65, 48.85), rng.uniform(8.95, 9.25)))
+            expected = bool(requests_along_route(self.ride, [request], 1500))
+            self.assertEqual(index.rides_along(request) == [self.ride.id], expected)
+            self.assertEqual(index.requests_along(self.ride, [request]) == [request], expected)
+
+if __name__ == '__main__':
+    unittest.main()
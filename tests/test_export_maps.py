@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+import export_maps
+from services.routing import set_routing_backend
+from tests.test_matching import StraightLineBackend, make_request, make_ride
+
+class TestExportMaps(unittest.TestCase):
+    def setUp(self):
+        set_routing_backend(StraightLineBackend())
+        self.addCleanup(set_routing_backend, None)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.out = Path(self.dir.name) / "maps"
+        self.rides = [
+            make_ride("Driver A", 48.6833, 9.0167),
+            make_ride("Driver B", 48.7500, 9.1500),
+            make_ride("Driver C", 48.8973, 9.1922),
+        ]
+        for ride in self.rides:
+            ride.route_polyline = [(ride.start_coords.lat, ride.start_coords.lng),
+                                   (ride.end_coords.lat, ride.end_coords.lng)]
+
+    def test_export_and_incremental_rerun(self):
+        """
+        A second export only re-renders rides whose riders changed and
+        drops maps of rides that are gone.
+        """
+        summary = export_maps.export_maps(self.rides, self.out, max_workers=2)
+        self.assertEqual(summary, {'rendered': 3, 'skipped': 0, 'removed': 0})
+        for ride in self.rides:
+            page = (self.out / export_maps.ride_filename(ride)).read_text(encoding='utf-8')
+            self.assertIn("antPath", page)
+        index = (self.out / "index.html").read_text(encoding='utf-8')
+        self.assertEqual(index.count('<a href="ride-'), 3)
+
+        self.assertEqual(export_maps.export_maps(self.rides, self.out, max_workers=2)['rendered'], 0)
+
+        rider = make_request("Rider 1", 48.6900, 9.0200)
+        rider.accept_match(self.rides[0])
+        summary = export_maps.export_maps(self.rides[:2], self.out, max_workers=2)
+        self.assertEqual(summary, {'rendered': 1, 'skipped': 1, 'removed': 1})
+        self.assertIn("Mitfahrer: Rider 1", (self.out / export_maps.ride_filename(self.rides[0])).read_text(encoding='utf-8'))
+        self.assertFalse((self.out / export_maps.ride_filename(self.rides[2])).exists())
+        manifest = json.loads((self.out / export_maps.MANIFEST).read_text(encoding='utf-8'))
+        self.assertEqual(set(manifest['rides']), {self.rides[0].id, self.rides[1].id})
+        self.assertEqual([name for name in os.listdir(self.out) if name.endswith('.partial')], [])
+
+        self.assertEqual(export_maps.export_maps(self.rides[:2], self.out, incremental=False,
+                                                 max_workers=1)['rendered'], 2)
+
+    def test_full_export_removes_old_maps(self):
+        export_maps.export_maps(self.rides, self.out, max_workers=1)
+        summary = export_maps.export_maps(self.rides[:2], self.out, incremental=False, max_workers=1)
+        self.assertEqual(summary, {'rendered': 2, 'skipped': 0, 'removed': 1})
+        self.assertFalse((self.out / export_maps.ride_filename(self.rides[2])).exists())
+
+    def test_fallback_maps_are_rendered_again(self):
+        """
+        A map drawn without the route through the riders is not kept as
+        up to date.
+        """
+        make_request("Rider 1", 48.6900, 9.0200).accept_match(self.rides[0])
+        with patch('export_maps.calculate_assigned_route', return_value=None):
+            export_maps.export_maps(self.rides, self.out, max_workers=1)
+        summary = export_maps.export_maps(self.rides, self.out, max_workers=1)
+        self.assertEqual(summary, {'rendered': 1, 'skipped': 2, 'removed': 0})
+        self.assertEqual(export_maps.export_maps(self.rides, self.out, max_workers=1)['rendered'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
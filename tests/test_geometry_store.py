@@ -0,0 +1,102 @@
+import pickle
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from services.corridor import requests_along_route
+from services.geometry_store import GeometryStore, StoredPolyline, open_geometry_store
+from tests.test_matching import make_request, make_ride
+from ui.map_page import ride_payload
+from utils.polyline import Polyline
+
+def route_length(polyline: StoredPolyline) -> int:
+    return len(polyline.points())
+
+class TestGeometryStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = Path(self.dir.name) / "routes.f32"
+        self.store = open_geometry_store(self.path)
+        self.addCleanup(self.store.close)
+        self.route = [(48.6833, 9.0167), (48.7300, 9.1200), (48.7833, 9.2250)]
+
+    def test_views_are_zero_copy_and_read_only(self):
+        first = self.store.add(self.route)
+        second = self.store.add(Polyline.from_points(self.route[::-1]))
+        self.assertEqual((first.slot, second.slot), (0, 1))
+        view = second.points()
+        self.assertEqual(view.dtype, np.float32)
+        self.assertFalse(view.flags.owndata)
+        self.assertFalse(view.flags.writeable)
+        np.testing.assert_allclose(view, self.route[::-1], atol=1e-5)
+        self.assertEqual(self.path.stat().st_size, 6 * 2 * 4)
+        # The same route is stored once
+        self.assertEqual(self.store.add(self.route), first)
+        self.assertEqual(len(self.store), 2)
+
+    def test_other_readers_share_the_file(self):
+        """
+        A second store on the same path, as in another process, maps the
+        entries written so far and picks up later ones.
+        """
+        ref = self.store.add(self.route)
+        reader = GeometryStore(self.path)
+        np.testing.assert_array_equal(reader.points(0), ref.points())
+        later = self.store.add(self.route[:2])
+        self.assertEqual(len(reader.points(later.slot)), 2)
+
+        copied = pickle.loads(pickle.dumps(ref))
+        self.assertIs(copied.store, self.store)
+        self.assertLess(len(pickle.dumps(ref)), 200)
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            self.assertEqual(list(pool.map(route_length, [ref, later])), [3, 2])
+
+    def test_reopened_store_reuses_stored_routes(self):
+        """
+        A later run adding the same routes does not grow the file.
+        """
+        first = GeometryStore(self.path)
+        slot = first.add(self.route).slot
+        first.add(self.route[:2])
+        first.close()
+        size = self.path.stat().st_size
+
+        reopened = GeometryStore(self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.add(self.route).slot, slot)
+        self.assertEqual(self.path.stat().st_size, size)
+        self.assertEqual(reopened.add(self.route[1:]).slot, 2)
+
+    def test_writers_on_one_file_do_not_overlap(self):
+        """
+        Two writers on the same path, as in two processes, append after
+        each other's entries instead of reusing slots.
+        """
+        other = GeometryStore(self.path)
+        self.addCleanup(other.close)
+        first = self.store.add(self.route)
+        second = other.add(self.route[:2])
+        third = self.store.add(self.route[1:])
+        self.assertEqual([first.slot, second.slot, third.slot], [0, 1, 2])
+        np.testing.assert_array_equal(GeometryStore(self.path).points(1), second.points())
+        np.testing.assert_allclose(third.points(), self.route[1:], atol=1e-5)
+        np.testing.assert_allclose(other.points(2), self.route[1:], atol=1e-5)
+        self.assertEqual(self.path.stat().st_size, 7 * 2 * 4)
+
+    def test_ride_holds_reference(self):
+        """
+        Matching and map payloads read the route through the reference.
+        """
+        ride = make_ride("Driver A", 48.6833, 9.0167)
+        ride.route_polyline = self.store.add(self.route)
+        self.assertIsInstance(ride.route_polyline, StoredPolyline)
+        on_route = make_request("Rider 1", 48.7000, 9.0500)
+        self.assertEqual(requests_along_route(ride, [on_route], 2000), [on_route])
+        payload = ride_payload(ride, ride.route_polyline, [])
+        self.assertEqual(payload['route'], ride_payload(ride, self.route, [])['route'])
+        self.assertFalse(self.store.add([]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 import unittest
-from utils.helpers import haversine_distance, Coordinates
+import numpy as np
+from utils.helpers import (
+    haversine_distance, Coordinates, equirectangular_matrix, equirectangular_pairwise,
+    haversine_matrix, haversine_one_to_many, haversine_pairwise
+)
 
 class TestHelpers(unittest.TestCase):
     def test_haversine_distance(self):
@@ -9,7 +13,63 @@ class TestHelpers(unittest.TestCase):
         coord1 = Coordinates(lat=48.7758, lng=9.1829)
         coord2 = Coordinates(lat=48.7833, lng=9.2250)
         distance = haversine_distance(coord1, coord2)
-        self.assertAlmostEqual(distance, 2950, delta=100)  # Approx 2.95km
+        self.assertAlmostEqual(distance, 3196, delta=10)  # Approx 3.2km
+
+class TestVectorizedDistances(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        # Around Stuttgart, plus a few long-range and antipodal-ish points
+        self.lats = np.concatenate((rng.uniform(48.5, 49.0, 60), [0.0, -33.9, 64.1, -48.7]))
+        self.lngs = np.concatenate((rng.uniform(8.8, 9.6, 60), [0.0, 151.2, -21.9, -170.8]))
+
+    def scalar(self, i, j):
+        return haversine_distance(Coordinates(self.lats[i], self.lngs[i]),
+                                  Coordinates(self.lats[j], self.lngs[j]))
+
+    def test_pairwise_and_one_to_many_match_scalar(self):
+        """
+        Array kernels agree with the scalar haversine.
+        """
+        shifted = np.roll(np.arange(len(self.lats)), 1)
+        pairwise = haversine_pairwise(self.lats, self.lngs, self.lats[shifted], self.lngs[shifted])
+        one_to_many = haversine_one_to_many(self.lats[0], self.lngs[0], self.lats, self.lngs)
+        for i in range(len(self.lats)):
+            self.assertAlmostEqual(pairwise[i], self.scalar(i, shifted[i]), delta=1e-6)
+            self.assertAlmostEqual(one_to_many[i], self.scalar(0, i), delta=1e-6)
+
+    def test_chunked_matrix_matches_scalar(self):
+        """
+        The matrix is independent of the chunk size and matches scalar values.
+        """
+        full = haversine_matrix(self.lats, self.lngs, self.lats[:50], self.lngs[:50])
+        chunked = haversine_matrix(self.lats, self.lngs, self.lats[:50], self.lngs[:50],
+                                   chunk_elements=70)
+        self.assertEqual(full.shape, (len(self.lats), 50))
+        np.testing.assert_array_equal(full, chunked)
+        for i in range(0, len(self.lats), 7):
+            for j in range(0, 50, 11):
+                self.assertAlmostEqual(full[i, j], self.scalar(i, j), delta=1e-6)
+        self.assertTrue(np.allclose(np.diag(full[:50]), 0))
+        np.testing.assert_array_equal(
+            equirectangular_matrix(self.lats, self.lngs, self.lats[:50], self.lngs[:50]),
+            equirectangular_matrix(self.lats, self.lngs, self.lats[:50], self.lngs[:50],
+                                   chunk_elements=70)
+        )
+
+    def test_equirectangular_error_is_small_at_short_range(self):
+        """
+        The flat-earth approximation stays within 0.1% below 50 km.
+        """
+        local_lats, local_lngs = self.lats[:60], self.lngs[:60]
+        exact = haversine_matrix(local_lats, local_lngs, local_lats, local_lngs)
+        approx = equirectangular_matrix(local_lats, local_lngs, local_lats, local_lngs)
+        short = (exact > 0) & (exact < 50_000)
+        self.assertTrue(short.any())
+        self.assertLess(np.max(np.abs(approx[short] - exact[short]) / exact[short]), 1e-3)
+        np.testing.assert_allclose(
+            equirectangular_pairwise(local_lats, local_lngs, local_lats[::-1], local_lngs[::-1]),
+            np.diag(approx[:, ::-1])
+        )
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from tests.test_matching import make_request, make_ride
+from models.data_models import TripType, add_match_listener, remove_match_listener
+from ui.map_cache import RenderCache, ride_state_key
+
+class TestMapCache(unittest.TestCase):
+    def setUp(self):
+        self.ride = make_ride("Driver A", 48.6833, 9.0167)
+        self.ride.route_polyline = [(48.6833, 9.0167), (48.7833, 9.2250)]
+        self.rider = make_request("Rider 1", 48.6900, 9.0200)
+
+    def test_key_follows_ride_state(self):
+        key = ride_state_key(self.ride)
+        self.assertEqual(key, ride_state_key(self.ride))
+        self.ride.matched_riders.append(self.rider)
+        with_rider = ride_state_key(self.ride)
+        self.assertNotEqual(key, with_rider)
+        self.ride.route_polyline = self.ride.route_polyline + [(48.79, 9.23)]
+        self.assertNotEqual(with_rider, ride_state_key(self.ride))
+        self.ride.trip_type = TripType.RETURN
+        self.assertNotEqual(ride_state_key(make_ride("Driver A", 48.6833, 9.0167)), ride_state_key(self.ride))
+
+    def test_lru_memory_bound(self):
+        cache = RenderCache(max_bytes=10)
+        cache.put(("a", 1), "xxxx")
+        cache.put(("b", 1), "yyyy")
+        self.assertEqual(cache.get(("a", 1)), "xxxx")
+        cache.put(("c", 1), "zzzz")
+        self.assertIsNone(cache.get(("b", 1)))
+        self.assertEqual((len(cache), cache.size), (2, 8))
+        cache.put(("d", 1), "w" * 11)
+        self.assertIsNone(cache.get(("d", 1)))
+
+    def test_accept_and_remove_invalidate(self):
+        cache = RenderCache(max_bytes=1000)
+        cache.put(ride_state_key(self.ride), "map")
+        other = make_ride("Driver B", 48.75, 9.15)
+        cache.put(ride_state_key(other), "other map")
+        add_match_listener(cache.on_match_changed)
+        try:
+            self.rider.accept_match(self.ride)
+            self.assertEqual(len(cache), 1)
+            cache.put(ride_state_key(self.ride), "map with rider")
+            self.ride.remove_rider(self.rider)
+        finally:
+            remove_match_listener(cache.on_match_changed)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(ride_state_key(other)), "other map")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import json
+import unittest
+from tests.test_matching import make_request, make_ride
+from models.data_models import TripType
+from ui.map_page import clear_script, ride_payload, update_script
+from utils.polyline import decode
+
+class TestMapPage(unittest.TestCase):
+    def setUp(self):
+        self.ride = make_ride("Driver A", 48.6833, 9.0167)
+        self.rider = make_request("Rider 1", 48.6900, 9.0200)
+        self.polyline = [(48.6833, 9.0167), (48.7300, 9.1200), (48.7833, 9.2250)]
+
+    def test_payload_layers(self):
+        payload = ride_payload(self.ride, self.polyline, [self.rider])
+        self.assertEqual([m['id'] for m in payload['markers']],
+                         [f"start:{self.ride.id}", f"end:{self.ride.id}", f"rider:{self.rider.id}"])
+        self.assertEqual(decode(payload['route']['encoded'])[1].tolist(), [48.73, 9.12])
+        self.assertIsNone(payload['route']['dash'])
+        self.assertEqual(payload['bounds'], [[48.6833, 9.0167], [48.7833, 9.225]])
+
+        self.ride.trip_type = TripType.RETURN
+        self.assertEqual(ride_payload(self.ride, self.polyline, [])['route']['dash'], [5, 5])
+
+    def test_route_key_tracks_route_only(self):
+        """
+        Adding a rider keeps the route key, so the page redraws only the marker.
+        """
+        base = ride_payload(self.ride, self.polyline, [])
+        with_rider = ride_payload(self.ride, self.polyline, [self.rider])
+        rerouted = ride_payload(self.ride, self.polyline[:1] + [(48.70, 9.03)] + self.polyline[1:], [self.rider])
+        self.assertEqual(base['route_key'], with_rider['route_key'])
+        self.assertNotEqual(with_rider['route_key'], rerouted['route_key'])
+        self.assertIsNone(ride_payload(self.ride, [], [])['route'])
+
+    def test_scripts_are_json_literals(self):
+        payload = ride_payload(self.ride, self.polyline, [self.rider])
+        script = update_script(payload)
+        self.assertTrue(script.startswith("carpool.update(") and script.endswith(");"))
+        self.assertEqual(json.loads(script[len("carpool.update("):-2]), payload)
+        self.assertEqual(clear_script('Fehler "x"', "</script>"), 'carpool.clear("Fehler \\"x\\"", "</script>");')
+
+if __name__ == '__main__':
+    unittest.main()
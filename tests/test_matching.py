@@ -0,0 +1,319 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+import numpy as np
+from googlemaps.exceptions import TransportError
+from models.data_models import (
+    User, Coordinates, Ride, TripType,
+    add_match_listener, remove_match_listener
+)
+from config.settings import settings
+from models.columnar import RequestStore, RideStore
+from services.matching import (
+    calculate_assigned_route, calculate_match_score, check_time_constraints, compute_matches,
+    is_candidate_pair, score_store_pairs
+)
+from services.match_index import MatchIndex
+from services.routing import RouteResult, RoutingBackend, TravelMatrix, set_routing_backend
+from utils.helpers import haversine_distance
+from utils.metrics import Metrics
+
+DEPARTURE = datetime(2024, 3, 4, 7, 30)
+WORK = Coordinates(lat=48.7833, lng=9.2250)
+
+def make_ride(name, lat, lng, seats=2, trip_type=TripType.OUTBOUND):
+    driver = User(id=name, name=name, is_driver=True, is_rider=False,
+                  residential_area=("Area", (lat, lng)))
+    return Ride(driver=driver, start_point="Home", end_point="Work",
+                start_coords=Coordinates(lat=lat, lng=lng), end_coords=WORK,
+                departure_time=DEPARTURE, max_detour_min=20, available_seats=seats,
+                trip_type=trip_type, route_distance=15.0, route_duration=20.0)
+
+def make_request(name, lat, lng, trip_type=TripType.OUTBOUND):
+    rider = User(id=name, name=name, is_driver=False, is_rider=True,
+                 residential_area=("Area", (lat, lng)))
+    return rider.request_ride(
+        start_point="Home", end_point="Work",
+        start_coords=Coordinates(lat=lat, lng=lng), end_coords=WORK,
+        desired_arrival_time=DEPARTURE + timedelta(minutes=30),
+        time_flexibility_min=30, trip_type=trip_type
+    )
+
+def fake_detour(ride, request):
+    """
+    Deterministic stand-in for the Directions API: detour grows with the
+    straight-line distance of the pickup from the driver's start.
+    """
+    extra_km = haversine_distance(ride.start_coords, request.start_coords) / 1000
+    return [(0.0, 0.0)], ride.route_distance + extra_km, ride.route_duration + extra_km
+
+class StraightLineBackend(RoutingBackend):
+    """
+    Offline backend driving straight lines at 50 km/h.
+    """
+
+    def __init__(self):
+        self.matrix_calls = 0
+
+    def _leg(self, a, b):
+        meters = haversine_distance(Coordinates(*a), Coordinates(*b))
+        return meters / (50 / 3.6), meters
+
+    def route(self, origin, destination, departure_time=None):
+        return self.detour(origin, destination, [], departure_time)
+
+    def detour(self, origin, destination, waypoints, departure_time=None):
+        stops = [origin, *waypoints, destination]
+        legs = [self._leg(a, b) for a, b in zip(stops, stops[1:])]
+        return RouteResult(distance_m=sum(m for _, m in legs),
+                           duration_s=sum(s for s, _ in legs), polyline=stops)
+
+    def travel_times(self, origins, destinations, departure_time=None):
+        self.matrix_calls += 1
+        legs = [[self._leg(o, d) for d in destinations] for o in origins]
+        return TravelMatrix(durations_s=[[s for s, _ in row] for row in legs],
+                            distances_m=[[m for _, m in row] for row in legs])
+
+class TestMatching(unittest.TestCase):
+    def setUp(self):
+        mode = patch.object(settings, 'DETOUR_MODE', 'directions')
+        mode.start()
+        self.addCleanup(mode.stop)
+        self.rides = [
+            make_ride("Driver A", 48.6833, 9.0167),
+            make_ride("Driver A", 48.6833, 9.0167, trip_type=TripType.RETURN),
+            make_ride("Driver B", 48.7500, 9.1500, seats=1),
+        ]
+        self.requests = [
+            make_request("Rider 1", 48.6900, 9.0200),
+            make_request("Rider 2", 48.7450, 9.1400),
+            make_request("Rider 3", 48.8378, 10.0933),  # Aalen
+            make_request("Rider 4", 48.7000, 9.0300, trip_type=TripType.RETURN),
+        ]
+
+    def test_prefilter(self):
+        """
+        Far-away pickups and mismatched trip types never reach routing.
+        """
+        ride = self.rides[0]
+        self.assertTrue(is_candidate_pair(ride, self.requests[0]))
+        self.assertFalse(is_candidate_pair(ride, self.requests[2]))
+        self.assertFalse(is_candidate_pair(ride, self.requests[3]))
+
+    def test_time_windows_prune_before_routing(self):
+        """
+        Requests whose arrival window misses the ride's arrival range are
+        never routed.
+        """
+        evening = make_request("Evening", 48.6900, 9.0200)
+        evening.desired_arrival_time = DEPARTURE + timedelta(hours=10)
+        with patch('services.matching.calculate_detour', side_effect=fake_detour) as detour:
+            matches = compute_matches(self.rides[:1], [evening], max_workers=1)
+            self.assertEqual(detour.call_count, 0)
+            index = MatchIndex(self.rides[:1], [], max_workers=1)
+            index.add_request(evening)
+            self.assertEqual(detour.call_count, 0)
+        self.assertEqual(matches, {})
+
+    def test_dropoff_index_prunes_before_pair_checks(self):
+        """
+        Requests ending far from the driver's destination are dropped by the
+        dropoff index, before any pair-by-pair check.
+        """
+        elsewhere = make_request("Elsewhere", 48.6900, 9.0200)
+        elsewhere.end_coords = Coordinates(lat=48.8378, lng=10.0933)  # Aalen
+        requests = [self.requests[0], elsewhere]
+        with patch('services.matching.calculate_detour', side_effect=fake_detour), \
+                patch('services.matching.is_candidate_pair', side_effect=is_candidate_pair) as direct, \
+                patch('services.match_index.is_candidate_pair', side_effect=is_candidate_pair) as indexed:
+            matches = compute_matches(self.rides[:1], requests, max_workers=1)
+            index = MatchIndex(self.rides[:1], requests, max_workers=1)
+        for check in (direct, indexed):
+            self.assertEqual([args[0][1] for args in check.call_args_list], [self.requests[0]])
+        self.assertEqual(index.as_dict(), matches)
+
+    def test_concurrent_matches_equal_sequential(self):
+        """
+        Thread pool evaluation yields exactly the sequential result.
+        """
+        with patch('services.matching.calculate_detour', side_effect=fake_detour) as detour:
+            sequential = compute_matches(self.rides, self.requests, max_workers=1)
+            calls = detour.call_count
+            concurrent = compute_matches(self.rides, self.requests, max_workers=4)
+        self.assertEqual(sequential, concurrent)
+        self.assertEqual([m['request'] for m in sequential[self.rides[1].id]], [self.requests[3]])
+        self.assertLess(calls, len(self.rides) * len(self.requests))
+        self.assertEqual([m['request'] for m in sequential[self.rides[0].id]],
+                         [self.requests[0], self.requests[1]])
+
+    def test_matrix_detours_equal_directions(self):
+        """
+        Insertion arithmetic on matrix legs reproduces full detour routes.
+        """
+        backend = StraightLineBackend()
+        set_routing_backend(backend)
+        self.addCleanup(set_routing_backend, None)
+
+        directions = compute_matches(self.rides, self.requests, max_workers=1)
+        with patch.object(settings, 'DETOUR_MODE', 'matrix'):
+            matrix = compute_matches(self.rides, self.requests, max_workers=1)
+
+        self.assertEqual(directions.keys(), matrix.keys())
+        for ride_id, entries in directions.items():
+            self.assertEqual([m['request'] for m in entries], [m['request'] for m in matrix[ride_id]])
+            for expected, actual in zip(entries, matrix[ride_id]):
+                self.assertAlmostEqual(expected['score'], actual['score'])
+        self.assertLessEqual(backend.matrix_calls, 2 + len(self.requests))
+
+    def test_failed_matrix_block_keeps_other_blocks(self):
+        """
+        A matrix query that fails only loses the pairs of its own block.
+        """
+        backend = StraightLineBackend()
+        failing = (self.rides[2].start_coords.lat, self.rides[2].start_coords.lng)
+        travel_times = backend.travel_times
+
+        def flaky(origins, destinations, departure_time=None):
+            if failing in origins:
+                raise TransportError("connection reset")
+            return travel_times(origins, destinations, departure_time)
+
+        backend.travel_times = flaky
+        set_routing_backend(backend)
+        self.addCleanup(set_routing_backend, None)
+        metrics = Metrics(enabled=True)
+        with patch.object(settings, 'DETOUR_MODE', 'matrix'), \
+                patch('services.travel_matrix.MATRIX_BLOCK_RIDES', 1), \
+                patch('services.travel_matrix.metrics', metrics):
+            matches = compute_matches(self.rides, self.requests, max_workers=1)
+
+        self.assertEqual({m['request'].id for m in matches[self.rides[0].id]},
+                         {self.requests[0].id, self.requests[1].id})
+        self.assertNotIn(self.rides[2].id, matches)
+        self.assertEqual(metrics.snapshot()['counters'], {'errors.matrix_detours': 1})
+
+    def test_match_index_incremental(self):
+        """
+        Accept/remove update the index without re-evaluating pairs.
+        """
+        with patch('services.matching.calculate_detour', side_effect=fake_detour) as detour:
+            index = MatchIndex(self.rides, self.requests, max_workers=1)
+            self.assertEqual(index.as_dict(), compute_matches(self.rides, self.requests, max_workers=1))
+            add_match_listener(index.on_match_changed)
+            try:
+                detour.reset_mock()
+                driver_b = self.rides[2]
+                rider_2 = self.requests[1]
+                rider_2.accept_match(driver_b)
+                self.assertEqual(index.matches_for(driver_b), [])
+                self.assertEqual(detour.call_count, 0)
+                self.assertNotIn(rider_2, [m['request'] for m in index.matches_for(self.rides[0])])
+
+                driver_b.remove_rider(rider_2)
+                self.assertIsNone(rider_2.matched_ride)
+                self.assertIn(rider_2, [m['request'] for m in index.matches_for(driver_b)])
+                # Only the freed ride is rescored
+                self.assertLessEqual(detour.call_count, len(self.requests))
+                self.assertEqual({args[0][0].id for args in detour.call_args_list}, {driver_b.id})
+            finally:
+                remove_match_listener(index.on_match_changed)
+
+    def test_assigned_route_uses_rider_snapshot(self):
+        """
+        A snapshot of the riders is routed even after the ride changed.
+        """
+        set_routing_backend(StraightLineBackend())
+        self.addCleanup(set_routing_backend, None)
+        ride = self.rides[0]
+        self.requests[0].accept_match(ride)
+        snapshot = list(ride.matched_riders)
+        self.requests[1].accept_match(ride)
+        route = calculate_assigned_route(ride, snapshot)
+        pickup = (self.requests[0].start_coords.lat, self.requests[0].start_coords.lng)
+        other = (self.requests[1].start_coords.lat, self.requests[1].start_coords.lng)
+        self.assertIn(pickup, route.polyline)
+        self.assertNotIn(other, route.polyline)
+        self.assertIn(other, calculate_assigned_route(ride).polyline)
+
+    def test_match_index_deferred_evaluation(self):
+        """
+        Scoring ride by ride gives the same matrix as the eager build.
+        """
+        with patch('services.matching.calculate_detour', side_effect=fake_detour) as detour:
+            eager = MatchIndex(self.rides, self.requests, max_workers=1).as_dict()
+            calls = detour.call_count
+            detour.reset_mock()
+            index = MatchIndex(self.rides, self.requests, max_workers=1, evaluate=False)
+            self.assertEqual(detour.call_count, 0)
+            self.assertEqual(index.matches_for(self.rides[0]), [])
+            for ride in reversed(self.rides):
+                self.assertEqual(index.evaluate_ride(ride), eager.get(ride.id, []))
+            self.assertEqual(index.as_dict(), eager)
+            self.assertEqual(detour.call_count, calls)
+
+    def test_offset_aware_times(self):
+        """
+        Offset timestamps score like their naive equivalents, also when
+        ride and request use different offsets.
+        """
+        with patch('services.matching.calculate_detour', side_effect=fake_detour):
+            naive = compute_matches(self.rides[:1], self.requests[:2], max_workers=1)
+            self.rides[0].departure_time = DEPARTURE.replace(tzinfo=timezone(timedelta(hours=1)))
+            for request in self.requests[:2]:
+                # 08:00+01:00 as 07:00 UTC
+                request.desired_arrival_time = (DEPARTURE + timedelta(minutes=30)).replace(tzinfo=timezone.utc) \
+                    - timedelta(hours=1)
+            aware = compute_matches(self.rides[:1], self.requests[:2], max_workers=1)
+        self.assertEqual(aware, naive)
+        self.assertEqual(len(aware[self.rides[0].id]), 2)
+
+class TestBatchScoring(unittest.TestCase):
+    def test_batch_kernels_match_scalar(self):
+        """
+        Store-based batch scoring reproduces the per-pair functions.
+        """
+        rng = random.Random(4)
+        rides = [make_ride(f"D{i}", 48.7, 9.0) for i in range(20)]
+        for ride in rides:
+            ride.route_duration = rng.uniform(10, 40)
+            ride.route_distance = rng.choice([0.0, rng.uniform(5, 30)])
+            ride.max_detour_min = rng.randint(5, 30)
+            ride.departure_time = DEPARTURE + timedelta(minutes=rng.randint(-30, 30))
+        requests = [make_request(f"R{i}", 48.7, 9.0) for i in range(30)]
+        for request in requests:
+            request.time_flexibility_min = rng.randint(5, 40)
+
+        ride_rows = np.array([rng.randrange(len(rides)) for _ in range(500)])
+        request_rows = np.array([rng.randrange(len(requests)) for _ in range(500)])
+        base = np.array([rides[i].route_duration for i in ride_rows])
+        new_duration = base + np.array([rng.uniform(-2, 40) for _ in ride_rows])
+        new_distance = np.array([rng.uniform(5, 50) for _ in ride_rows])
+
+        feasible, scores = score_store_pairs(
+            RideStore.from_objects(rides), RequestStore.from_objects(requests),
+            ride_rows, request_rows, new_distance, new_duration
+        )
+        for k, (i, j) in enumerate(zip(ride_rows, request_rows)):
+            ride, request = rides[i], requests[j]
+            self.assertEqual(bool(feasible[k]), check_time_constraints(ride, request, new_duration[k]))
+            self.assertAlmostEqual(scores[k], calculate_match_score(ride, request, new_distance[k], new_duration[k]))
+
+    def test_wide_flexibility_window(self):
+        """
+        Windows over 9 hours do not overflow the int16 column in seconds.
+        """
+        ride = make_ride("D", 48.7, 9.0)
+        request = make_request("R", 48.7, 9.0)
+        request.desired_arrival_time = DEPARTURE + timedelta(hours=10)
+        request.time_flexibility_min = 12 * 60
+        new_duration = np.array([ride.route_duration + 5])
+        feasible, _ = score_store_pairs(
+            RideStore.from_objects([ride]), RequestStore.from_objects([request]),
+            np.array([0]), np.array([0]), np.array([ride.route_distance]), new_duration
+        )
+        self.assertTrue(check_time_constraints(ride, request, new_duration[0]))
+        self.assertTrue(feasible[0])
+
+if __name__ == '__main__':
+    unittest.main()
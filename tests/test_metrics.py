@@ -0,0 +1,66 @@
+import json
+import tempfile
+import unittest
+import urllib.request
+from pathlib import Path
+
+from utils.metrics import Histogram, Metrics, status_line
+
+class TestMetrics(unittest.TestCase):
+    def test_disabled_records_nothing(self):
+        metrics = Metrics(enabled=False)
+        with metrics.span("compute_matches"):
+            metrics.count("api.directions")
+        self.assertEqual(metrics.timed("f")(lambda x: x + 1)(1), 2)
+        self.assertEqual(metrics.snapshot(), {'counters': {}, 'histograms': {}})
+
+    def test_spans_counters_and_errors(self):
+        metrics = Metrics(enabled=True)
+        for _ in range(3):
+            with metrics.span("calculate_detour"):
+                pass
+        metrics.count("route_cache.hits", 3)
+        metrics.count("route_cache.misses")
+        with self.assertRaises(ValueError):
+            with metrics.span("update_map"):
+                raise ValueError("boom")
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['histograms']['calculate_detour']['count'], 3)
+        self.assertEqual(snapshot['counters'], {'route_cache.hits': 3, 'route_cache.misses': 1,
+                                                'errors.update_map': 1})
+        line = status_line(snapshot)
+        self.assertIn("Umweg 3×", line)
+        self.assertIn("Cache 75 %", line)
+        self.assertIn("Fehler 1", line)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+        for value in (0.05, 0.05, 0.5, 3.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.buckets, [2, 1, 1])
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(1.0), 3.0)
+
+    def test_json_dump_and_prometheus_endpoint(self):
+        metrics = Metrics(enabled=True)
+        metrics.count("api.directions", 2)
+        metrics.observe("compute_matches", 0.2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'metrics.json'
+            metrics.dump_json(path)
+            self.assertEqual(json.loads(path.read_text())['counters'], {'api.directions': 2})
+
+        server = metrics.serve_prometheus(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            text = urllib.request.urlopen(url, timeout=5).read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn("carpool_api_directions_total 2", text)
+        self.assertIn('carpool_compute_matches_seconds_bucket{le="0.25"} 1', text)
+        self.assertIn("carpool_compute_matches_seconds_count 1", text)
+
+if __name__ == '__main__':
+    unittest.main()
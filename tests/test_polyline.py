@@ -0,0 +1,90 @@
+import math
+import pickle
+import sys
+import unittest
+import numpy as np
+from googlemaps.convert import decode_polyline, encode_polyline
+from services.corridor import RouteGeometry
+from tests.test_matching import make_ride
+from ui.map_page import display_points, ride_payload
+from utils.polyline import Polyline, decode, encode, fit_zoom, simplify
+
+def winding_route(n=4000):
+    """
+    A dense route of n points wiggling ~100 m around a 30 km diagonal.
+    """
+    t = np.linspace(0, 1, n)
+    return np.column_stack((48.65 + 0.25 * t + 0.001 * np.sin(t * 80), 9.00 + 0.30 * t))
+
+class TestPolyline(unittest.TestCase):
+    def test_encoding_matches_google(self):
+        points = [(48.68331, 9.01672), (48.78333, 9.22501), (-33.44, -70.66), (0.0, 0.0)]
+        encoded = encode(points)
+        self.assertEqual(encoded, encode_polyline(points))
+        google = [[p['lat'], p['lng']] for p in decode_polyline(encoded)]
+        np.testing.assert_allclose(decode(encoded), google, atol=1e-9)
+        self.assertEqual(decode(encoded).tolist(), [list(p) for p in points])
+        self.assertEqual(encode([]), "")
+        with self.assertRaises(ValueError):
+            decode(encoded[:-1])
+
+    def test_polyline_behaves_like_point_list(self):
+        polyline = Polyline.from_points([(48.7, 9.0), (48.71, 9.01), (48.72, 9.03)])
+        self.assertEqual(len(polyline), 3)
+        self.assertEqual(polyline[-1], (48.72, 9.03))
+        self.assertEqual(list(polyline)[1], (48.71, 9.01))
+        self.assertFalse(Polyline())
+        self.assertEqual(pickle.loads(pickle.dumps(polyline)), polyline)
+        self.assertIs(Polyline.coerce(polyline), polyline)
+
+    def test_concat_decodes_lazily(self):
+        """
+        Joined step polylines stay separate strings until the geometry is read.
+        """
+        first, second = encode([(48.7, 9.0), (48.71, 9.01)]), encode([(48.71, 9.01), (48.72, 9.03)])
+        polyline = Polyline.concat([first, second])
+        self.assertTrue(polyline)
+        self.assertEqual(polyline._encoded, "")
+        self.assertEqual(len(polyline), 4)
+        self.assertEqual(polyline.encoded, encode([(48.7, 9.0), (48.71, 9.01), (48.71, 9.01), (48.72, 9.03)]))
+
+    def test_simplify_stays_within_tolerance(self):
+        points = winding_route()
+        for tolerance in (5, 25, 100):
+            simplified = simplify(points, tolerance)
+            self.assertLess(len(simplified), len(points))
+            self.assertEqual(simplified[0].tolist(), points[0].tolist())
+            self.assertEqual(simplified[-1].tolist(), points[-1].tolist())
+            # Every original point lies within the tolerance of the simplified line
+            distances, _ = RouteGeometry.from_polyline(simplified).locate(points[:, 0], points[:, 1])
+            self.assertLessEqual(distances.max(), tolerance * 1.01)
+        self.assertEqual(len(simplify(points[:2], 50)), 2)
+
+    def test_fit_zoom(self):
+        route = winding_route()
+        self.assertEqual(fit_zoom(route, 800), 11)
+        self.assertEqual(fit_zoom(route, 1600), 12)
+        self.assertGreater(fit_zoom(route[:100], 800), 11)
+
+    def test_ride_storage_and_payload_are_compact(self):
+        """
+        A dense route costs a few bytes per point on the ride and in the
+        map payload, against ~100 bytes per point as a list of tuples.
+        """
+        route = winding_route()
+        as_tuples = [tuple(point) for point in route.tolist()]
+        list_bytes = sys.getsizeof(as_tuples) + sum(sys.getsizeof(p) + 2 * sys.getsizeof(1.0) for p in as_tuples)
+
+        ride = make_ride("Driver A", 48.65, 9.00)
+        ride.route_polyline = Polyline.from_points(route)
+        self.assertLess(sys.getsizeof(ride.route_polyline.encoded) * 10, list_bytes)
+
+        shown = display_points(ride.route_polyline)
+        self.assertLess(len(shown) * 10, len(route))
+        payload = ride_payload(ride, ride.route_polyline, [])
+        coords_json = len(str([[round(lat, 5), round(lng, 5)] for lat, lng in as_tuples]))
+        self.assertLess(len(payload['route']['encoded']) * 10, coords_json)
+        self.assertTrue(math.isclose(payload['bounds'][1][0], route[:, 0].max(), abs_tol=1e-5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from googlemaps.exceptions import ApiError, TransportError
+from services.rate_limit import TokenBucket, call_with_retry
+
+class TestRateLimit(unittest.TestCase):
+    def test_retry_on_transport_and_quota_errors(self):
+        """
+        Retryable errors are retried, the final result is returned.
+        """
+        errors = [TransportError(), ApiError("OVER_QUERY_LIMIT")]
+
+        def flaky():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        limiter = TokenBucket(rate=1000, capacity=10)
+        self.assertEqual(call_with_retry(flaky, limiter, max_retries=2, backoff_s=0), "ok")
+
+    def test_other_errors_are_raised(self):
+        """
+        Non-retryable API errors propagate immediately.
+        """
+        calls = []
+
+        def denied():
+            calls.append(1)
+            raise ApiError("REQUEST_DENIED")
+
+        limiter = TokenBucket(rate=1000, capacity=10)
+        with self.assertRaises(ApiError):
+            call_with_retry(denied, limiter, max_retries=3, backoff_s=0)
+        self.assertEqual(len(calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+from services.road_graph import RoadGraph, LocalRoutingBackend
+
+OSM_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="48.7700" lon="9.1700"/>
+  <node id="2" lat="48.7700" lon="9.1800"/>
+  <node id="3" lat="48.7800" lon="9.1800"/>
+  <node id="4" lat="48.7800" lon="9.1700"/>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="highway" v="primary"/>
+  </way>
+  <way id="11">
+    <nd ref="3"/><nd ref="4"/><nd ref="1"/>
+    <tag k="highway" v="residential"/>
+    <tag k="oneway" v="yes"/>
+  </way>
+  <way id="12">
+    <nd ref="2"/><nd ref="4"/>
+    <tag k="highway" v="footway"/>
+  </way>
+</osm>
+"""
+
+def grid_graph(size=12, seed=7):
+    """
+    Random-weighted grid with a few one-way streets.
+    """
+    rng = random.Random(seed)
+    lats, lngs, edges = [], [], []
+    for i in range(size):
+        for j in range(size):
+            lats.append(48.70 + i * 0.005)
+            lngs.append(9.10 + j * 0.005)
+    for i in range(size):
+        for j in range(size):
+            u = i * size + j
+            for v in ((u + 1) if j + 1 < size else None, (u + size) if i + 1 < size else None):
+                if v is None:
+                    continue
+                seconds = rng.uniform(20, 90)
+                edges.append((u, v, seconds, 400.0))
+                if rng.random() > 0.15:
+                    edges.append((v, u, seconds, 400.0))
+    return RoadGraph(lats, lngs, edges)
+
+class TestRoadGraph(unittest.TestCase):
+    def test_hierarchy_matches_dijkstra(self):
+        """
+        Contraction hierarchy queries return the same travel times.
+        """
+        plain = grid_graph()
+        contracted = grid_graph()
+        contracted.contract()
+        rng = random.Random(1)
+        for _ in range(40):
+            s, t = rng.randrange(len(plain)), rng.randrange(len(plain))
+            expected = plain.shortest_path(s, t)
+            actual = contracted.shortest_path(s, t)
+            if expected is None:
+                self.assertIsNone(actual)
+                continue
+            self.assertAlmostEqual(expected[0], actual[0], places=6)
+            path = actual[2]
+            self.assertEqual((path[0], path[-1]), (s, t))
+            # Unpacked path only uses original edges and adds up to the cost
+            cost = sum(plain.out_edges[u][v][0] for u, v in zip(path, path[1:]))
+            self.assertAlmostEqual(cost, actual[0], places=6)
+
+        sources, targets = [0, 5, 77], [143, 12, 60, 5]
+        self.assertEqual(
+            [[round(x, 6) for x in row] for row in plain.many_to_many(sources, targets)[0]],
+            [[round(x, 6) for x in row] for row in contracted.many_to_many(sources, targets)[0]]
+        )
+
+    def test_osm_import_and_roundtrip(self):
+        """
+        OSM ways become directed edges and survive save/load.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            osm = Path(tmp) / "tiny.osm"
+            osm.write_text(OSM_XML)
+            graph = RoadGraph.from_osm(osm)
+            self.assertEqual(len(graph), 4)
+            # OSM 4 -> 3 runs against the oneway, the footway is not drivable
+            self.assertNotIn(2, graph.out_edges[3])
+            self.assertNotIn(3, graph.out_edges[1])
+
+            graph.contract()
+            path = Path(tmp) / "graph.json.gz"
+            graph.save(path)
+            loaded = RoadGraph.load(path)
+            self.assertEqual(loaded.rank, graph.rank)
+            self.assertAlmostEqual(loaded.shortest_path(0, 3)[0], graph.shortest_path(0, 3)[0])
+
+    def test_local_backend(self):
+        """
+        Routes and matrices snap coordinates to the nearest graph node.
+        """
+        graph = grid_graph()
+        graph.contract()
+        backend = LocalRoutingBackend(graph)
+        origin, destination = (48.7001, 9.1001), (48.7549, 9.1549)
+        route = backend.route(origin, destination)
+        self.assertGreater(route.duration_s, 0)
+        self.assertEqual(route.polyline[0], origin)
+        self.assertEqual(route.polyline[-1], destination)
+
+        detour = backend.detour(origin, destination, [(48.7200, 9.1300)])
+        self.assertGreaterEqual(detour.duration_s, route.duration_s)
+
+        matrix = backend.travel_times([origin], [destination, origin])
+        self.assertAlmostEqual(matrix.durations_s[0][0], route.duration_s, places=6)
+        self.assertLess(matrix.durations_s[0][1], 60)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from services.route_cache import RouteCache
+
+class TestRouteCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "routes.sqlite"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_quantizes_coords_and_time(self):
+        """
+        Nearby coordinates and the same weekday slot share one key.
+        """
+        cache = RouteCache(None)
+        monday = datetime(2024, 3, 4, 7, 31)
+        tuesday = datetime(2024, 3, 5, 7, 38)
+        key1 = cache.make_key((48.77581, 9.18291), (48.7833, 9.2250), departure_time=monday)
+        key2 = cache.make_key((48.77584, 9.18289), (48.7833, 9.2250), departure_time=tuesday)
+        self.assertEqual(key1, key2)
+        self.assertNotEqual(key1, cache.make_key((48.7758, 9.1829), (48.7833, 9.2250),
+                                                 departure_time=datetime(2024, 3, 9, 7, 31)))
+
+    def test_disk_persistence_and_counters(self):
+        """
+        Values survive a new cache instance and hits/misses are counted.
+        """
+        cache = RouteCache(self.path)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", [{"legs": []}])
+        cache.close()
+
+        reopened = RouteCache(self.path)
+        self.assertEqual(reopened.get("a"), [{"legs": []}])
+        self.assertEqual(reopened.stats()['disk_hits'], 1)
+        self.assertEqual(reopened.get_or_fetch("a", lambda: self.fail("fetched")), [{"legs": []}])
+        self.assertEqual(reopened.stats()['hits'], 2)
+        reopened.close()
+
+    def test_size_and_ttl_eviction(self):
+        """
+        Old entries are evicted by size and by age.
+        """
+        cache = RouteCache(self.path, memory_size=2, max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, key)
+        self.assertEqual(len(cache._memory), 2)
+        cache._memory.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("c"), "c")
+
+        cache.ttl_s = -1
+        self.assertIsNone(cache.get("c"))
+        cache.close()
+
+    def test_row_count_follows_writes(self):
+        """
+        The running row count keeps the disk store within max_entries;
+        rewriting a key does not count as a new row.
+        """
+        cache = RouteCache(self.path, memory_size=1, max_entries=20)
+        cache.put("kept", 0)
+        cache.close()
+        cache = RouteCache(self.path, memory_size=1, max_entries=20)
+        for i in range(50):
+            cache.put(f"k{i}", i)
+            cache.put(f"k{i}", -i)
+            rows = cache._connect().execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+            self.assertEqual(rows, cache._rows)
+            self.assertLessEqual(rows, 20)
+        self.assertEqual(cache.get("k49"), -49)
+        self.assertIsNone(cache.get("kept"))
+        cache.close()
+
+    def test_disk_hits_are_written_in_batches(self):
+        """
+        Disk hits do not write to the file one by one, but their access
+        times are in place before the next trim.
+        """
+        cache = RouteCache(self.path, memory_size=1, max_entries=3)
+        for key in ("a", "b", "c"):
+            cache.put(key, key)
+        conn = cache._connect()
+        changes = conn.total_changes
+        for _ in range(3):
+            cache._memory.clear()
+            self.assertEqual(cache.get("a"), "a")
+        self.assertEqual(conn.total_changes, changes)
+        cache.put("d", "d")
+        cache._memory.clear()
+        self.assertEqual(cache.get("a"), "a")
+        self.assertIsNone(cache.get("b"))
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import benchmark
+import main
+from services.routing import set_routing_backend
+from tests.test_matching import StraightLineBackend
+from utils.scenario import SCENARIO_DATE, generate_scenario
+
+class TestScenario(unittest.TestCase):
+    def test_seeded_scenarios_are_reproducible(self):
+        """
+        The same seed gives the same scenario, ids included.
+        """
+        first, second = generate_scenario(40, seed=9), generate_scenario(40, seed=9)
+        self.assertEqual([r.id for r in first.rides], [r.id for r in second.rides])
+        self.assertEqual([(r.start_coords, r.desired_arrival_time) for r in first.requests],
+                         [(r.start_coords, r.desired_arrival_time) for r in second.requests])
+        self.assertNotEqual([r.id for r in generate_scenario(40, seed=10).rides],
+                            [r.id for r in first.rides])
+        self.assertEqual((len(first.rides), len(first.requests)), (40, 40))
+
+    def test_main_scenario_is_reproducible(self):
+        """
+        main.py's scenario with a seed is the same in every run, so its
+        routing calls can be recorded once and replayed.
+        """
+        set_routing_backend(StraightLineBackend())
+        self.addCleanup(set_routing_backend, None)
+
+        def snapshot(seed):
+            rides, requests = main.test_stuttgart_roundtrip_scenario(seed)
+            return ([(r.id, r.driver.id, r.start_coords, r.end_coords, r.departure_time, r.available_seats)
+                     for r in rides],
+                    [(r.id, r.rider.id, r.start_coords, r.end_coords, r.desired_arrival_time)
+                     for r in requests])
+
+        first = snapshot(5)
+        self.assertEqual(first, snapshot(5))
+        self.assertNotEqual(first, snapshot(6))
+        self.assertEqual((len(first[0]), len(first[1])), (50, 50))
+        self.assertTrue(all(ride[4].date() == SCENARIO_DATE.date() for ride in first[0]))
+
+    def test_benchmark_reports_metrics(self):
+        """
+        A small run reports every stage and consistent pair counts.
+        """
+        result = benchmark.run_benchmark(50, seed=1)
+        self.assertEqual(set(result['timings']),
+                         {'generate_s', 'base_routes_s', 'matching_s', 'assignment_s'})
+        self.assertEqual(result['pairs_total'], result['pairs_evaluated'] + result['pairs_pruned'])
+        self.assertEqual(result['routing_calls']['route'], result['rides'])
+        self.assertGreater(result['matches'], 0)
+        self.assertEqual(benchmark.run_benchmark(50, seed=1, trace_memory=False)['matches'], result['matches'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import random
+import unittest
+from models.data_models import Coordinates
+from utils.helpers import haversine_distance
+from utils.spatial_index import GridIndex
+
+class TestGridIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        self.points = {
+            i: Coordinates(lat=rng.uniform(48.5, 49.0), lng=rng.uniform(8.8, 9.6))
+            for i in range(2000)
+        }
+        self.index = GridIndex(cell_size_m=1500)
+        for key, coords in self.points.items():
+            self.index.insert(key, coords)
+        self.center = Coordinates(lat=48.7758, lng=9.1829)
+
+    def brute_force(self, center):
+        return sorted((haversine_distance(center, c), k) for k, c in self.points.items())
+
+    def test_radius_and_knn_match_linear_scan(self):
+        """
+        Radius and k-nearest queries agree with a full scan.
+        """
+        expected = self.brute_force(self.center)
+        for radius in (500, 5_000, 20_000, 200_000):
+            hits = self.index.within(self.center, radius)
+            self.assertEqual({k for _, k in hits}, {k for d, k in expected if d <= radius})
+        for k in (1, 7, 100):
+            self.assertEqual([key for _, key in self.index.nearest(self.center, k)],
+                             [key for _, key in expected[:k]])
+        self.assertEqual(len(self.index.nearest(self.center, 5000)), len(self.points))
+
+    def test_incremental_updates(self):
+        """
+        Removed points disappear and moved points are found at their new place.
+        """
+        nearest = self.index.nearest(self.center, 1)[0][1]
+        self.assertTrue(self.index.remove(nearest))
+        self.assertFalse(self.index.remove(nearest))
+        del self.points[nearest]
+        self.assertEqual(self.index.nearest(self.center, 1)[0][1], self.brute_force(self.center)[0][1])
+
+        self.index.insert(42, self.center)
+        self.assertEqual(self.index.nearest(self.center, 1), [(0.0, 42)])
+        self.assertEqual(len(self.index), len(self.points))
+
+if __name__ == '__main__':
+    unittest.main()
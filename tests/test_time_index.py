@@ -0,0 +1,35 @@
+import random
+import unittest
+from utils.time_index import IntervalIndex
+
+class TestIntervalIndex(unittest.TestCase):
+    def test_overlapping_matches_brute_force(self):
+        """
+        Bisect queries agree with a linear scan, also after removals.
+        """
+        rng = random.Random(7)
+        intervals = []
+        index = IntervalIndex()
+        for i in range(300):
+            start = rng.uniform(0, 1000)
+            end = None if i % 50 == 0 else start + rng.uniform(0, 40)
+            intervals.append((start, end, i))
+            index.insert(start, end, i)
+        for start, _, item in intervals[::3]:
+            self.assertTrue(index.remove(start, item))
+        intervals = [entry for n, entry in enumerate(intervals) if n % 3]
+        self.assertEqual(len(index), len(intervals))
+
+        for _ in range(200):
+            lo = rng.uniform(-50, 1050)
+            hi = None if rng.random() < 0.1 else lo + rng.uniform(0, 30)
+            expected = {
+                item for start, end, item in intervals
+                if (hi is None or start <= hi) and (end is None or end >= lo)
+            }
+            found = index.overlapping(lo, hi)
+            self.assertEqual(set(found), expected)
+            self.assertEqual(len(found), len(expected))
+
+if __name__ == '__main__':
+    unittest.main()
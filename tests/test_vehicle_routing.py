@@ -0,0 +1,134 @@
+import unittest
+from datetime import datetime, timedelta
+from models.data_models import User, Coordinates, Ride, RideRequest
+from services.assignment import assign_all
+from services.routing import RoutingBackend, TravelMatrix, set_routing_backend
+from services.travel_matrix import LegTable
+from services.vehicle_routing import (
+    Stop, evaluate, fill_ride_legs, insertion_detours, is_feasible, plan_ride
+)
+from utils.helpers import haversine_distance
+
+DEPARTURE = datetime(2024, 3, 4, 7, 0)
+
+class GridBackend(RoutingBackend):
+    """
+    Straight lines at 36 km/h (10 m/s).
+    """
+
+    def route(self, origin, destination, departure_time=None):
+        raise NotImplementedError
+
+    def detour(self, origin, destination, waypoints, departure_time=None):
+        raise NotImplementedError
+
+    def travel_times(self, origins, destinations, departure_time=None):
+        meters = [[haversine_distance(Coordinates(*o), Coordinates(*d)) for d in destinations]
+                  for o in origins]
+        return TravelMatrix(durations_s=[[m / 10 for m in row] for row in meters], distances_m=meters)
+
+def make_request(name, start, end, arrival=DEPARTURE + timedelta(minutes=60), flex=60):
+    rider = User(id=name, name=name, is_driver=False, is_rider=True, residential_area=("A", start))
+    return RideRequest(rider=rider, start_point="S", end_point="E",
+                       start_coords=Coordinates(*start), end_coords=Coordinates(*end),
+                       desired_arrival_time=arrival, time_flexibility_min=flex)
+
+class TestVehicleRouting(unittest.TestCase):
+    def setUp(self):
+        driver = User(id="d", name="Driver", is_driver=True, is_rider=False, residential_area=("A", (0, 0)))
+        self.ride = Ride(driver=driver, start_point="Home", end_point="Work",
+                         start_coords=Coordinates(48.70, 9.00), end_coords=Coordinates(48.70, 9.20),
+                         departure_time=DEPARTURE, max_detour_min=15, available_seats=2,
+                         route_distance=14.7, route_duration=24.5)
+        self.backend = GridBackend()
+
+    def test_insertion_respects_order_and_beats_naive_sequence(self):
+        """
+        Stops along the way are visited in road order, not pickups first.
+        """
+        first = make_request("first", (48.70, 9.03), (48.70, 9.08))
+        second = make_request("second", (48.70, 9.10), (48.70, 9.15))
+        first.accept_match(self.ride)
+
+        plan = plan_ride(self.ride, second, backend=self.backend)
+        self.assertIsNotNone(plan)
+        self.assertTrue(is_feasible(plan))
+        order = [(stop.request.rider.name, stop.is_pickup) for stop in plan.stops]
+        self.assertEqual(order, [("first", True), ("first", False), ("second", True), ("second", False)])
+
+        table = LegTable()
+        fill_ride_legs(self.ride, [first, second], table, self.backend)
+        naive = evaluate(self.ride, [Stop(first, True), Stop(second, True),
+                                     Stop(first, False), Stop(second, False)], table)
+        self.assertLessEqual(plan.duration_min, naive.duration_min + 1e-9)
+
+    def test_capacity_detour_and_windows(self):
+        """
+        Full rides, oversized detours and missed arrival windows are rejected.
+        """
+        on_way = make_request("on way", (48.70, 9.05), (48.70, 9.15))
+        far = make_request("far", (48.80, 9.05), (48.70, 9.15))
+        late = make_request("late", (48.70, 9.05), (48.70, 9.15),
+                            arrival=DEPARTURE + timedelta(minutes=5), flex=5)
+        results = insertion_detours(
+            [(self.ride, on_way), (self.ride, far), (self.ride, late)], self.backend
+        )
+        self.assertIsNotNone(results[0][0])
+        self.assertIsNone(results[1][0])
+        self.assertIsNone(results[2][0])
+
+        self.ride.available_seats = 1
+        make_request("seated", (48.70, 9.01), (48.70, 9.19)).accept_match(self.ride)
+        self.assertIsNone(plan_ride(self.ride, on_way, backend=self.backend))
+
+    def test_insertion_legs_grow_linearly(self):
+        """
+        Candidates inserted one at a time only need legs to the ride's own
+        stops, and score the same as planning each pair on its own.
+        """
+        elements = []
+        travel_times = self.backend.travel_times
+
+        def counted(origins, destinations, departure_time=None):
+            elements.append(len(origins) * len(destinations))
+            return travel_times(origins, destinations, departure_time)
+
+        self.backend.travel_times = counted
+        make_request("seated", (48.70, 9.02), (48.70, 9.18)).accept_match(self.ride)
+        candidates = [make_request(f"c{i}", (48.701 + i / 1000, 9.04 + i / 100), (48.70, 9.15 - i / 100))
+                      for i in range(6)]
+        results = insertion_detours([(self.ride, c) for c in candidates], self.backend)
+
+        # 3x3 fixed legs, 3x12 and 12x3 to and from candidates, 6 own trips
+        self.assertEqual(sum(elements), 9 + 36 + 36 + 6)
+        for candidate, (_, km, minutes) in zip(candidates, results):
+            plan = plan_ride(self.ride, candidate, backend=self.backend)
+            self.assertAlmostEqual(minutes, plan.duration_min)
+            self.assertAlmostEqual(km, plan.distance_km)
+
+    def test_assignment_keeps_joint_detour_within_limit(self):
+        """
+        Riders that each fit alone but not all together are not all assigned.
+        """
+        set_routing_backend(self.backend)
+        self.addCleanup(set_routing_backend, None)
+        self.ride.available_seats = 3
+        riders = [
+            make_request("a", (48.73, 9.05), (48.70, 9.20)),
+            make_request("b", (48.67, 9.10), (48.70, 9.20)),
+            make_request("c", (48.73, 9.15), (48.70, 9.20)),
+        ]
+        for rider in riders:
+            self.assertIsNotNone(plan_ride(self.ride, rider, backend=self.backend))
+        self.assertIsNone(plan_ride(self.ride, riders[2], riders=riders[:2], backend=self.backend))
+
+        matches = {self.ride.id: [{'request': rider, 'score': score, 'details': {}}
+                                  for rider, score in zip(riders, (0.9, 0.8, 0.7))]}
+        plan = assign_all([self.ride], riders, matches)
+        self.assertEqual(plan[self.ride.id], riders[:2])
+        self.assertEqual(self.ride.matched_riders, riders[:2])
+        self.assertIsNone(riders[2].matched_ride)
+        self.assertLessEqual(plan_ride(self.ride, backend=self.backend).detour_min, self.ride.max_detour_min)
+
+if __name__ == '__main__':
+    unittest.main()
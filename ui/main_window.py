@@ -1,17 +1,18 @@
-import folium
-import io
-from folium.plugins import AntPath
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QListWidget, QTextEdit, QPushButton,
+    QLabel, QListWidget, QListWidgetItem, QTextEdit, QPushButton,
     QComboBox, QSplitter, QMessageBox
 )
 from PyQt5.QtWebEngineWidgets import QWebEngineView
-from PyQt5.QtCore import QUrl, Qt
+from PyQt5.QtCore import QUrl, Qt, QThreadPool
 from PyQt5.QtGui import QFont
-from ui.widgets import RideListItem, LoadingWidget
-from models.data_models import TripType
-from services.matching import compute_matches
+from ui.widgets import RideListItem, LoadingWidget, MetricsPanel
+from ui.map_cache import RenderCache, ride_state_key
+from ui.map_page import MAP_PAGE_HTML, clear_script, update_script
+from ui.workers import AssignJob, MapJob, MatchingJob, MatchUpdateJob
+from models.data_models import TripType, add_match_listener, remove_match_listener
+from config.settings import settings
+from utils.metrics import metrics
 
 class CarpoolWindow(QMainWindow):
     def __init__(self, rides, ride_requests):
@@ -20,7 +21,20 @@ class CarpoolWindow(QMainWindow):
         self.ride_requests = ride_requests
         self.current_ride = None
         self.current_request = None
-        self.matrix = None
+        self.match_index = None
+        # Matching, rescoring, assignment and map rendering run on the pool;
+        # only the latest job of each kind may update the window
+        self.thread_pool = QThreadPool.globalInstance()
+        self.matching_job = None
+        self.map_job = None
+        # Update or assignment job holding the index; the window leaves the
+        # index alone until it is handed back
+        self.index_job = None
+        self.partial_matches = {}
+        self.pending_changes = []
+        self.map_cache = RenderCache(settings.MAP_CACHE_MAX_BYTES)
+        add_match_listener(self.on_match_changed)
+        add_match_listener(self.map_cache.on_match_changed)
         self.init_ui()
         self.update_matrix()
         
@@ -48,6 +62,9 @@ class CarpoolWindow(QMainWindow):
         
         main_layout.addWidget(splitter)
         self.setCentralWidget(main_widget)
+        if metrics.enabled:
+            self.metrics_panel = MetricsPanel(metrics)
+            self.statusBar().addPermanentWidget(self.metrics_panel)
         self.update_rides_list()
 
     def create_left_panel(self):
@@ -96,6 +113,10 @@ class CarpoolWindow(QMainWindow):
         layout.addWidget(QLabel("Passende Mitfahrer:"))
         layout.addWidget(self.matches_list)
 
+        self.matching_loading = LoadingWidget("Passende Mitfahrer werden berechnet...")
+        self.matching_loading.hide()
+        layout.addWidget(self.matching_loading)
+
         button_panel = QWidget()
         button_layout = QHBoxLayout(button_panel)
         
@@ -107,9 +128,13 @@ class CarpoolWindow(QMainWindow):
         self.remove_rider_btn.clicked.connect(self.on_remove_rider)
         self.remove_rider_btn.setEnabled(False)
         
+        self.assign_all_btn = QPushButton("Alle automatisch zuordnen")
+        self.assign_all_btn.clicked.connect(self.on_assign_all)
+        
         button_layout.addWidget(self.add_rider_btn)
         button_layout.addWidget(self.remove_rider_btn)
         layout.addWidget(button_panel)
+        layout.addWidget(self.assign_all_btn)
 
         return panel
 
@@ -126,8 +151,16 @@ class CarpoolWindow(QMainWindow):
         self.ride_info.setMinimumHeight(150)
         layout.addWidget(self.ride_info)
 
+        self.map_loading = LoadingWidget("Karte wird geladen...")
+        self.map_loading.hide()
+        layout.addWidget(self.map_loading)
+
+        # One persistent Leaflet page; rides are pushed into it as JSON
+        self.map_ready = False
+        self.pending_map_script = None
         self.map_view = QWebEngineView()
-        self.map_view.setHtml(self.get_empty_map_html())
+        self.map_view.loadFinished.connect(self.on_map_page_loaded)
+        self.map_view.setHtml(MAP_PAGE_HTML)
         layout.addWidget(self.map_view)
 
         return panel
@@ -174,11 +207,124 @@ class CarpoolWindow(QMainWindow):
 
     def update_matrix(self):
         """
-        Calculate matching matrix between rides and requests.
+        Calculate the matching matrix between rides and requests in the
+        background. Each ride's matches are shown as soon as they are
+        scored; later accept/remove events update the finished index
+        incrementally.
+        """
+        for job in (self.matching_job, self.index_job):
+            if job:
+                job.cancel()
+        self.index_job = None
+        self.match_index = None
+        self.partial_matches = {}
+        self.pending_changes = []
+
+        job = MatchingJob(self.rides, self.ride_requests)
+        job.signals.progress.connect(lambda progress: self.on_matching_progress(job, progress))
+        job.signals.finished.connect(lambda index: self.on_matching_finished(job, index))
+        job.signals.failed.connect(lambda error: self.on_matching_failed(job, error))
+        if self.current_ride:
+            job.prioritize(self.current_ride.id)
+        self.matching_job = job
+
+        self.matching_loading.set_progress(0, len(self.rides))
+        self.matching_loading.show()
+        self.assign_all_btn.setEnabled(False)
+        self.update_matches_list()
+        self.thread_pool.start(job)
+
+    def on_matching_progress(self, job, progress):
+        """
+        Store one ride's matches from the running matching job.
+        """
+        if job is not self.matching_job:
+            return
+        ride_id, entries, done, total = progress
+        self.partial_matches[ride_id] = entries
+        self.matching_loading.set_progress(done, total)
+        if self.current_ride and self.current_ride.id == ride_id:
+            self.update_matches_list()
+
+    def on_matching_finished(self, job, index):
+        """
+        Take over the finished index once the accept/remove events that
+        happened while it was being built are replayed.
+        """
+        if job is not self.matching_job:
+            return
+        self.matching_job = None
+        self.take_index(index)
+
+    def on_matching_failed(self, job, error):
+        if job is not self.matching_job:
+            return
+        self.matching_job = None
+        self.matching_loading.hide()
+        QMessageBox.warning(self, "Fehler", f"Mitfahrer konnten nicht berechnet werden: {error}")
+
+    def on_match_changed(self, ride, request, matched):
+        """
+        Listener for accept_match/remove_rider. Rescoring routes the ride
+        again, so events are replayed on the index in the background as
+        soon as it is not busy.
+        """
+        self.pending_changes.append((ride, request, matched))
+        if self.match_index:
+            self.start_index_job(MatchUpdateJob(self.match_index, self.pending_changes))
+            self.pending_changes = []
+
+    def start_index_job(self, job):
+        """
+        Hand the index to a background job. Until it comes back, the
+        matches list shows the entries scored so far.
+        """
+        self.partial_matches = self.match_index.as_dict()
+        self.match_index = None
+        self.index_job = job
+        job.signals.finished.connect(lambda result: self.on_index_job_finished(job, result))
+        job.signals.failed.connect(lambda error: self.on_index_job_failed(job, error))
+        self.matching_loading.set_progress(0, 0)
+        self.matching_loading.show()
+        self.assign_all_btn.setEnabled(False)
+        self.update_matches_list()
+        self.thread_pool.start(job)
+
+    def take_index(self, index):
+        """
+        Use the index again, or first replay events that arrived meanwhile.
         """
-        self.matrix = compute_matches(self.rides, self.ride_requests)
+        if self.pending_changes:
+            self.match_index = index
+            self.start_index_job(MatchUpdateJob(index, self.pending_changes))
+            self.pending_changes = []
+            return
+        self.match_index = index
+        self.partial_matches = {}
+        self.matching_loading.hide()
+        self.assign_all_btn.setEnabled(True)
         self.update_matches_list()
 
+    def on_index_job_finished(self, job, result):
+        if job is not self.index_job:
+            return
+        self.index_job = None
+        if isinstance(job, AssignJob):
+            self.apply_assignment(job, *result)
+        else:
+            self.take_index(result)
+
+    def on_index_job_failed(self, job, error):
+        if job is not self.index_job:
+            return
+        self.index_job = None
+        QMessageBox.warning(self, "Fehler", f"Mitfahrer konnten nicht berechnet werden: {error}")
+        if isinstance(job, AssignJob):
+            self.take_index(job.index)
+        else:
+            # Partly updated; build it again
+            self.update_matrix()
+
     def update_rides_list(self):
         """
         Update the list of available rides.
@@ -205,18 +351,29 @@ class CarpoolWindow(QMainWindow):
         self.matches_list.clear()
         if not self.current_ride:
             return
+
+        ride = self.current_ride
+        if self.match_index:
+            matches = self.match_index.matches_for(ride)
+        elif len(ride.matched_riders) < ride.available_seats:
+            # Scored before the latest accept/remove; matched requests are hidden
+            matches = [
+                match for match in self.partial_matches.get(ride.id, [])
+                if not match['request'].matched_ride
+            ]
+        else:
+            matches = []
             
-        if self.current_ride.driver.name in self.matrix:
-            for match in self.matrix[self.current_ride.driver.name]:
-                request = match['request']
-                item = QListWidgetItem(f"""
-                    {request.rider.name}
-                    Von: {request.start_point}
-                    Bewertung: {match['score']:.2f}
-                    Umweg: {match['details']['detour_time']:.1f} min
-                """)
-                item.setData(Qt.UserRole, request)
-                self.matches_list.addItem(item)
+        for match in matches:
+            request = match['request']
+            item = QListWidgetItem(f"""
+                {request.rider.name}
+                Von: {request.start_point}
+                Bewertung: {match['score']:.2f}
+                Umweg: {match['details']['detour_time']:.1f} min
+            """)
+            item.setData(Qt.UserRole, request)
+            self.matches_list.addItem(item)
 
     def update_ride_info(self):
         """
@@ -259,77 +416,66 @@ class CarpoolWindow(QMainWindow):
 
     def update_map(self):
         """
-        Update the map display with the current ride's route.
+        Update the map display with the current ride's route. Rides seen
+        in the same state are drawn from the map cache; otherwise the map is
+        built in the background and a newer request cancels an older one.
         """
+        if self.map_job:
+            self.map_job.cancel()
+            self.map_job = None
         if not self.current_ride:
-            self.map_view.setHtml(self.get_empty_map_html())
+            self.map_loading.hide()
+            self.run_map_script(clear_script(
+                "Keine Fahrt ausgewählt", "Bitte wählen Sie eine Fahrt aus der Liste"
+            ))
             return
-            
-        loading = LoadingWidget("Karte wird geladen...")
-        self.setCentralWidget(loading)
-        
-        try:
-            avg_lat = (self.current_ride.start_coords.lat + self.current_ride.end_coords.lat) / 2
-            avg_lng = (self.current_ride.start_coords.lng + self.current_ride.end_coords.lng) / 2
-            m = folium.Map(location=[avg_lat, avg_lng], zoom_start=12)
 
-            line_color = '#1f77b4' if self.current_ride.trip_type == TripType.OUTBOUND else '#ff7f0e'
-            
-            if self.current_ride.route_polyline:
-                AntPath(
-                    locations=self.current_ride.route_polyline,
-                    color=line_color,
-                    weight=5,
-                    dash_array='5,5' if self.current_ride.trip_type == TripType.RETURN else None,
-                    tooltip=f"{'Hinfahrt' if self.current_ride.trip_type == TripType.OUTBOUND else 'Rückfahrt'}"
-                ).add_to(m)
-
-            folium.Marker(
-                location=(self.current_ride.start_coords.lat, self.current_ride.start_coords.lng),
-                popup=f"Start: {self.current_ride.start_point}",
-                icon=folium.Icon(color='green', icon='home')
-            ).add_to(m)
-
-            folium.Marker(
-                location=(self.current_ride.end_coords.lat, self.current_ride.end_coords.lng),
-                popup=f"Ziel: {self.current_ride.end_point}",
-                icon=folium.Icon(color='red', icon='briefcase')
-            ).add_to(m)
-
-            for rider in self.current_ride.matched_riders:
-                folium.Marker(
-                    location=(rider.start_coords.lat, rider.start_coords.lng),
-                    popup=f"Mitfahrer: {rider.rider.name}",
-                    icon=folium.Icon(color='purple', icon='user')
-                ).add_to(m)
-
-            html_file = io.StringIO()
-            m.save(html_file, close_file=False)
-            self.map_view.setHtml(html_file.getvalue())
-            html_file.close()
-            
-        except Exception as e:
-            self.map_view.setHtml(f"""
-                <h3>Karte konnte nicht geladen werden</h3>
-                <p>Fehler: {str(e)}</p>
-            """)
-        finally:
-            self.setCentralWidget(self.centralWidget())
+        key = ride_state_key(self.current_ride)
+        script = self.map_cache.get(key)
+        if script:
+            self.map_loading.hide()
+            self.run_map_script(script)
+            return
 
-    def get_empty_map_html(self):
-        """
-        Return HTML for an empty map view.
+        job = MapJob(self.current_ride)
+        job.signals.finished.connect(lambda payload: self.on_map_finished(job, key, payload))
+        job.signals.failed.connect(lambda error: self.on_map_failed(job, error))
+        self.map_job = job
+        self.map_loading.show()
+        self.thread_pool.start(job)
+
+    def on_map_finished(self, job, key, payload):
+        if job is not self.map_job:
+            return
+        self.map_job = None
+        self.map_loading.hide()
+        script = update_script(payload)
+        # A fallback map is drawn again once routing works
+        if not job.fallback:
+            self.map_cache.put(key, script)
+        self.run_map_script(script)
+
+    def on_map_failed(self, job, error):
+        if job is not self.map_job:
+            return
+        self.map_job = None
+        self.map_loading.hide()
+        self.run_map_script(clear_script("Karte konnte nicht geladen werden", f"Fehler: {error}"))
+
+    def on_map_page_loaded(self, ok):
+        self.map_ready = ok
+        if ok and self.pending_map_script:
+            self.map_view.page().runJavaScript(self.pending_map_script)
+            self.pending_map_script = None
+
+    def run_map_script(self, script):
         """
-        return """
-        <html>
-            <body style="background: #f5f5f5; display: flex; justify-content: center; align-items: center; height: 100%;">
-                <div style="text-align: center; color: #666;">
-                    <h3>Keine Fahrt ausgewählt</h3>
-                    <p>Bitte wählen Sie eine Fahrt aus der Liste</p>
-                </div>
-            </body>
-        </html>
+        Run a map page call, or keep the latest one until the page is loaded.
         """
+        if self.map_ready:
+            self.map_view.page().runJavaScript(script)
+        else:
+            self.pending_map_script = script
 
     def apply_filters(self):
         """
@@ -374,6 +520,8 @@ class CarpoolWindow(QMainWindow):
             
         self.current_ride = selected[0].data(Qt.UserRole)
         self.current_request = None
+        if self.matching_job:
+            self.matching_job.prioritize(self.current_ride.id)
         self.update_ride_info()
         self.update_matches_list()
         self.update_map()
@@ -421,7 +569,6 @@ class CarpoolWindow(QMainWindow):
             return
             
         self.current_request.accept_match(self.current_ride)
-        self.update_matrix()
         self.update_ride_info()
         self.update_matches_list()
         self.update_map()
@@ -440,9 +587,53 @@ class CarpoolWindow(QMainWindow):
             return
             
         self.current_ride.remove_rider(self.current_request)
-        self.current_request.matched_ride = None
-        self.update_matrix()
         self.update_ride_info()
         self.update_matches_list()
         self.update_map()
-        QMessageBox.information(self, "Erfolg", f"{self.current_request.rider.name} wurde entfernt")
\ No newline at end of file
+        QMessageBox.information(self, "Erfolg", f"{self.current_request.rider.name} wurde entfernt")
+
+    def on_assign_all(self):
+        """
+        Assign all open requests to rides at once, respecting free seats.
+        The assignment is solved in the background.
+        """
+        if not self.match_index:
+            return
+        self.start_index_job(AssignJob(self.match_index, self.rides, self.ride_requests))
+
+    def apply_assignment(self, job, index, plan):
+        """
+        Commit a solved assignment; the resulting events are rescored in
+        one background update.
+        """
+        rides = {ride.id: ride for ride in self.rides}
+        assigned = 0
+        for ride_id, riders in plan.items():
+            ride = rides[ride_id]
+            # The plan was checked against these riders; rides changed by
+            # hand while solving are left as they are
+            if ride.matched_riders != job.riders[ride_id]:
+                continue
+            for request in riders:
+                if request.matched_ride:
+                    continue
+                request.accept_match(ride)
+                assigned += 1
+        self.take_index(index)
+        self.update_rides_list()
+        self.update_ride_info()
+        self.update_matches_list()
+        self.update_map()
+        self.update_button_states()
+        QMessageBox.information(self, "Erfolg", f"{assigned} Mitfahrer wurden zugeordnet")
+
+    def closeEvent(self, event):
+        """
+        Stop background jobs and detach from match events on close.
+        """
+        for job in (self.matching_job, self.index_job, self.map_job):
+            if job:
+                job.cancel()
+        remove_match_listener(self.on_match_changed)
+        remove_match_listener(self.map_cache.on_match_changed)
+        super().closeEvent(event)
\ No newline at end of file
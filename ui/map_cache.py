@@ -0,0 +1,100 @@
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from models.data_models import Ride, RideRequest
+from utils.polyline import Polyline, as_points
+from utils.metrics import metrics
+
+def polyline_version(polyline) -> int:
+    """
+    Checksum of a polyline's coordinates; changes whenever the route does.
+    """
+    if not polyline:
+        return 0
+    if isinstance(polyline, Polyline):
+        return zlib.crc32(polyline.encoded.encode('ascii'))
+    return zlib.crc32(np.ascontiguousarray(as_points(polyline)).tobytes())
+
+def ride_state_key(ride: Ride) -> Tuple:
+    """
+    Everything a ride's map depends on: identity, base route, the set of
+    accepted riders and the trip type.
+    """
+    return (
+        ride.id,
+        polyline_version(ride.route_polyline),
+        frozenset(request.id for request in ride.matched_riders),
+        ride.trip_type,
+    )
+
+class RenderCache:
+    """
+    LRU of rendered map output (page scripts or HTML) bounded by the total
+    size of the stored strings. Keys start with the ride id, so all
+    entries of a ride can be dropped when its riders change. Thread-safe.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: 'OrderedDict[Hashable, str]' = OrderedDict()
+        self._by_ride: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                metrics.count("map_cache.misses")
+                return None
+            self._entries.move_to_end(key)
+            metrics.count("map_cache.hits")
+            return value
+
+    def put(self, key: Tuple, value: str):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = value
+            self._by_ride.setdefault(key[0], set()).add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_ride(self, ride_id: str):
+        with self._lock:
+            for key in list(self._by_ride.get(ride_id, ())):
+                self._drop(key)
+
+    def on_match_changed(self, ride: Ride, request: RideRequest, matched: bool):
+        """
+        Listener for accept_match/remove_rider.
+        """
+        self.invalidate_ride(ride.id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_ride.clear()
+            self.size = 0
+
+    def _drop(self, key: Tuple):
+        self.size -= _size(self._entries.pop(key))
+        keys = self._by_ride[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._by_ride[key[0]]
+
+def _size(value: str) -> int:
+    # Page scripts are ASCII JSON apart from names; close enough as a bound
+    return len(value)
@@ -0,0 +1,196 @@
+import json
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from models.data_models import Ride, RideRequest, TripType
+from utils.polyline import as_points, encode, fit_zoom, meters_per_pixel, simplify
+
+# Decimal places sent to the page (~1 m)
+COORD_PRECISION = 5
+
+# Loaded once into the map view; rides are then drawn by carpool.update().
+# Same Leaflet, ant path and marker assets as the folium maps.
+MAP_PAGE_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css">
+<link rel="stylesheet" href="https://netdna.bootstrapcdn.com/bootstrap/3.0.0/css/bootstrap.min.css">
+<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/Leaflet.awesome-markers/2.0.2/leaflet.awesome-markers.css">
+<script src="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"></script>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/Leaflet.awesome-markers/2.0.2/leaflet.awesome-markers.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/leaflet-ant-path@1.1.2/dist/leaflet-ant-path.min.js"></script>
+<style>
+  html, body, #map { width: 100%; height: 100%; margin: 0; padding: 0; }
+  #message { position: absolute; inset: 0; z-index: 1000; display: flex; flex-direction: column;
+             justify-content: center; align-items: center; background: #f5f5f5; color: #666;
+             font-family: Arial; text-align: center; }
+  #message.hidden { display: none; }
+</style>
+</head>
+<body>
+<div id="map"></div>
+<div id="message"><h3></h3><p></p></div>
+<script>
+var map = L.map('map').setView([48.7758, 9.1829], 10);
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+  maxZoom: 19, attribution: '&copy; OpenStreetMap contributors'
+}).addTo(map);
+
+var state = {rideId: null, routeKey: null, route: null, markers: {}};
+
+function textNode(text) {
+  var div = document.createElement('div');
+  div.textContent = text;
+  return div;
+}
+
+// Google's encoded polyline format, 1e-5 degrees
+function decodePolyline(encoded) {
+  var coords = [], value = [0, 0], i = 0;
+  while (i < encoded.length) {
+    for (var k = 0; k < 2; k++) {
+      var result = 0, shift = 0, b;
+      do {
+        b = encoded.charCodeAt(i++) - 63;
+        result |= (b & 0x1f) << shift;
+        shift += 5;
+      } while (b >= 0x20);
+      value[k] += (result & 1) ? ~(result >> 1) : (result >> 1);
+    }
+    coords.push([value[0] / 1e5, value[1] / 1e5]);
+  }
+  return coords;
+}
+
+function makeRoute(spec) {
+  var options = {color: spec.color, weight: 5, opacity: 0.5, delay: 400, pulseColor: '#FFFFFF',
+                 dashArray: spec.dash || [10, 20]};
+  var coords = decodePolyline(spec.encoded);
+  var line = L.polyline.antPath ? L.polyline.antPath(coords, options) : L.polyline(coords, options);
+  return line.bindTooltip(spec.tooltip);
+}
+
+function makeMarker(spec) {
+  var options = {};
+  if (L.AwesomeMarkers) {
+    options.icon = L.AwesomeMarkers.icon({icon: spec.icon, markerColor: spec.color, prefix: 'glyphicon'});
+  }
+  return L.marker([spec.lat, spec.lng], options).bindPopup(textNode(spec.popup));
+}
+
+function removeAll() {
+  if (state.route) { map.removeLayer(state.route); }
+  Object.keys(state.markers).forEach(function (id) { map.removeLayer(state.markers[id].layer); });
+  state = {rideId: null, routeKey: null, route: null, markers: {}};
+}
+
+window.carpool = {
+  // Draw a ride, touching only the layers that differ from the last call
+  update: function (data) {
+    document.getElementById('message').className = 'hidden';
+    if (data.route_key !== state.routeKey) {
+      if (state.route) { map.removeLayer(state.route); }
+      state.route = data.route ? makeRoute(data.route).addTo(map) : null;
+      state.routeKey = data.route_key;
+    }
+    var seen = {};
+    data.markers.forEach(function (spec) {
+      var signature = JSON.stringify(spec);
+      var old = state.markers[spec.id];
+      seen[spec.id] = true;
+      if (old && old.signature === signature) { return; }
+      if (old) { map.removeLayer(old.layer); }
+      state.markers[spec.id] = {signature: signature, layer: makeMarker(spec).addTo(map)};
+    });
+    Object.keys(state.markers).forEach(function (id) {
+      if (!seen[id]) { map.removeLayer(state.markers[id].layer); delete state.markers[id]; }
+    });
+    if (data.ride_id !== state.rideId) {
+      state.rideId = data.ride_id;
+      map.fitBounds(data.bounds, {padding: [30, 30]});
+    }
+    return Object.keys(state.markers).length;
+  },
+  clear: function (title, text) {
+    removeAll();
+    var message = document.getElementById('message');
+    message.querySelector('h3').textContent = title;
+    message.querySelector('p').textContent = text;
+    message.className = '';
+  }
+};
+carpool.clear('Keine Fahrt ausgewählt', 'Bitte wählen Sie eine Fahrt aus der Liste');
+</script>
+</body>
+</html>
+"""
+
+def ride_payload(ride: Ride, route_polyline: Optional[Sequence[Tuple[float, float]]],
+                 riders: List[RideRequest]) -> Dict:
+    """
+    Compact JSON-ready description of a ride's map layers for
+    carpool.update(): the route, simplified for display and encoded, with
+    a content key, one marker per stop with a stable id, and the bounds to
+    fit when the ride changes.
+    """
+    points = as_points(route_polyline).astype(float, copy=False)
+    outbound = ride.trip_type == TripType.OUTBOUND
+    route = None
+    if len(points):
+        route = {
+            'encoded': encode(display_points(points)),
+            'color': '#1f77b4' if outbound else '#ff7f0e',
+            'dash': None if outbound else [5, 5],
+            'tooltip': 'Hinfahrt' if outbound else 'Rückfahrt',
+        }
+
+    markers = [
+        _marker(f"start:{ride.id}", ride.start_coords, f"Start: {ride.start_point}", 'green', 'home'),
+        _marker(f"end:{ride.id}", ride.end_coords, f"Ziel: {ride.end_point}", 'red', 'briefcase'),
+    ]
+    markers += [
+        _marker(f"rider:{rider.id}", rider.start_coords, f"Mitfahrer: {rider.rider.name}", 'purple', 'user')
+        for rider in riders
+    ]
+
+    lats = np.concatenate((np.round(points[:, 0], COORD_PRECISION), [marker['lat'] for marker in markers]))
+    lngs = np.concatenate((np.round(points[:, 1], COORD_PRECISION), [marker['lng'] for marker in markers]))
+    return {
+        'ride_id': ride.id,
+        'route_key': f"{ride.id}:{zlib.crc32(json.dumps(route).encode())}",
+        'route': route,
+        'markers': markers,
+        'bounds': [[float(lats.min()), float(lngs.min())], [float(lats.max()), float(lngs.max())]],
+    }
+
+def display_points(route_polyline) -> np.ndarray:
+    """
+    The route reduced to what the map can show: settings.MAP_SIMPLIFY_PX
+    of tolerance at settings.MAP_DETAIL_ZOOMS levels past the zoom that
+    fits the whole route into the map.
+    """
+    points = as_points(route_polyline)
+    if len(points) < 3:
+        return points
+    zoom = fit_zoom(points, settings.MAP_VIEWPORT_PX) + settings.MAP_DETAIL_ZOOMS
+    return simplify(points, settings.MAP_SIMPLIFY_PX * meters_per_pixel(zoom, float(points[:, 0].mean())))
+
+def update_script(payload: Dict) -> str:
+    return f"carpool.update({json.dumps(payload, separators=(',', ':'))});"
+
+def clear_script(title: str, text: str = "") -> str:
+    return f"carpool.clear({json.dumps(title)}, {json.dumps(text)});"
+
+def _marker(marker_id: str, coords, popup: str, color: str, icon: str) -> Dict:
+    return {
+        'id': marker_id,
+        'lat': round(coords.lat, COORD_PRECISION),
+        'lng': round(coords.lng, COORD_PRECISION),
+        'popup': popup,
+        'color': color,
+        'icon': icon,
+    }
@@ -0,0 +1,52 @@
+from typing import List, Optional, Sequence, Tuple
+
+import folium
+from folium.plugins import AntPath
+
+from models.data_models import Ride, RideRequest, TripType
+from ui.map_page import display_points
+from utils.metrics import metrics
+
+def render_ride_map(ride: Ride, route_polyline: Optional[Sequence[Tuple[float, float]]],
+                    riders: List[RideRequest]) -> str:
+    """
+    Build the folium map of a ride (route, start/end and rider pickup
+    markers) and return it as a standalone HTML page. Touches no Qt
+    objects, so it can run on a worker thread.
+    """
+    avg_lat = (ride.start_coords.lat + ride.end_coords.lat) / 2
+    avg_lng = (ride.start_coords.lng + ride.end_coords.lng) / 2
+    m = folium.Map(location=[avg_lat, avg_lng], zoom_start=12)
+
+    line_color = '#1f77b4' if ride.trip_type == TripType.OUTBOUND else '#ff7f0e'
+
+    if route_polyline:
+        AntPath(
+            locations=display_points(route_polyline).tolist(),
+            color=line_color,
+            weight=5,
+            dash_array='5,5' if ride.trip_type == TripType.RETURN else None,
+            tooltip=f"{'Hinfahrt' if ride.trip_type == TripType.OUTBOUND else 'Rückfahrt'}"
+        ).add_to(m)
+
+    folium.Marker(
+        location=(ride.start_coords.lat, ride.start_coords.lng),
+        popup=f"Start: {ride.start_point}",
+        icon=folium.Icon(color='green', icon='home')
+    ).add_to(m)
+
+    folium.Marker(
+        location=(ride.end_coords.lat, ride.end_coords.lng),
+        popup=f"Ziel: {ride.end_point}",
+        icon=folium.Icon(color='red', icon='briefcase')
+    ).add_to(m)
+
+    for rider in riders:
+        folium.Marker(
+            location=(rider.start_coords.lat, rider.start_coords.lng),
+            popup=f"Mitfahrer: {rider.rider.name}",
+            icon=folium.Icon(color='purple', icon='user')
+        ).add_to(m)
+
+    with metrics.span("folium_render"):
+        return m.get_root().render()
@@ -2,7 +2,8 @@ from PyQt5.QtWidgets import (
     QListWidget, QListWidgetItem, QLabel, 
     QProgressBar, QWidget, QVBoxLayout
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
+from utils.metrics import Metrics, status_line
 
 class RideListItem(QListWidgetItem):
     def __init__(self, text):
@@ -19,4 +20,28 @@ class LoadingWidget(QWidget):
         self.progress.setRange(0, 0)
         layout.addWidget(self.label)
         layout.addWidget(self.progress)
-        self.setLayout(layout)
\ No newline at end of file
+        self.setLayout(layout)
+
+    def set_progress(self, done, total):
+        """
+        Show determinate progress; total 0 keeps the busy indicator.
+        """
+        self.progress.setRange(0, total)
+        self.progress.setValue(done)
+
+class MetricsPanel(QLabel):
+    """
+    Status bar label showing the live metrics summary, refreshed on a timer.
+    """
+
+    def __init__(self, metrics: Metrics, interval_ms: int = 1000):
+        super().__init__()
+        self.metrics = metrics
+        self.setStyleSheet("color: #555; padding: 0 6px;")
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(interval_ms)
+        self.refresh()
+
+    def refresh(self):
+        self.setText(status_line(self.metrics.snapshot()))
@@ -0,0 +1,162 @@
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+from models.data_models import Ride, RideRequest
+from services.assignment import assign_all
+from services.match_index import MatchIndex
+from services.matching import calculate_assigned_route
+from ui.map_page import ride_payload
+from utils.metrics import metrics
+
+class JobSignals(QObject):
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+class Job(QRunnable):
+    """
+    Cancellable background job for QThreadPool. Subclasses implement
+    work(); partial and final results are delivered through signals, which
+    Qt queues onto the GUI thread. A cancelled job stops at its next check
+    and emits nothing further, so stale results never reach the window.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def emit_progress(self, value: Any):
+        self._emit('progress', value)
+
+    def run(self):
+        try:
+            result = self.work()
+        except Exception as e:
+            self._emit('failed', str(e))
+            return
+        self._emit('finished', result)
+
+    def _emit(self, signal: str, value: Any):
+        if self.is_cancelled():
+            return
+        try:
+            getattr(self.signals, signal).emit(value)
+        except RuntimeError:
+            # The signals object was deleted with the application
+            pass
+
+    def work(self) -> Any:
+        raise NotImplementedError
+
+class MatchingJob(Job):
+    """
+    Build a MatchIndex ride by ride, emitting (ride id, matches, rides done,
+    rides total) after each ride and the finished index at the end.
+    prioritize() moves a ride, e.g. the one just selected, to the front.
+    """
+
+    def __init__(self, rides: List[Ride], requests: List[RideRequest],
+                 max_workers: Optional[int] = None):
+        super().__init__()
+        self.rides = list(rides)
+        self.requests = list(requests)
+        self.max_workers = max_workers
+        self._queue = deque(ride.id for ride in self.rides)
+        self._lock = threading.Lock()
+
+    def prioritize(self, ride_id: str):
+        with self._lock:
+            if ride_id in self._queue:
+                self._queue.remove(ride_id)
+                self._queue.appendleft(ride_id)
+
+    def work(self) -> Optional[MatchIndex]:
+        with metrics.span("compute_matches"):
+            index = MatchIndex(self.rides, self.requests, self.max_workers, evaluate=False)
+            done = 0
+            while not self.is_cancelled():
+                with self._lock:
+                    if not self._queue:
+                        break
+                    ride = index.rides[self._queue.popleft()]
+                # Copied, since the index keeps growing on this thread
+                self.emit_progress((ride.id, list(index.evaluate_ride(ride)), done + 1, len(self.rides)))
+                done += 1
+        return index
+
+class MatchUpdateJob(Job):
+    """
+    Replay accept/remove events on a finished MatchIndex, rescoring the
+    rides involved, and emit the index. The window hands the index over
+    and does not touch it again until the job has finished.
+    """
+
+    def __init__(self, index: MatchIndex, changes: Sequence[Tuple[Ride, RideRequest, bool]]):
+        super().__init__()
+        self.index = index
+        self.changes = list(changes)
+
+    def work(self) -> Optional[MatchIndex]:
+        with metrics.span("update_matches"):
+            for change in self.changes:
+                if self.is_cancelled():
+                    return None
+                self.index.on_match_changed(*change)
+        return self.index
+
+class AssignJob(Job):
+    """
+    Solve the global assignment over a finished MatchIndex and emit
+    (index, plan) without committing anything; accept_match notifies the
+    listeners, so the window applies the plan on the GUI thread. Riders are
+    snapshotted when the job is created.
+    """
+
+    def __init__(self, index: MatchIndex, rides: List[Ride], requests: List[RideRequest]):
+        super().__init__()
+        self.index = index
+        self.rides = list(rides)
+        self.requests = list(requests)
+        self.riders = {ride.id: list(ride.matched_riders) for ride in self.rides}
+
+    def work(self) -> Tuple[MatchIndex, Dict[str, List[RideRequest]]]:
+        with metrics.span("assign_all"):
+            plan = assign_all(self.rides, self.requests, self.index.as_dict(), apply=False)
+        return self.index, plan
+
+class MapJob(Job):
+    """
+    Route a ride through its accepted riders and build its map layers for
+    the persistent map page. Riders are snapshotted when the job is created.
+    fallback is set when the route through the riders could not be
+    calculated and the ride's own route is drawn instead.
+    """
+
+    def __init__(self, ride: Ride):
+        super().__init__()
+        self.ride = ride
+        self.riders = list(ride.matched_riders)
+        self.fallback = False
+
+    def work(self) -> Optional[Dict]:
+        with metrics.span("update_map"):
+            polyline = self.ride.route_polyline
+            if self.riders:
+                assigned_route = calculate_assigned_route(self.ride, self.riders)
+                if assigned_route:
+                    polyline = assigned_route.polyline
+                else:
+                    self.fallback = True
+            if self.is_cancelled():
+                return None
+            return ride_payload(self.ride, polyline, self.riders)
@@ -1,15 +1,19 @@
 import math
 import random
 from datetime import datetime, timedelta
-from typing import Tuple
-from config import settings
+from typing import Optional, Tuple
+import numpy as np
+from config.settings import settings
 from models.data_models import Coordinates  # Import hinzugefügt
 
+EARTH_RADIUS_M = 6371000
+MATRIX_CHUNK_ELEMENTS = 1_000_000  # cells per block in the distance matrices
+
 def haversine_distance(coord1: Coordinates, coord2: Coordinates) -> float:
     """
     Calculate great-circle distance between two points in meters.
     """
-    R = 6371000  # Earth radius in meters
+    R = EARTH_RADIUS_M
     phi1 = math.radians(coord1.lat)
     phi2 = math.radians(coord2.lat)
     delta_phi = math.radians(coord2.lat - coord1.lat)
@@ -19,13 +23,80 @@ def haversine_distance(coord1: Coordinates, coord2: Coordinates) -> float:
          math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2)
     return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
-def generate_nearby_coords(base: Coordinates, max_dist_m: int) -> Coordinates:
+def haversine_pairwise(lats1, lngs1, lats2, lngs2) -> np.ndarray:
+    """
+    Element-wise great-circle distances in meters between two equally long
+    (or broadcastable) arrays of points in degrees.
+    """
+    phi1, lam1, phi2, lam2 = (np.radians(np.asarray(a, dtype=float))
+                              for a in (lats1, lngs1, lats2, lngs2))
+    return _haversine(phi1, lam1, np.cos(phi1), phi2, lam2, np.cos(phi2))
+
+def haversine_one_to_many(lat: float, lng: float, lats, lngs) -> np.ndarray:
+    """
+    Distances in meters from one point to every point of an array.
+    """
+    return haversine_pairwise(lat, lng, lats, lngs)
+
+def haversine_matrix(lats1, lngs1, lats2, lngs2,
+                     chunk_elements: Optional[int] = None) -> np.ndarray:
+    """
+    Full (len(lats1), len(lats2)) distance matrix in meters. Rows are
+    computed in blocks of about chunk_elements cells so temporaries stay
+    small next to the result.
+    """
+    phi1, lam1 = np.radians(np.asarray(lats1, dtype=float)), np.radians(np.asarray(lngs1, dtype=float))
+    phi2, lam2 = np.radians(np.asarray(lats2, dtype=float)), np.radians(np.asarray(lngs2, dtype=float))
+    cos1, cos2 = np.cos(phi1), np.cos(phi2)
+    result = np.empty((len(phi1), len(phi2)))
+    rows = max(1, (chunk_elements or MATRIX_CHUNK_ELEMENTS) // max(len(phi2), 1))
+    for lo in range(0, len(phi1), rows):
+        block = slice(lo, lo + rows)
+        result[block] = _haversine(phi1[block, None], lam1[block, None], cos1[block, None],
+                                   phi2[None, :], lam2[None, :], cos2[None, :])
+    return result
+
+def equirectangular_pairwise(lats1, lngs1, lats2, lngs2) -> np.ndarray:
+    """
+    Flat-earth approximation of haversine_pairwise, scaled by the cosine of
+    the mean latitude. Relative error stays below 0.1% for points less
+    than about 50 km apart outside the polar regions.
+    """
+    lats1, lngs1, lats2, lngs2 = (np.asarray(a, dtype=float) for a in (lats1, lngs1, lats2, lngs2))
+    x = np.radians(lngs2 - lngs1) * np.cos(np.radians((lats1 + lats2) / 2))
+    y = np.radians(lats2 - lats1)
+    return EARTH_RADIUS_M * np.hypot(x, y)
+
+def equirectangular_matrix(lats1, lngs1, lats2, lngs2,
+                           chunk_elements: Optional[int] = None) -> np.ndarray:
+    """
+    Full distance matrix with the equirectangular approximation, computed
+    in row blocks like haversine_matrix.
+    """
+    lats1, lngs1 = np.asarray(lats1, dtype=float), np.asarray(lngs1, dtype=float)
+    lats2, lngs2 = np.asarray(lats2, dtype=float), np.asarray(lngs2, dtype=float)
+    result = np.empty((len(lats1), len(lats2)))
+    rows = max(1, (chunk_elements or MATRIX_CHUNK_ELEMENTS) // max(len(lats2), 1))
+    for lo in range(0, len(lats1), rows):
+        block = slice(lo, lo + rows)
+        result[block] = equirectangular_pairwise(lats1[block, None], lngs1[block, None],
+                                                 lats2[None, :], lngs2[None, :])
+    return result
+
+def _haversine(phi1, lam1, cos1, phi2, lam2, cos2) -> np.ndarray:
+    a = np.sin((phi2 - phi1) / 2) ** 2 + cos1 * cos2 * np.sin((lam2 - lam1) / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def generate_nearby_coords(base: Coordinates, max_dist_m: int,
+                           rng: Optional[random.Random] = None) -> Coordinates:
     """
-    Generate random coordinates within max_dist_m meters of base.
+    Generate random coordinates within max_dist_m meters of base, drawn
+    from rng if given.
     """
+    rng = rng or random
     while True:
-        lat_offset = random.uniform(-max_dist_m / 111000, max_dist_m / 111000)
-        lng_offset = random.uniform(-max_dist_m / 75000, max_dist_m / 75000)
+        lat_offset = rng.uniform(-max_dist_m / 111000, max_dist_m / 111000)
+        lng_offset = rng.uniform(-max_dist_m / 75000, max_dist_m / 75000)
         new_coords = Coordinates(
             lat=base.lat + lat_offset,
             lng=base.lng + lng_offset
@@ -33,26 +104,29 @@ def generate_nearby_coords(base: Coordinates, max_dist_m: int) -> Coordinates:
         if haversine_distance(new_coords, base) <= max_dist_m:
             return new_coords
 
-def generate_residential_coords(area_name: str, area_coords: Tuple[float, float]) -> Tuple[str, Coordinates]:
+def generate_residential_coords(area_name: str, area_coords: Tuple[float, float],
+                                rng: Optional[random.Random] = None) -> Tuple[str, Coordinates]:
     """
     Generate random coordinates within a residential area's radius.
     """
     base = Coordinates(lat=area_coords[0], lng=area_coords[1])
-    coords = generate_nearby_coords(base, settings.RESIDENTIAL_AREA_RADIUS)
+    coords = generate_nearby_coords(base, settings.RESIDENTIAL_AREA_RADIUS, rng)
     return area_name, coords
 
-def generate_destination_coords(base_coords: Tuple[float, float]) -> Coordinates:
+def generate_destination_coords(base_coords: Tuple[float, float],
+                                rng: Optional[random.Random] = None) -> Coordinates:
     """
     Generate random coordinates within destination radius.
     """
-    base = Coordinates(dataclass=True, lat=base_coords[0], lng=base_coords[1])
-    return generate_nearby_coords(base, settings.DESTINATION_RADIUS)
+    base = Coordinates(lat=base_coords[0], lng=base_coords[1])
+    return generate_nearby_coords(base, settings.DESTINATION_RADIUS, rng)
 
-def get_future_departure_time(time_str: str) -> datetime:
+def get_future_departure_time(time_str: str, now: Optional[datetime] = None) -> datetime:
     """
-    Convert time string to future datetime with buffer.
+    Convert time string to future datetime with buffer, relative to now
+    (the current time by default).
     """
-    now = datetime.now()
+    now = now or datetime.now()
     departure = datetime.strptime(time_str, "%H:%M").replace(
         year=now.year, month=now.month, day=now.day
     )
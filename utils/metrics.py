@@ -0,0 +1,237 @@
+import atexit
+import bisect
+import json
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from config.settings import settings
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """
+    Latency distribution over fixed buckets, with count, sum and max.
+    """
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS_S):
+        self.bounds = bounds
+        # One count per bound plus the overflow bucket
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile; the observed
+        maximum for the overflow bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum_s': self.sum,
+            'max_s': self.max,
+            'p50_s': self.quantile(0.5),
+            'p95_s': self.quantile(0.95),
+            'buckets': dict(zip([*map(str, self.bounds), '+Inf'], self.buckets)),
+        }
+
+class _Span:
+    __slots__ = ('_metrics', '_name', '_started')
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._metrics.observe(self._name, time.perf_counter() - self._started)
+        if exc_type is not None:
+            self._metrics.count(f"errors.{self._name}")
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class Metrics:
+    """
+    Process-wide counters and latency histograms for the hot paths.
+    While disabled every call returns right after one attribute check,
+    so instrumentation can stay in place.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def span(self, name: str):
+        """
+        Context manager timing its block into the histogram name; an
+        exception leaving the block also counts errors.<name>.
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def timed(self, name: str) -> Callable:
+        """
+        Decorator form of span.
+        """
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {name: h.as_dict() for name, h in self.histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def dump_json(self, path: Path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def to_prometheus(self, prefix: str = "carpool") -> str:
+        """
+        Counters and histograms in the Prometheus text exposition format.
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = _metric_name(prefix, name) + "_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, histogram in sorted(self.histograms.items()):
+                metric = _metric_name(prefix, name) + "_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip([*map(str, histogram.bounds), '+Inf'], histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines += [f"{metric}_sum {histogram.sum}", f"{metric}_count {histogram.count}"]
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Serve to_prometheus() on http://host:port/metrics from a daemon thread.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+def _metric_name(prefix: str, name: str) -> str:
+    return f"{prefix}_" + "".join(c if c.isalnum() else "_" for c in name)
+
+metrics = Metrics(enabled=settings.METRICS_ENABLED)
+
+def status_line(snapshot: Dict) -> str:
+    """
+    One-line summary of a snapshot for the window's status bar.
+    """
+    counters, histograms = snapshot['counters'], snapshot['histograms']
+    parts = []
+    for name, label in (("compute_matches", "Matching"), ("calculate_detour", "Umweg"),
+                        ("matrix_detours", "Matrix"), ("update_map", "Karte")):
+        if name in histograms:
+            h = histograms[name]
+            parts.append(f"{label} {h['count']}× p95 {h['p95_s'] * 1000:.0f} ms")
+    api_calls = counters.get("api.directions", 0) + counters.get("api.distance_matrix", 0)
+    parts.append(f"API-Aufrufe {api_calls:.0f}")
+    hits, misses = counters.get("route_cache.hits", 0), counters.get("route_cache.misses", 0)
+    if hits + misses:
+        parts.append(f"Cache {100 * hits / (hits + misses):.0f} %")
+    if "pairs.pruned" in counters:
+        parts.append(f"Paare {counters.get('pairs.evaluated', 0):.0f} geprüft/{counters['pairs.pruned']:.0f} verworfen")
+    errors = sum(value for name, value in counters.items() if name.startswith("errors."))
+    parts.append(f"Fehler {errors:.0f}")
+    return " | ".join(parts)
+
+def start_exporters():
+    """
+    Register the JSON dump at exit and start the Prometheus endpoint, as
+    configured by settings.METRICS_DUMP_PATH and settings.METRICS_PORT.
+    """
+    if not metrics.enabled:
+        return
+    if settings.METRICS_DUMP_PATH:
+        atexit.register(metrics.dump_json, settings.METRICS_DUMP_PATH)
+    if settings.METRICS_PORT:
+        metrics.serve_prometheus(settings.METRICS_PORT)
@@ -0,0 +1,196 @@
+import math
+from typing import Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Google's encoded polyline format stores coordinates as 1e-5 degrees (~1 m)
+PRECISION = 5
+SCALE = 10 ** PRECISION
+
+# Web Mercator ground resolution at the equator and zoom 0, 256 px tiles
+EQUATOR_M_PER_PX = 156_543.034
+MAX_ZOOM = 18
+# Same mean radius as utils.helpers, which is not imported so that models
+# can use this module without loading the settings
+EARTH_RADIUS_M = 6371000
+
+LatLng = Tuple[float, float]
+
+def encode(points) -> str:
+    """
+    Encode (lat, lng) points in Google's polyline format.
+    """
+    coords = np.asarray(points, dtype=float).reshape(-1, 2)
+    if not len(coords):
+        return ""
+    ints = np.round(coords * SCALE).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Every value becomes 5-bit chunks, low bits first, 0x20 marking "more follows"
+    chunk_counts = np.ones(len(values), dtype=np.int64)
+    rest = values >> 5
+    while rest.any():
+        chunk_counts += rest > 0
+        rest >>= 5
+    owner = np.repeat(np.arange(len(values)), chunk_counts)
+    position = np.arange(len(owner)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+    chunks = (values[owner] >> (5 * position)) & 0x1f
+    chunks |= (position < chunk_counts[owner] - 1) << 5
+    return (chunks + 63).astype(np.uint8).tobytes().decode('ascii')
+
+def decode(encoded: str) -> np.ndarray:
+    """
+    Decode a Google encoded polyline into an (n, 2) array of lat/lng.
+    """
+    if not encoded:
+        return np.empty((0, 2))
+    chunks = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    last = chunks < 0x20
+    if not last[-1] or last.sum() % 2 or chunks.min() < 0:
+        raise ValueError("Malformed encoded polyline")
+    owner = np.concatenate(([0], np.cumsum(last)[:-1]))
+    first = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    shift = 5 * (np.arange(len(chunks)) - first[owner])
+    # Values stay below 2**35, exact in the float64 weights of bincount
+    values = np.bincount(owner, weights=(chunks & 0x1f) << shift).astype(np.int64)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / SCALE
+
+class Polyline:
+    """
+    Route geometry kept as a Google encoded polyline, a few bytes per
+    point instead of a tuple of two floats. Coordinates are only decoded
+    when asked for; iterating yields (lat, lng) tuples like a list would.
+    Polylines joined with concat are not even merged until first use.
+    """
+
+    __slots__ = ('_encoded', '_parts')
+
+    def __init__(self, encoded: str = ""):
+        self._encoded = encoded
+        self._parts: Optional[Tuple[str, ...]] = None
+
+    @classmethod
+    def from_points(cls, points) -> 'Polyline':
+        return cls(encode(points))
+
+    @classmethod
+    def concat(cls, parts: Sequence[str]) -> 'Polyline':
+        """
+        Join encoded polylines, e.g. the steps of a Directions response.
+        """
+        polyline = cls()
+        polyline._parts = tuple(parts)
+        return polyline
+
+    @classmethod
+    def coerce(cls, value: Union['Polyline', Sequence[LatLng], None]) -> 'Polyline':
+        """
+        The value itself if it already is compact geometry (a Polyline or a
+        geometry store reference), else encode its points.
+        """
+        if hasattr(value, 'points'):
+            return value
+        return cls.from_points(value if value is not None else [])
+
+    @property
+    def encoded(self) -> str:
+        if self._parts is not None:
+            decoded = [decode(part) for part in self._parts]
+            self._encoded = encode(np.concatenate(decoded)) if decoded else ""
+            self._parts = None
+        return self._encoded
+
+    def points(self) -> np.ndarray:
+        """
+        Full precision (n, 2) lat/lng array, decoded anew on every call.
+        """
+        if self._parts is not None:
+            return np.concatenate([decode(part) for part in self._parts]) if self._parts else np.empty((0, 2))
+        return decode(self._encoded)
+
+    def simplified(self, tolerance_m: float) -> np.ndarray:
+        return simplify(self.points(), tolerance_m)
+
+    def __len__(self) -> int:
+        # Each coordinate ends with a chunk below 0x20, i.e. a character below '_'
+        encoded = self.encoded
+        if not encoded:
+            return 0
+        return int(np.count_nonzero(np.frombuffer(encoded.encode('ascii'), dtype=np.uint8) < 95)) // 2
+
+    def __bool__(self) -> bool:
+        return bool(self._parts) if self._parts is not None else bool(self._encoded)
+
+    def __iter__(self) -> Iterator[LatLng]:
+        return iter(map(tuple, self.points().tolist()))
+
+    def __getitem__(self, index) -> LatLng:
+        return tuple(self.points()[index].tolist())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Polyline) and self.encoded == other.encoded
+
+    def __hash__(self) -> int:
+        return hash(self.encoded)
+
+    def __repr__(self) -> str:
+        return f"Polyline({self.encoded!r})"
+
+def as_points(polyline: Union[Polyline, Sequence[LatLng], None]) -> np.ndarray:
+    """
+    (n, 2) lat/lng array of a Polyline, a geometry store reference or a
+    sequence of (lat, lng) pairs.
+    """
+    if hasattr(polyline, 'points'):
+        return polyline.points()
+    return np.asarray(polyline if polyline is not None else [], dtype=float).reshape(-1, 2)
+
+def simplify(points: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Douglas-Peucker: drop points while the simplified line stays within
+    tolerance_m of every removed point. Endpoints are always kept.
+    """
+    if len(points) < 3 or tolerance_m <= 0:
+        return points
+    ref_lat = math.radians(float(points[:, 0].mean()))
+    scale = EARTH_RADIUS_M * math.pi / 180
+    xy = np.column_stack((points[:, 1] * scale * math.cos(ref_lat), points[:, 0] * scale))
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, vector = xy[first], xy[last] - xy[first]
+        rel = xy[first + 1:last] - start
+        t = np.clip(rel @ vector / max(vector @ vector, 1e-12), 0.0, 1.0)
+        gap = rel - t[:, None] * vector
+        dist_sq = (gap ** 2).sum(axis=1)
+        farthest = int(dist_sq.argmax())
+        if dist_sq[farthest] > tolerance_m ** 2:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack += [(first, split), (split, last)]
+    return points[keep]
+
+def meters_per_pixel(zoom: float, lat: float) -> float:
+    return EQUATOR_M_PER_PX * math.cos(math.radians(lat)) / 2 ** zoom
+
+def fit_zoom(points: np.ndarray, viewport_px: int) -> int:
+    """
+    Highest Web Mercator zoom at which the points' bounding box fits
+    into a square viewport of viewport_px, as Leaflet's fitBounds picks.
+    """
+    if len(points) < 2:
+        return MAX_ZOOM
+    x = (points[:, 1] + 180) / 360
+    sin_lat = np.sin(np.radians(points[:, 0]))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    extent = max(float(np.ptp(x)), float(np.ptp(y)))
+    if extent <= 0:
+        return MAX_ZOOM
+    return int(min(MAX_ZOOM, max(0, math.floor(math.log2(viewport_px / (256 * extent))))))
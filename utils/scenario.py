@@ -0,0 +1,192 @@
+import math
+import random
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config.settings import settings
+from models.data_models import User, Coordinates, Ride, RideRequest, TripType
+from services.geometry_store import store_route
+from services.routing import LatLng, RouteResult, RoutingBackend, TravelMatrix
+from utils.helpers import haversine_distance, haversine_matrix
+
+RESIDENTIAL_AREAS = [
+    ("Böblingen", (48.6833, 9.0167)),
+    ("Stuttgart West", (48.7500, 9.1500)),
+    ("Schwäbisch Gmünd", (48.8000, 9.8000)),
+    ("Ludwigsburg", (48.8973, 9.1922)),
+    ("Esslingen", (48.7400, 9.3000)),
+    ("Waiblingen", (48.8316, 9.3167)),
+    ("Sindelfingen", (48.7000, 9.0167)),
+    ("Leonberg", (48.8000, 9.0167)),
+    ("Fellbach", (48.8167, 9.2833)),
+    ("Backnang", (48.9472, 9.4306)),
+    ("Herrenberg", (48.5951, 8.8662)),
+    ("Pforzheim", (48.8913, 8.6989)),
+    ("Reutlingen", (48.4912, 9.2113)),
+    ("Tübingen", (48.5200, 9.0500)),
+    ("Aalen", (48.8378, 10.0933)),
+    ("Heidenheim", (48.6778, 10.1516)),
+    ("Göppingen", (48.7035, 9.6538)),
+    ("Nürtingen", (48.6257, 9.3420)),
+    ("Kirchheim unter Teck", (48.6468, 9.4538)),
+    ("Schorndorf", (48.8054, 9.5272))
+]
+
+WORKPLACES = [
+    ("Mercedes Werk Untertürkheim", (48.7833, 9.2250)),
+    ("Stihl Werk 2, Waiblingen", (48.8316, 9.3100))
+]
+
+FIRST_NAMES = [
+    "Mohamed", "Fatma", "Ali", "Mariem", "Ahmed", "Amina", "Mahmoud", "Houda", "Youssef", "Samira",
+    "Hassan", "Nadia", "Omar", "Leila", "Khalil", "Salwa", "Adel", "Amira", "Tarek", "Rania",
+    "Bassem", "Sana", "Wassim", "Yosra", "Nabil", "Hajer", "Karim", "Soumaya", "Fares", "Manel"
+]
+
+LAST_NAMES = [
+    "Ben Ammar", "Trabelsi", "Bouzid", "Chaabane", "Gharbi",
+    "Haddad", "Jlassi", "Karray", "Mansouri", "Nasri",
+    "Ouertani", "Saadi", "Zaoui", "Abid", "Cherif",
+    "Dridi", "Essid", "Fersi", "Ghanmi", "Hamdi",
+    "Khalifa", "Laroussi", "Maalej", "Najar", "Rebai",
+    "Sassi", "Tlili", "Zoghlami", "Baccar", "Dhieb"
+]
+
+# A fixed Monday, so generated scenarios do not depend on the current date
+SCENARIO_DATE = datetime(2024, 3, 4)
+
+@dataclass
+class Scenario:
+    users: List[User]
+    rides: List[Ride]
+    requests: List[RideRequest]
+
+def generate_scenario(users: int, seed: int = 0, driver_share: float = 0.5,
+                      date: datetime = SCENARIO_DATE) -> Scenario:
+    """
+    Reproducible Stuttgart commute scenario in the shape of main.py's:
+    drivers offer an outbound and a return ride, riders request both. All
+    randomness, including ids, comes from the seed. Rides have no base
+    route yet; see compute_base_routes.
+    """
+    rng = random.Random(seed)
+    people = []
+    rides = []
+    requests = []
+    drivers = round(users * driver_share)
+    for i in range(users):
+        is_driver = i < drivers
+        area_name, area_coords = rng.choice(RESIDENTIAL_AREAS)
+        workplace_name, workplace_coords = rng.choice(WORKPLACES)
+        user = User(
+            id=seeded_uuid(rng),
+            name=f"{FIRST_NAMES[rng.randrange(len(FIRST_NAMES))]} {LAST_NAMES[rng.randrange(len(LAST_NAMES))]}",
+            is_driver=is_driver,
+            is_rider=not is_driver,
+            residential_area=(area_name, area_coords)
+        )
+        people.append(user)
+        home = _nearby(rng, area_coords, settings.RESIDENTIAL_AREA_RADIUS)
+        work = _nearby(rng, workplace_coords, settings.DESTINATION_RADIUS)
+
+        if is_driver:
+            max_detour = rng.randint(15, 30)
+            seats = rng.randint(2, 4)
+            for trip_type, start, end, depart in (
+                (TripType.OUTBOUND, (area_name, home), (workplace_name, work), date.replace(hour=7, minute=30)),
+                (TripType.RETURN, (workplace_name, work), (area_name, home), date.replace(hour=16, minute=30)),
+            ):
+                rides.append(Ride(
+                    driver=user, start_point=start[0], end_point=end[0],
+                    start_coords=start[1], end_coords=end[1], departure_time=depart,
+                    max_detour_min=max_detour, available_seats=seats, trip_type=trip_type,
+                    id=seeded_uuid(rng)
+                ))
+        else:
+            for trip_type, start, end, hour in (
+                (TripType.OUTBOUND, (area_name, home), (workplace_name, work), 8),
+                (TripType.RETURN, (workplace_name, work), (area_name, home), 17),
+            ):
+                arrival = date.replace(hour=hour) + timedelta(minutes=rng.randint(0, 120))
+                request = user.request_ride(
+                    start_point=start[0], end_point=end[0],
+                    start_coords=start[1], end_coords=end[1],
+                    desired_arrival_time=arrival,
+                    time_flexibility_min=rng.randint(30, 60),
+                    trip_type=trip_type
+                )
+                request.id = seeded_uuid(rng)
+                requests.append(request)
+    return Scenario(users=people, rides=rides, requests=requests)
+
+def compute_base_routes(rides: Sequence[Ride], backend: RoutingBackend):
+    """
+    Fill route_distance (km), route_duration (min) and route_polyline
+    from the backend, as main.py does with calculate_route.
+    """
+    for ride in rides:
+        route = backend.route((ride.start_coords.lat, ride.start_coords.lng),
+                              (ride.end_coords.lat, ride.end_coords.lng), ride.departure_time)
+        if route:
+            ride.route_distance = route.distance_m / 1000
+            ride.route_duration = route.duration_s / 60
+            ride.route_polyline = store_route(route.polyline)
+
+class SyntheticRoutingBackend(RoutingBackend):
+    """
+    Deterministic offline backend for benchmarks: straight lines stretched
+    by a road factor and driven at a constant speed. Counts every call and
+    matrix element so routing load can be reported.
+    """
+
+    def __init__(self, road_factor: float = 1.3, speed_kmh: float = 50):
+        self.road_factor = road_factor
+        self.speed_ms = speed_kmh / 3.6
+        self.calls: Dict[str, int] = {'route': 0, 'detour': 0, 'travel_times': 0, 'matrix_elements': 0}
+        self._lock = threading.Lock()
+
+    def route(self, origin: LatLng, destination: LatLng,
+              departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        self._count('route')
+        return self._path([origin, destination])
+
+    def detour(self, origin: LatLng, destination: LatLng, waypoints: Sequence[LatLng],
+               departure_time: Optional[datetime] = None) -> Optional[RouteResult]:
+        self._count('detour')
+        return self._path([origin, *waypoints, destination])
+
+    def travel_times(self, origins: Sequence[LatLng], destinations: Sequence[LatLng],
+                     departure_time: Optional[datetime] = None) -> TravelMatrix:
+        self._count('travel_times', len(origins) * len(destinations))
+        distances = self.road_factor * haversine_matrix(
+            [o[0] for o in origins], [o[1] for o in origins],
+            [d[0] for d in destinations], [d[1] for d in destinations]
+        )
+        return TravelMatrix(durations_s=(distances / self.speed_ms).tolist(),
+                            distances_m=distances.tolist())
+
+    def _path(self, stops: List[LatLng]) -> RouteResult:
+        meters = sum(self._meters(a, b) for a, b in zip(stops, stops[1:]))
+        return RouteResult(distance_m=meters, duration_s=meters / self.speed_ms, polyline=list(stops))
+
+    def _meters(self, a: LatLng, b: LatLng) -> float:
+        return self.road_factor * haversine_distance(Coordinates(*a), Coordinates(*b))
+
+    def _count(self, name: str, elements: int = 0):
+        with self._lock:
+            self.calls[name] += 1
+            self.calls['matrix_elements'] += elements
+
+def seeded_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def _nearby(rng: random.Random, base: Tuple[float, float], max_dist_m: float) -> Coordinates:
+    # Uniform over the disc, like generate_nearby_coords but seeded
+    distance = max_dist_m * math.sqrt(rng.random())
+    bearing = rng.uniform(0, 2 * math.pi)
+    lat = base[0] + distance * math.cos(bearing) / 111_195
+    lng = base[1] + distance * math.sin(bearing) / (111_195 * math.cos(math.radians(base[0])))
+    return Coordinates(lat=lat, lng=lng)
@@ -0,0 +1,196 @@
+import math
+from typing import Dict, Generic, Hashable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+from models.data_models import Coordinates
+from utils.helpers import EARTH_RADIUS_M, haversine_one_to_many
+
+K = TypeVar('K', bound=Hashable)
+
+METERS_PER_DEG_LAT = math.pi * EARTH_RADIUS_M / 180
+MAX_SEARCH_RADIUS_M = math.pi * EARTH_RADIUS_M
+
+Cell = Tuple[int, int]
+
+class GridIndex(Generic[K]):
+    """
+    Uniform lat/lng grid over points, queried with haversine distances.
+
+    Rows are cell_size_m high; each row's cells are widened by the cosine of
+    its poleward edge so cells stay roughly cell_size_m square. A radius
+    query visits only the cells its bounding box touches, so its cost
+    follows the number of nearby points rather than the index size. Points
+    are stored under a caller-chosen key (e.g. a request id) and can be
+    inserted, moved and removed at any time. Longitude wrap-around at the
+    antimeridian is not handled.
+    """
+
+    def __init__(self, cell_size_m: float = 1000):
+        self.cell_size_m = cell_size_m
+        self._dlat = cell_size_m / METERS_PER_DEG_LAT
+        self._cells: Dict[Cell, Dict[K, Coordinates]] = {}
+        self._points: Dict[K, Tuple[Cell, Coordinates]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._points
+
+    def insert(self, key: K, coords: Coordinates):
+        """
+        Add a point, or move it if the key is already indexed.
+        """
+        self.remove(key)
+        cell = self._cell(coords)
+        self._cells.setdefault(cell, {})[key] = coords
+        self._points[key] = (cell, coords)
+
+    def remove(self, key: K) -> bool:
+        """
+        Drop a point; returns False if the key was not indexed.
+        """
+        entry = self._points.pop(key, None)
+        if entry is None:
+            return False
+        cell, _ = entry
+        bucket = self._cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self._cells[cell]
+        return True
+
+    def within(self, center: Coordinates, radius_m: float) -> List[Tuple[float, K]]:
+        """
+        Return (distance in meters, key) for every point within radius_m,
+        nearest first.
+        """
+        candidates = list(self._candidates(center, radius_m))
+        if not candidates:
+            return []
+        distances = haversine_one_to_many(center.lat, center.lng,
+                                          [coords.lat for _, coords in candidates],
+                                          [coords.lng for _, coords in candidates])
+        hits = [
+            (float(distance), key)
+            for (key, _), distance in zip(candidates, distances)
+            if distance <= radius_m
+        ]
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+    def nearest(self, center: Coordinates, k: int,
+                max_radius_m: Optional[float] = None) -> List[Tuple[float, K]]:
+        """
+        Return the k nearest points as (distance in meters, key), nearest
+        first, optionally limited to max_radius_m. The search radius doubles
+        from one cell until it holds k points.
+        """
+        if k <= 0 or not self._points:
+            return []
+        limit = min(max_radius_m or MAX_SEARCH_RADIUS_M, MAX_SEARCH_RADIUS_M)
+        radius = min(self.cell_size_m, limit)
+        while True:
+            hits = self.within(center, radius)
+            # Every point closer than radius is in hits, so the k best are exact
+            if len(hits) >= k or radius >= limit or len(hits) == len(self._points):
+                return hits[:k]
+            radius = min(radius * 2, limit)
+
+    def _cell(self, coords: Coordinates) -> Cell:
+        row = math.floor(coords.lat / self._dlat)
+        return row, math.floor(coords.lng / _row_width(row, self._dlat))
+
+    def _candidates(self, center: Coordinates, radius_m: float) -> Iterator[Tuple[K, Coordinates]]:
+        box = _radius_box(center, radius_m)
+        ranges = []
+        cell_count = 0
+        for row, col_lo, col_hi in _cell_ranges(*box, self._dlat):
+            ranges.append((row, col_lo, col_hi))
+            cell_count += col_hi - col_lo + 1
+            if cell_count > len(self._cells):
+                break
+
+        if cell_count > len(self._cells):
+            # Large radius: cheaper to walk the occupied cells
+            row_lo, row_hi = math.floor(box[0] / self._dlat), math.floor(box[1] / self._dlat)
+            for (row, col), bucket in self._cells.items():
+                if row_lo <= row <= row_hi:
+                    yield from bucket.items()
+            return
+
+        for row, col_lo, col_hi in ranges:
+            for col in range(col_lo, col_hi + 1):
+                bucket = self._cells.get((row, col))
+                if bucket:
+                    yield from bucket.items()
+
+class BoxIndex(Generic[K]):
+    """
+    Grid of lat/lng bounding boxes, e.g. chunks of a route polyline. Each
+    box is registered in every cell it overlaps and a key may own many
+    boxes. near() returns the keys with a box in a cell within the radius
+    of a point, a superset that callers refine with exact distances.
+    """
+
+    def __init__(self, cell_size_m: float = 1000):
+        self.cell_size_m = cell_size_m
+        self._dlat = cell_size_m / METERS_PER_DEG_LAT
+        self._cells: Dict[Cell, Set[K]] = {}
+        self._keys: Dict[K, Set[Cell]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._keys
+
+    def insert(self, key: K, lat_lo: float, lat_hi: float, lng_lo: float, lng_hi: float):
+        """
+        Add a box for a key; earlier boxes of the key are kept.
+        """
+        cells = self._keys.setdefault(key, set())
+        for row, col_lo, col_hi in _cell_ranges(lat_lo, lat_hi, lng_lo, lng_hi, self._dlat):
+            for col in range(col_lo, col_hi + 1):
+                self._cells.setdefault((row, col), set()).add(key)
+                cells.add((row, col))
+
+    def remove(self, key: K) -> bool:
+        """
+        Drop every box of a key; returns False if the key was not indexed.
+        """
+        cells = self._keys.pop(key, None)
+        if cells is None:
+            return False
+        for cell in cells:
+            bucket = self._cells[cell]
+            bucket.discard(key)
+            if not bucket:
+                del self._cells[cell]
+        return True
+
+    def near(self, center: Coordinates, radius_m: float) -> Set[K]:
+        """
+        Keys with a box in any cell within radius_m of center.
+        """
+        found = set()
+        for row, col_lo, col_hi in _cell_ranges(*_radius_box(center, radius_m), self._dlat):
+            for col in range(col_lo, col_hi + 1):
+                found |= self._cells.get((row, col), set())
+        return found
+
+def _row_width(row: int, dlat: float) -> float:
+    poleward = max(abs(row * dlat), abs((row + 1) * dlat))
+    return dlat / max(math.cos(math.radians(min(poleward, 90))), 0.01)
+
+def _radius_box(center: Coordinates, radius_m: float) -> Tuple[float, float, float, float]:
+    dlat = radius_m / METERS_PER_DEG_LAT
+    poleward = min(abs(center.lat) + dlat, 90)
+    # 1% margin over the small-angle bound of a spherical cap's width
+    dlng = 1.01 * dlat / max(math.cos(math.radians(poleward)), 1e-6)
+    return center.lat - dlat, center.lat + dlat, center.lng - dlng, center.lng + dlng
+
+def _cell_ranges(lat_lo: float, lat_hi: float, lng_lo: float, lng_hi: float,
+                 dlat: float) -> Iterator[Tuple[int, int, int]]:
+    for row in range(math.floor(lat_lo / dlat), math.floor(lat_hi / dlat) + 1):
+        width = _row_width(row, dlat)
+        yield row, math.floor(lng_lo / width), math.floor(lng_hi / width)
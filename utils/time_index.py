@@ -0,0 +1,80 @@
+from bisect import bisect_left, bisect_right
+from itertools import count
+from typing import Any, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+class IntervalIndex(Generic[T]):
+    """
+    Sorted index of [start, end] intervals answering overlap queries by
+    bisect. Intervals are ordered by start; the longest interval bounds how
+    far left of a query a still-overlapping interval can begin, so a query
+    only scans starts in [lo - max_length, hi].
+
+    Works with any ordered keys supporting subtraction, e.g. datetimes or
+    floats. An end of None marks an open-ended interval; those are kept
+    aside so they do not widen every scan.
+    """
+
+    def __init__(self):
+        self._starts: List[Tuple[Any, int]] = []
+        self._entries: List[Tuple[Any, T]] = []
+        self._max_length: Optional[Any] = None
+        self._open: List[Tuple[Any, int, T]] = []
+        self._seq = count()
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._open)
+
+    def insert(self, start, end, item: T):
+        """
+        Add an interval; insertion order breaks ties between equal starts.
+        """
+        key = (start, next(self._seq))
+        if end is None:
+            self._open.append((*key, item))
+            return
+        pos = bisect_right(self._starts, key)
+        self._starts.insert(pos, key)
+        self._entries.insert(pos, (end, item))
+        length = end - start
+        if self._max_length is None or length > self._max_length:
+            self._max_length = length
+
+    def remove(self, start, item: T) -> bool:
+        """
+        Remove an interval by its start and item identity.
+        """
+        for i, (open_start, _, open_item) in enumerate(self._open):
+            if open_start == start and open_item is item:
+                del self._open[i]
+                return True
+        pos = bisect_left(self._starts, (start, -1))
+        while pos < len(self._starts) and self._starts[pos][0] == start:
+            if self._entries[pos][1] is item:
+                del self._starts[pos]
+                del self._entries[pos]
+                return True
+            pos += 1
+        return False
+
+    def overlapping(self, lo, hi) -> List[T]:
+        """
+        Return items whose interval intersects [lo, hi], ordered by start.
+        hi may be None for an open-ended query.
+        """
+        found = []
+        if self._entries:
+            first = bisect_left(self._starts, (lo - self._max_length, -1))
+            last = len(self._starts) if hi is None else bisect_right(self._starts, (hi, float('inf')))
+            found = [
+                (self._starts[i], self._entries[i][1])
+                for i in range(first, last) if self._entries[i][0] >= lo
+            ]
+        if self._open:
+            found += [
+                ((start, seq), item) for start, seq, item in self._open
+                if hi is None or start <= hi
+            ]
+            found.sort(key=lambda entry: entry[0])
+        return [item for _, item in found]